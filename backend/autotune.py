@@ -0,0 +1,198 @@
+"""
+CPU inference autotuner
+
+Sweeps intra-op threads, concurrent batch workers (the threads of the model's
+executor in server.py, each running whole forward passes) and batch sizes for
+every model registered in server.py on the current host, then writes a serving
+profile that server.py loads at startup. torch's inter-op pool only runs forked
+TorchScript work, which the eager models do not use, so it is left at torch's
+default and not recorded.
+
+Every (intra_op, workers) configuration runs in a fresh process, so the thread
+pools of one configuration do not carry over to the next.
+
+Usage (from the backend directory):
+    python autotune.py --max-latency-ms 200
+    python autotune.py --random-weights   # architecture only, no checkpoints needed
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import torch
+
+import constants as cst
+
+DEFAULT_BATCH_SIZES = [1, 2, 4, 8, 16, 32, 64, 128]
+
+
+def build_models(random_weights):
+    """Registered models by name, either the served checkpoints or freshly initialised weights"""
+    import server
+    if not random_weights:
+        server.load_models()
+        return {name: model for name, model in server.get_models().items() if model is not None}
+
+    from models.engine import Engine
+    models = {}
+    for name, meta in server.MODEL_METADATA.items():
+        models[name] = Engine(
+            seq_size=meta['sequence_size'],
+            horizon=10,
+            max_epochs=1,
+            model_type=name.upper(),
+            is_wandb=False,
+            experiment_type='EVALUATION',
+            lr=0.0001,
+            optimizer='Adam',
+            dir_ckpt='inference',
+            hidden_dim=meta['hidden_dim'],
+            num_layers=meta['num_layers'],
+            num_features=meta['features'],
+            dataset_type='FI_2010',
+            num_heads=meta.get('num_heads', 1),
+            is_sin_emb=True,
+            len_test_dataloader=1
+        ).eval()
+    return models
+
+
+def measure_config(intra_op, workers, batch_sizes, min_time, random_weights):
+    """
+    Runs in a fresh process: throughput and batch latency of every model and batch
+    size with `workers` batches in flight, each using `intra_op` threads
+    """
+    torch.set_num_threads(intra_op)
+    models = build_models(random_weights)
+    results = {}
+    for name, model in models.items():
+        seq_size, num_features = model.seq_size, model.num_features
+        results[name] = []
+        for batch_size in batch_sizes:
+            batch = torch.randn(batch_size, seq_size, num_features, device=cst.DEVICE)
+
+            def forward():
+                start = time.perf_counter()
+                with torch.no_grad():
+                    model(batch)
+                return time.perf_counter() - start
+
+            forward()  # warm-up
+            latencies = []
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                while time.perf_counter() - start < min_time:
+                    latencies.extend(pool.map(lambda _: forward(), range(workers)))
+            elapsed = time.perf_counter() - start
+            latencies = np.asarray(latencies) * 1000
+            results[name].append({
+                "batch_size": batch_size,
+                "sequences_per_s": len(latencies) * batch_size / elapsed,
+                "p50_ms": float(np.percentile(latencies, 50)),
+                "p95_ms": float(np.percentile(latencies, 95)),
+            })
+            print(f"intra={intra_op} workers={workers} {name} batch={batch_size}: "
+                  f"{results[name][-1]['sequences_per_s']:.1f} seq/s, p95 {results[name][-1]['p95_ms']:.1f} ms")
+    return {"intra_op": intra_op, "workers": workers, "models": results}
+
+
+def thread_configs(num_cores):
+    """(intra_op, workers) pairs that do not oversubscribe the cores"""
+    candidates = sorted({1, 2, 4, 8, 16, 32, num_cores})
+    return [(intra, workers) for intra in candidates for workers in candidates
+            if intra * workers <= num_cores]
+
+
+def best_entry(entries, max_latency_ms):
+    """Highest-throughput batch size whose p95 batch latency fits the budget"""
+    within = [e for e in entries if e["p95_ms"] <= max_latency_ms] or entries[:1]
+    return max(within, key=lambda e: e["sequences_per_s"])
+
+
+def build_profile(sweep, max_latency_ms, bucket_tolerance):
+    """
+    Pick one process-wide intra-op thread count (torch.set_num_threads is global),
+    then per model the number of concurrent batch workers and the batch buckets
+    """
+    model_names = list(sweep[0]["models"])
+    best_per_model = {name: max(best_entry(c["models"][name], max_latency_ms)["sequences_per_s"] for c in sweep)
+                      for name in model_names}
+
+    def score(intra_op):
+        # geometric mean of each model's best throughput relative to its overall best
+        ratios = [max(best_entry(c["models"][name], max_latency_ms)["sequences_per_s"]
+                      for c in sweep if c["intra_op"] == intra_op) / best_per_model[name]
+                  for name in model_names]
+        return float(np.exp(np.mean(np.log(ratios))))
+
+    intra_op = max({c["intra_op"] for c in sweep}, key=score)
+    models = {}
+    for name in model_names:
+        configs = [c for c in sweep if c["intra_op"] == intra_op]
+        chosen = max(configs, key=lambda c: best_entry(c["models"][name], max_latency_ms)["sequences_per_s"])
+        entries = chosen["models"][name]
+        best = best_entry(entries, max_latency_ms)
+        # Buckets: batch sizes up to the best one that keep most of its throughput,
+        # so remainders are not run as many tiny batches
+        buckets = [e["batch_size"] for e in entries
+                   if e["batch_size"] <= best["batch_size"]
+                   and e["sequences_per_s"] >= bucket_tolerance * best["sequences_per_s"]]
+        models[name] = {
+            "workers": chosen["workers"],
+            "batch_buckets": sorted(set(buckets) | {best["batch_size"]}),
+            "max_batch_size": best["batch_size"],
+            "sequences_per_s": best["sequences_per_s"],
+            "p95_ms": best["p95_ms"],
+        }
+    return {
+        "threads": {"intra_op": intra_op},
+        "models": models,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Autotune CPU inference threads and batch buckets")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=DEFAULT_BATCH_SIZES)
+    parser.add_argument("--max-threads", type=int, default=os.cpu_count(), help="cores available to the server")
+    parser.add_argument("--min-time", type=float, default=1.0, help="seconds measured per batch size")
+    parser.add_argument("--max-latency-ms", type=float, default=250.0, help="p95 latency budget per batch")
+    parser.add_argument("--bucket-tolerance", type=float, default=0.5,
+                        help="smaller batch sizes are kept as buckets if they reach this fraction of the best throughput")
+    parser.add_argument("--random-weights", action="store_true", help="tune freshly initialised models instead of the checkpoints")
+    parser.add_argument("--output", default=os.path.join(cst.DATA_DIR, "serving_profile.json"))
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    sweep = []
+    ctx = multiprocessing.get_context("spawn")
+    for intra_op, workers in thread_configs(args.max_threads):
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            sweep.append(pool.submit(measure_config, intra_op, workers, args.batch_sizes,
+                                     args.min_time, args.random_weights).result())
+
+    profile = build_profile(sweep, args.max_latency_ms, args.bucket_tolerance)
+    profile.update({
+        "created": datetime.now().isoformat(),
+        "host": {"cpu_count": os.cpu_count(), "device": str(cst.DEVICE), "torch": torch.__version__},
+        "max_latency_ms": args.max_latency_ms,
+        "sweep": sweep,
+    })
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(profile, f, indent=2)
+    print(f"Threads: {profile['threads']}")
+    for name, model_profile in profile["models"].items():
+        print(f"{name}: workers={model_profile['workers']} buckets={model_profile['batch_buckets']} "
+              f"({model_profile['sequences_per_s']:.1f} seq/s)")
+    print(f"Serving profile saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
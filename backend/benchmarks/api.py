@@ -0,0 +1,255 @@
+"""
+Load-test the prediction API and report latency percentiles per endpoint
+
+Drives the FastAPI app in process (ASGI transport) and/or over loopback HTTP
+with synthetic order book payloads, in closed-loop (fixed concurrency) and
+open-loop (fixed arrival rate) modes. Results are saved as JSON so runs can
+be compared over time.
+
+Run from the backend directory:
+    python -m benchmarks.api --transport both --mode both --snapshots 400 --symbols 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import threading
+import time
+from datetime import datetime
+
+import httpx
+import numpy as np
+
+import constants as cst
+
+ENDPOINTS = {
+    "health": ("GET", "/api/health"),
+    "predict-json": ("POST", "/api/predict-json"),
+}
+RESULTS_DIR = os.path.join(cst.DATA_DIR, "benchmarks")
+
+
+def make_payloads(num_snapshots, num_symbols, num_distinct, seed=42):
+    """
+    Synthetic pre-shaped /api/predict-json payloads
+    Each symbol follows its own random walk; num_distinct payloads are generated
+    per symbol so identical requests are not coalesced by the server.
+    """
+    rng = np.random.default_rng(seed)
+    payloads = []
+    for s in range(num_symbols):
+        symbol = f"SYM{s}USDT"
+        for d in range(num_distinct):
+            mid = 100.0 * (s + 1) + np.cumsum(rng.normal(0, 0.05, num_snapshots))
+            ticks = np.arange(1, cst.N_LOB_LEVELS + 1) * 0.01
+            bids = np.empty((num_snapshots, cst.N_LOB_LEVELS, 2))
+            asks = np.empty((num_snapshots, cst.N_LOB_LEVELS, 2))
+            bids[:, :, 0] = mid[:, None] - ticks
+            asks[:, :, 0] = mid[:, None] + ticks
+            bids[:, :, 1] = rng.exponential(1.0, (num_snapshots, cst.N_LOB_LEVELS))
+            asks[:, :, 1] = rng.exponential(1.0, (num_snapshots, cst.N_LOB_LEVELS))
+            start = 1_700_000_000_000 + d * num_snapshots * 100
+            payloads.append({
+                "symbol": symbol,
+                "timestamps": list(range(start, start + num_snapshots * 100, 100)),
+                "bids": bids.round(2).tolist(),
+                "asks": asks.round(4).tolist(),
+            })
+    return payloads
+
+
+def summarize(latencies, errors, elapsed):
+    """Latency percentiles in milliseconds and throughput for one run"""
+    lat = np.asarray(latencies) * 1000
+    summary = {
+        "requests": int(len(lat) + errors),
+        "errors": int(errors),
+        "elapsed_s": elapsed,
+        "requests_per_s": len(lat) / elapsed if elapsed > 0 else 0.0,
+    }
+    if len(lat):
+        summary.update({
+            "mean_ms": float(lat.mean()),
+            "p50_ms": float(np.percentile(lat, 50)),
+            "p95_ms": float(np.percentile(lat, 95)),
+            "p99_ms": float(np.percentile(lat, 99)),
+            "max_ms": float(lat.max()),
+        })
+    return summary
+
+
+async def send(client, endpoint, payload):
+    method, path = ENDPOINTS[endpoint]
+    if method == "GET":
+        response = await client.get(path)
+    else:
+        response = await client.post(path, json=payload)
+    return response.status_code == 200
+
+
+async def closed_loop(client, endpoint, payloads, concurrency, duration):
+    """concurrency workers each send the next request as soon as the previous one returns"""
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+    counter = iter(range(10 ** 12))
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            payload = payloads[next(counter) % len(payloads)]
+            start = time.perf_counter()
+            ok = await send(client, endpoint, payload)
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+async def open_loop(client, endpoint, payloads, rate, duration):
+    """
+    Requests are issued on a fixed schedule regardless of completions.
+    Latency is measured from the scheduled send time, so queueing delay caused
+    by a saturated server is not hidden (no coordinated omission).
+    """
+    latencies, errors = [], 0
+    num_requests = max(1, int(rate * duration))
+    start = time.perf_counter()
+
+    async def fire(i):
+        nonlocal errors
+        scheduled = start + i / rate
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        ok = await send(client, endpoint, payloads[i % len(payloads)])
+        if ok:
+            latencies.append(time.perf_counter() - scheduled)
+        else:
+            errors += 1
+
+    await asyncio.gather(*[fire(i) for i in range(num_requests)])
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_loopback_server(app):
+    """Serve app with uvicorn on a background thread, returns (base_url, server)"""
+    import uvicorn
+    port = free_port()
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="off")
+    server = uvicorn.Server(config)
+    server.install_signal_handlers = lambda: None
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}", server
+
+
+def host_info():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        commit = None
+    return {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "device": str(cst.DEVICE),
+        "git_commit": commit,
+    }
+
+
+async def run_benchmark(args, app):
+    payloads = make_payloads(args.snapshots, args.symbols, args.distinct)
+    transports = ["asgi", "http"] if args.transport == "both" else [args.transport]
+    modes = ["closed", "open"] if args.mode == "both" else [args.mode]
+    results = []
+    loopback = None
+    for transport in transports:
+        if transport == "asgi":
+            client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=None)
+        else:
+            if loopback is None:
+                loopback = start_loopback_server(app)
+            limits = httpx.Limits(max_connections=max(args.concurrency, 100))
+            client = httpx.AsyncClient(base_url=loopback[0], timeout=None, limits=limits)
+        async with client:
+            for endpoint in args.endpoints:
+                # Warm up so model/kernel initialisation does not land in the percentiles
+                for payload in payloads[:args.warmup]:
+                    await send(client, endpoint, payload)
+                for mode in modes:
+                    if mode == "closed":
+                        summary = await closed_loop(client, endpoint, payloads, args.concurrency, args.duration)
+                    else:
+                        summary = await open_loop(client, endpoint, payloads, args.rate, args.duration)
+                    summary.update({"transport": transport, "endpoint": endpoint, "mode": mode})
+                    results.append(summary)
+                    print_row(summary)
+    if loopback is not None:
+        loopback[1].should_exit = True
+    return results
+
+
+def print_row(summary):
+    print(f"{summary['transport']:>5} {summary['endpoint']:>13} {summary['mode']:>6} "
+          f"req={summary['requests']:>6} err={summary['errors']:>4} rps={summary['requests_per_s']:>8.1f} "
+          f"p50={summary.get('p50_ms', float('nan')):>8.2f}ms p95={summary.get('p95_ms', float('nan')):>8.2f}ms "
+          f"p99={summary.get('p99_ms', float('nan')):>8.2f}ms")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Latency/throughput benchmark for the prediction API")
+    parser.add_argument("--transport", choices=["asgi", "http", "both"], default="asgi")
+    parser.add_argument("--mode", choices=["closed", "open", "both"], default="both")
+    parser.add_argument("--endpoints", nargs="+", choices=list(ENDPOINTS), default=list(ENDPOINTS))
+    parser.add_argument("--snapshots", type=int, default=400, help="order book snapshots per request")
+    parser.add_argument("--symbols", type=int, default=1, help="number of synthetic symbols")
+    parser.add_argument("--distinct", type=int, default=8, help="distinct payloads per symbol")
+    parser.add_argument("--concurrency", type=int, default=4, help="closed-loop workers")
+    parser.add_argument("--rate", type=float, default=10.0, help="open-loop requests per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per run")
+    parser.add_argument("--warmup", type=int, default=2, help="warm-up requests per endpoint")
+    parser.add_argument("--no-load-models", action="store_true", help="skip load_models(), e.g. to only benchmark health")
+    parser.add_argument("--serving-profile", default=None,
+                        help="serving profile applied before timing, as the server does at startup (default: its SERVING_PROFILE)")
+    parser.add_argument("--no-serving-profile", action="store_true", help="time with torch's default threads and no batch buckets")
+    parser.add_argument("--output", default=None, help="JSON results path (default: data/benchmarks/api_<timestamp>.json)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    import server
+    if not args.no_serving_profile:
+        server.load_serving_profile(args.serving_profile or server.SERVING_PROFILE_PATH)
+    if not args.no_load_models:
+        server.load_models()
+    results = asyncio.run(run_benchmark(args, server.app))
+
+    output = args.output or os.path.join(RESULTS_DIR, f"api_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "timestamp": datetime.now().isoformat(),
+            "host": host_info(),
+            "config": vars(args),
+            # the profile the results were timed with, without the autotuner's sweep
+            "serving_profile": {key: value for key, value in server.serving_profile.items() if key != "sweep"},
+            "results": results,
+        }, f, indent=2)
+    print(f"Results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Time LOBSTER dataset builds with the per-day preprocessing cache (preprocessing/day_cache.py)
+
+Writes synthetic LOBSTER days (benchmarks/lobster.py) and times a build without
+the caches, a first build filling them, a build with nothing changed, a build
+after one more day is added (all the files are written again, so only their
+contents keep the other days cached) and a build with another split. Each build
+with the caches is checked against a build of the same days and split without them.
+
+Run from the backend directory:
+    python -m benchmarks.day_cache --messages 200000 --days 10
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.lobster import same_sets, write_days
+
+
+BUILD = """
+import sys, time
+import constants
+from preprocessing.lobster import LOBSTERDataBuilder
+data_dir, stock, date_from, date_to, split, cache = sys.argv[1:7]
+builder = LOBSTERDataBuilder([stock], data_dir, [date_from, date_to], [float(rate) for rate in split.split(",")],
+                             "none", None, None, workers=1, ingest_cache=cache == "1", day_cache=cache == "1")
+start = time.perf_counter()
+builder.prepare_save_datasets()
+print("BUILD", time.perf_counter() - start)
+"""
+
+
+def build(data_dir, stock, dates, split, cache):
+    """(seconds, days preprocessed from the raw files) of one build in a fresh process"""
+    output = subprocess.run([sys.executable, "-c", BUILD, data_dir, stock, *dates, ",".join(map(str, split)), str(int(cache))],
+                            check=True, capture_output=True, text=True).stdout
+    lines = output.splitlines()
+    elapsed = float(next(line for line in lines if line.startswith("BUILD")).split()[1])
+    # the raw files of every preprocessed day are printed
+    return elapsed, sum(line.endswith("_orderbook_10.csv") for line in lines)
+
+
+def keep(data_dir, stock, reference_dir):
+    os.makedirs(reference_dir, exist_ok=True)
+    for split in ("train", "val", "test"):
+        os.replace(os.path.join(data_dir, stock, f"{split}.npy"), os.path.join(reference_dir, f"{split}.npy"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time LOBSTER dataset builds with the per-day preprocessing cache")
+    parser.add_argument("--messages", type=int, default=200_000, help="messages of every synthetic day")
+    parser.add_argument("--days", type=int, default=10, help="synthetic days of the first builds")
+    args = parser.parse_args()
+    split = [0.6, 0.2, 0.2]
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        reference_dir = os.path.join(data_dir, "reference")
+        steps = [("first build", args.days, split), ("nothing changed", args.days, split),
+                 ("one day added", args.days + 1, split), ("another split", args.days + 1, [0.5, 0.25, 0.25])]
+        written = 0
+        for name, num_days, step_split in steps:
+            if num_days != written:
+                dates = write_days(data_dir, "SYN", num_days, args.messages)
+                written = num_days
+            uncached_s, _ = build(data_dir, "SYN", dates, step_split, cache=False)
+            keep(data_dir, "SYN", reference_dir)
+            cached_s, preprocessed = build(data_dir, "SYN", dates, step_split, cache=True)
+            assert same_sets(data_dir, "SYN", reference_dir), "builds differ"
+            print(f"{name} ({num_days} days, split {step_split}): {uncached_s:.2f}s without the caches, "
+                  f"{cached_s:.2f}s with them ({uncached_s / cached_s:.1f}x), {preprocessed} day(s) preprocessed")
+
+
+if __name__ == "__main__":
+    main()
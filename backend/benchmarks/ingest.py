@@ -0,0 +1,84 @@
+"""
+Time the raw file ingestion of the dataset builders (preprocessing/ingest.py)
+
+Writes synthetic LOBSTER message/orderbook days and a BTC day file, then reads
+them with the builders' former pd.read_csv calls, with ingest.py parsing the
+text (first build, writing the Parquet cache) and with ingest.py reading the
+cache (later builds), asserting that ingest.py gives the DataFrames pd.read_csv
+parses with exact float rounding.
+
+Run from the backend directory (pyarrow is needed for the typed reader and the cache):
+    python -m benchmarks.ingest --messages 1000000 --days 3
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.lobster import write_days
+from preprocessing import ingest
+from preprocessing.lobster import COLUMNS_NAMES
+
+
+def write_btc_day(path, num_rows, seed=0):
+    """Synthetic day file as BTCDataBuilder splits the Kaggle dataset into"""
+    rng = np.random.default_rng(seed)
+    mid = 20_000 + np.cumsum(rng.normal(0, 0.5, num_rows))
+    columns = {"timestamp": pd.date_range("2023-01-09", periods=num_rows, freq="100ms").astype(str)}
+    for level in range(1, ingest.BTC_PRICE_LEVELS + 1):
+        columns[f"sell{level}"] = np.round(mid + 0.1 * level, 1)
+        columns[f"vsell{level}"] = np.round(rng.exponential(1.0, num_rows), 3)
+        columns[f"buy{level}"] = np.round(mid - 0.1 * level, 1)
+        columns[f"vbuy{level}"] = np.round(rng.exponential(1.0, num_rows), 3)
+    pd.DataFrame(columns).to_csv(path, header=False, index=False)
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the raw file ingestion of the dataset builders")
+    parser.add_argument("--messages", type=int, default=1_000_000, help="messages of every synthetic LOBSTER day")
+    parser.add_argument("--days", type=int, default=3, help="synthetic LOBSTER days")
+    args = parser.parse_args()
+    if ingest.pa is None:
+        print("pyarrow is not installed, ingest.py falls back to the typed pandas parser without cache")
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        write_days(data_dir, "SYN", args.days, args.messages)
+        raw_dir = os.path.join(data_dir, "SYN", os.listdir(os.path.join(data_dir, "SYN"))[0])
+        btc_dir = os.path.join(data_dir, "BTC", "BTC_days")
+        os.makedirs(btc_dir)
+        write_btc_day(os.path.join(btc_dir, "BTC_2023-01-09_orderbook_10.csv"), args.messages)
+        files = [(os.path.join(raw_dir, f), COLUMNS_NAMES["message" if "message" in f else "orderbook"],
+                  ingest.read_lobster_messages if "message" in f else ingest.read_lobster_orderbook)
+                 for f in sorted(os.listdir(raw_dir))]
+        files.append((os.path.join(btc_dir, "BTC_2023-01-09_orderbook_10.csv"), list(ingest.BTC_ORDERBOOK_DTYPES),
+                      ingest.read_btc_day))
+
+        totals = {"pd.read_csv": 0.0, "ingest, parsing": 0.0, "ingest, cached": 0.0}
+        size = 0
+        for path, names, read in files:
+            size += os.path.getsize(path)
+            _, elapsed = timed(pd.read_csv, path, names=names)
+            totals["pd.read_csv"] += elapsed
+            # the default float parser can be off in the last digit, pyarrow rounds correctly
+            expected = pd.read_csv(path, names=names, float_precision="round_trip")
+            for step in ("ingest, parsing", "ingest, cached"):
+                df, elapsed = timed(read, path)
+                totals[step] += elapsed
+                pd.testing.assert_frame_equal(df, expected, check_exact=True)
+
+    print(f"{len(files)} files, {size / 2**20:,.0f} MB of CSV")
+    for step, elapsed in totals.items():
+        print(f"{step:>16}: {elapsed:.2f}s ({size / 2**20 / elapsed:,.0f} MB/s, {totals['pd.read_csv'] / elapsed:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
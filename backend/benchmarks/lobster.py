@@ -0,0 +1,191 @@
+"""
+Check and time the vectorized LOBSTER preprocessing steps against the loops they replaced
+
+Generates synthetic LOBSTER days (message and orderbook files as LOBSTER ships
+them: integer prices in 1/10000 $, ask/bid levels interleaved), asserts that the
+order depths and signed directions of preprocessing/lobster.py are identical to
+the per-row loops, and times both plus a full _preprocess_message_orderbook.
+With --days it also writes that many days as LOBSTER CSV files and times whole
+dataset builds (prepare_save_datasets) with each --workers count, in memory
+and/or streaming (--builds), checking that they all save the same arrays.
+
+Run from the backend directory:
+    python -m benchmarks.lobster --messages 500000
+    python -m benchmarks.lobster --messages 200000 --days 20 --workers 1 4 8
+    python -m benchmarks.lobster --messages 200000 --days 20 --workers 4 --builds memory streaming
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import constants as cst
+from preprocessing.lobster import COLUMNS_NAMES, LOBSTERDataBuilder, order_depths, signed_directions
+
+
+def make_day(num_messages, num_levels=cst.N_LOB_LEVELS, seed=0):
+    """Synthetic (messages, orderbook) DataFrames of one trading day with the raw LOBSTER columns"""
+    rng = np.random.default_rng(seed)
+    time_ = 34200 + np.sort(rng.uniform(0, 23400, num_messages))
+    # Best ask in ticks of 100, the spread is 1 to 3 ticks
+    best_ask = 2_000_000 + 100 * np.cumsum(rng.integers(-1, 2, num_messages))
+    best_bid = best_ask - 100 * rng.integers(1, 4, num_messages)
+    levels = 100 * np.arange(num_levels)
+    orderbook = np.empty((num_messages, num_levels * cst.LEN_LEVEL), dtype=np.int64)
+    orderbook[:, 0::4] = best_ask[:, None] + levels
+    orderbook[:, 1::4] = rng.integers(1, 1000, (num_messages, num_levels))
+    orderbook[:, 2::4] = best_bid[:, None] - levels
+    orderbook[:, 3::4] = rng.integers(1, 1000, (num_messages, num_levels))
+    direction = rng.choice([-1, 1], num_messages)
+    # Orders inside the book or a few ticks away from it, on their own side
+    offset = 100 * rng.integers(-2, 15, num_messages)
+    price = np.where(direction == 1, best_bid - offset, best_ask + offset)
+    messages = pd.DataFrame({
+        "time": time_,
+        "event_type": rng.choice([1, 2, 3, 4, 5], num_messages, p=[0.45, 0.05, 0.4, 0.08, 0.02]),
+        "order_id": rng.integers(1, 10**9, num_messages),
+        "size": rng.integers(1, 500, num_messages),
+        "price": price,
+        "direction": direction,
+    }, columns=COLUMNS_NAMES["message"])
+    return messages, pd.DataFrame(orderbook, columns=COLUMNS_NAMES["orderbook"])
+
+
+def write_days(data_dir, stock, num_days, num_messages, dates=("2015-01-02", "2015-01-30")):
+    """Synthetic LOBSTER files of num_days days under data_dir the way the builders expect them"""
+    path = os.path.join(data_dir, stock, f"{stock}_{dates[0]}_{dates[1]}")
+    os.makedirs(path, exist_ok=True)
+    for day in range(num_days):
+        messages, orderbook = make_day(num_messages, seed=day)
+        name = f"{stock}_2015-01-{day + 1:02d}_34200000_57600000"
+        messages.to_csv(os.path.join(path, f"{name}_message_10.csv"), header=False, index=False)
+        orderbook.to_csv(os.path.join(path, f"{name}_orderbook_10.csv"), header=False, index=False)
+    return list(dates)
+
+
+BUILD = """
+import sys, time
+import constants
+from preprocessing.lobster import LOBSTERDataBuilder
+from utils.utils_data import peak_memory_mb
+data_dir, stock, date_from, date_to, workers, streaming = sys.argv[1:7]
+# without the caches, so every build preprocesses the raw files
+builder = LOBSTERDataBuilder([stock], data_dir, [date_from, date_to], [0.6, 0.2, 0.2], "none", None, None,
+                             workers=int(workers), streaming=streaming == "streaming", ingest_cache=False, day_cache=False)
+start = time.perf_counter()
+builder.prepare_save_datasets()
+print("BUILD", time.perf_counter() - start, *peak_memory_mb())
+"""
+
+
+def build(data_dir, stock, dates, workers, mode):
+    """(seconds, peak MB of the builder, peak MB of its largest worker) of one build in a fresh process"""
+    output = subprocess.run([sys.executable, "-c", BUILD, data_dir, stock, *dates, str(workers), mode],
+                            check=True, capture_output=True, text=True).stdout
+    line = next(line for line in output.splitlines() if line.startswith("BUILD"))
+    return tuple(float(value) for value in line.split()[1:])
+
+
+def same_sets(data_dir, stock, reference_dir, chunk_rows=1_000_000):
+    """
+    True if the saved sets equal those in reference_dir, up to the last bits the streaming statistics
+    (merged day by day) differ in; compared chunk by chunk so the sets are never loaded whole
+    """
+    for split in ("train", "val", "test"):
+        a = np.load(os.path.join(data_dir, stock, f"{split}.npy"), mmap_mode="r")
+        b = np.load(os.path.join(reference_dir, f"{split}.npy"), mmap_mode="r")
+        if a.shape != b.shape:
+            return False
+        for start in range(0, a.shape[0], chunk_rows):
+            if not np.allclose(a[start:start + chunk_rows], b[start:start + chunk_rows], rtol=0, atol=1e-9, equal_nan=True):
+                return False
+    return True
+
+
+def loop_depths(prices, directions, event_types, bid_sides, ask_sides):
+    """The per-row loop order_depths replaced"""
+    depths = np.zeros(len(prices), dtype=int)
+    for j in range(1, len(prices)):
+        order_price = prices[j]
+        direction = directions[j]
+        event_type = event_types[j]
+        index = j if event_type == 1 else j - 1
+        if direction == 1:
+            bid_price = bid_sides[index, 0]
+            depth = (bid_price - order_price) // 100
+        else:
+            ask_price = ask_sides[index, 0]
+            depth = (order_price - ask_price) // 100
+        depths[j] = max(depth, 0)
+    return depths
+
+
+def loop_directions(messages):
+    """The per-row apply signed_directions replaced"""
+    return messages["direction"] * messages["event_type"].apply(lambda x: -1 if x == 4 else 1)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and time the vectorized LOBSTER preprocessing")
+    parser.add_argument("--messages", type=int, default=500_000, help="messages of the synthetic day")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--days", type=int, default=0, help="synthetic days of a full dataset build, 0 skips it")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count()], help="worker processes of the builds")
+    parser.add_argument("--builds", nargs="+", choices=["memory", "streaming"], default=["memory"],
+                        help="in-memory and/or streaming (out of core) builds")
+    args = parser.parse_args()
+
+    messages, orderbook = make_day(args.messages, seed=args.seed)
+    # float prices as well, the time sampling leaves NaN-free float columns behind
+    for dtype in (np.int64, np.float64):
+        prices = messages["price"].values.astype(dtype)
+        bid_sides = orderbook.iloc[:, 2::4].values.astype(dtype)
+        ask_sides = orderbook.iloc[:, 0::4].values.astype(dtype)
+        args_ = (prices, messages["direction"].values, messages["event_type"].values)
+        expected, loop_s = timed(loop_depths, *args_, bid_sides, ask_sides)
+        depths, vector_s = timed(order_depths, *args_, bid_sides[:, 0], ask_sides[:, 0])
+        assert depths.dtype == expected.dtype and np.array_equal(depths, expected), "order depths differ"
+        print(f"depth, {np.dtype(dtype).name} prices: loop {loop_s:.3f}s, vectorized {vector_s:.4f}s "
+              f"({loop_s / vector_s:,.0f}x)")
+
+    expected, loop_s = timed(loop_directions, messages)
+    directions, vector_s = timed(signed_directions, messages["direction"].values, messages["event_type"].values)
+    assert directions.dtype == expected.dtype and np.array_equal(directions, expected.values), "directions differ"
+    print(f"direction: apply {loop_s:.3f}s, vectorized {vector_s:.4f}s ({loop_s / vector_s:,.0f}x)")
+
+    builder = LOBSTERDataBuilder(["SYN"], None, None, None, "none", None, None)
+    _, elapsed = timed(builder._preprocess_message_orderbook, [messages.copy(), orderbook.copy()], cst.N_LOB_LEVELS, "none")
+    print(f"_preprocess_message_orderbook: {elapsed:.3f}s for {args.messages:,} messages "
+          f"({args.messages / elapsed:,.0f} messages/s)")
+
+    if args.days:
+        with tempfile.TemporaryDirectory() as data_dir:
+            dates = write_days(data_dir, "SYN", args.days, args.messages)
+            reference_dir = os.path.join(data_dir, "reference")
+            for mode in args.builds:
+                for workers in args.workers:
+                    elapsed, own_mb, children_mb = build(data_dir, "SYN", dates, workers, mode)
+                    if not os.path.isdir(reference_dir):
+                        # the first build is the reference of the others
+                        os.makedirs(reference_dir)
+                        for split in ("train", "val", "test"):
+                            os.replace(os.path.join(data_dir, "SYN", f"{split}.npy"), os.path.join(reference_dir, f"{split}.npy"))
+                    else:
+                        assert same_sets(data_dir, "SYN", reference_dir), "builds differ"
+                    print(f"{mode} build of {args.days} days with {workers} worker(s): {elapsed:.2f}s, "
+                          f"peak memory {own_mb:.0f} MB (builder) / {children_mb:.0f} MB (largest worker)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Check and time the vectorized sparse (tick grid) orderbook representation
+
+Builds the orderbooks of a synthetic LOBSTER day (benchmarks/lobster.py), asserts
+that utils_data.to_sparse_representation places every volume where a per-row,
+per-level loop does, with the raw integer prices and with the prices in dollars
+the builders use, and reports both in millions of rows per second.
+
+Run from the backend directory:
+    python -m benchmarks.sparse --rows 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+
+import constants as cst
+from benchmarks.lobster import make_day
+from utils.utils_data import to_sparse_representation
+
+
+def loop_sparse(orderbook, tick_size, n_ticks):
+    """The per-row, per-level loop to_sparse_representation replaces"""
+    sparse_lob = np.zeros((orderbook.shape[0], 2 * n_ticks))
+    for row in range(orderbook.shape[0]):
+        mid_price = (orderbook[row, 0] + orderbook[row, 2]) / 2
+        for level in range(orderbook.shape[1] // cst.LEN_LEVEL):
+            ask, ask_size, bid, bid_size = orderbook[row, level * cst.LEN_LEVEL:(level + 1) * cst.LEN_LEVEL]
+            for offset, size, side in ((round((ask - mid_price) / tick_size * 2) // 2, ask_size, 0),
+                                       (round((mid_price - bid) / tick_size * 2) // 2, bid_size, 1)):
+                if 0 <= offset < n_ticks:
+                    sparse_lob[row, 2 * offset + side] = size
+    return sparse_lob
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and time the vectorized sparse orderbook representation")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="orderbook rows of the synthetic day")
+    parser.add_argument("--loop-rows", type=int, default=20_000, help="rows checked against and timed with the loop")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    n_ticks = cst.N_LOB_LEVELS * cst.LEN_LEVEL // 2
+
+    _, orderbook = make_day(args.rows, seed=args.seed)
+    orderbook = orderbook.values
+    dollars = orderbook.astype(np.float64)
+    dollars[:, ::2] /= 10000
+    for name, book, tick_size in (("int64 prices", orderbook, 100), ("dollar prices", dollars, cst.LOBSTER_TICK_SIZE)):
+        expected, loop_s = timed(loop_sparse, book[:args.loop_rows], tick_size, n_ticks)
+        sparse_lob, _ = timed(to_sparse_representation, book[:args.loop_rows], tick_size)
+        assert np.array_equal(sparse_lob, expected), "sparse representations differ"
+        sparse_lob, vector_s = timed(to_sparse_representation, book, tick_size)
+        assert np.array_equal(sparse_lob[:args.loop_rows], expected)
+        # every volume of the levels inside the grid is placed, once
+        assert np.count_nonzero(sparse_lob) > 0
+        print(f"{name}: loop {args.loop_rows / loop_s / 1e6:.3f} Mrows/s, "
+              f"vectorized {args.rows / vector_s / 1e6:.2f} Mrows/s "
+              f"({loop_s / args.loop_rows / (vector_s / args.rows):,.0f}x), "
+              f"{np.count_nonzero(sparse_lob) / sparse_lob.size:.0%} of the grid filled")
+
+
+if __name__ == "__main__":
+    main()
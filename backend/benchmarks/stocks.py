@@ -0,0 +1,77 @@
+"""
+Time LOBSTER dataset builds of several stocks, one after another and in parallel
+
+Writes synthetic LOBSTER days (benchmarks/lobster.py) for --stocks stocks, the
+first with twice the messages of the others so it is the slowest, builds them
+all with one worker and with one process per stock (within --budget-mb MB each,
+by default the physical memory split among them), checks that both save the
+same sets and reports the time of every stock and of the whole build.
+
+Run from the backend directory:
+    python -m benchmarks.stocks --stocks 4 --days 5 --messages 100000
+"""
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.lobster import same_sets, write_days
+
+
+BUILD = """
+import sys, time
+import constants
+from preprocessing.lobster import LOBSTERDataBuilder
+data_dir, date_from, date_to, workers, budget, *stocks = sys.argv[1:]
+# without the caches, so every build preprocesses the raw files
+builder = LOBSTERDataBuilder(stocks, data_dir, [date_from, date_to], [0.6, 0.2, 0.2], "none", None, None,
+                             workers=int(workers), memory_budget_mb=float(budget) if budget else None,
+                             ingest_cache=False, day_cache=False)
+start = time.perf_counter()
+builder.prepare_save_datasets()
+print("BUILD", time.perf_counter() - start)
+"""
+
+
+def build(data_dir, stocks, dates, workers, budget_mb):
+    """(seconds of the whole build, {stock: seconds}) of one build in a fresh process"""
+    output = subprocess.run([sys.executable, "-c", BUILD, data_dir, *dates, str(workers),
+                             "" if budget_mb is None else str(budget_mb), *stocks],
+                            check=True, capture_output=True, text=True).stdout
+    elapsed = float(next(line for line in output.splitlines() if line.startswith("BUILD")).split()[1])
+    return elapsed, {stock: float(seconds) for stock, seconds in re.findall(r"^Built (\S+) in ([\d.]+)s", output, re.M)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time LOBSTER dataset builds of several stocks")
+    parser.add_argument("--stocks", type=int, default=4, help="synthetic stocks")
+    parser.add_argument("--days", type=int, default=5, help="synthetic days of every stock")
+    parser.add_argument("--messages", type=int, default=100_000, help="messages of every day of the stocks but the first")
+    parser.add_argument("--budget-mb", type=float, default=None, help="memory of every stock built in parallel")
+    args = parser.parse_args()
+    stocks = [f"SYN{i}" for i in range(args.stocks)]
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        for i, stock in enumerate(stocks):
+            dates = write_days(data_dir, stock, args.days, args.messages * (2 if i == 0 else 1))
+        serial_s, serial = build(data_dir, stocks, dates, 1, None)
+        for stock in stocks:
+            reference_dir = os.path.join(data_dir, "reference", stock)
+            os.makedirs(reference_dir)
+            for split in ("train", "val", "test"):
+                shutil.move(os.path.join(data_dir, stock, f"{split}.npy"), reference_dir)
+        parallel_s, parallel = build(data_dir, stocks, dates, len(stocks), args.budget_mb)
+        for stock in stocks:
+            assert same_sets(data_dir, stock, os.path.join(data_dir, "reference", stock)), f"builds of {stock} differ"
+
+    for stock in stocks:
+        print(f"{stock}: {serial[stock]:.2f}s one after another, {parallel[stock]:.2f}s in parallel")
+    print(f"{len(stocks)} stocks on {os.cpu_count()} CPU(s): {serial_s:.2f}s one after another, {parallel_s:.2f}s in parallel "
+          f"({serial_s / parallel_s:.1f}x), the slowest stock took {max(parallel.values()):.2f}s")
+
+
+if __name__ == "__main__":
+    main()
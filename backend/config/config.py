@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 from hydra.core.config_store import ConfigStore
 from dataclasses import dataclass, field
 from constants import DatasetType, ModelType, SamplingType
@@ -57,6 +57,12 @@ class LOBSTER(Dataset):
     training_stocks: list = field(default_factory=lambda: ["INTC"])
     testing_stocks: list = field(default_factory=lambda: ["INTC"])
     batch_size: int = 128
+    # build the sets out of core, one trading day in memory at a time
+    streaming_build: bool = False
+    # resident memory in MB every stock built in parallel can hold, by default the physical memory split among them
+    build_memory_budget_mb: Optional[int] = None
+    # orderbook features as the volumes on a tick grid around the mid price instead of the price levels
+    sparse_representation: bool = False
     
 @dataclass
 class BTC(Dataset):
@@ -68,6 +74,10 @@ class BTC(Dataset):
     batch_size: int = 128
     training_stocks: list = field(default_factory=lambda: ["BTC"])
     testing_stocks: list = field(default_factory=lambda: ["BTC"])
+    # build the sets out of core, one trading day in memory at a time
+    streaming_build: bool = False
+    # orderbook features as the volumes on a tick grid around the mid price instead of the price levels
+    sparse_representation: bool = False
 
 @dataclass
 class Experiment:
@@ -60,6 +60,9 @@ N_LOB_LEVELS = 10
 LEN_LEVEL = 4
 LEN_ORDER = 6
 LEN_SMOOTH = 10
+# price ticks of the sparse representation, in dollars as the prices of the sets
+LOBSTER_TICK_SIZE = 0.01
+BTC_TICK_SIZE = 0.1
 
 DEVICE = 'cuda' if torch.cuda.is_available() else 'cpu'
 DIR_EXPERIMENTS = "data/experiments"
@@ -36,14 +36,19 @@ def hydra_app(config: Config):
     
     if config.dataset.type.value == "LOBSTER" and not config.experiment.is_data_preprocessed:
         # prepare the datasets, this will save train.npy, val.npy and test.npy in the data directory
+        # the testing stocks need their sets as well, every stock is built once
+        stocks = list(dict.fromkeys(config.dataset.training_stocks + config.dataset.testing_stocks))
         data_builder = LOBSTERDataBuilder(
-            stocks=config.dataset.training_stocks,
+            stocks=stocks,
             data_dir=cst.DATA_DIR,
             date_trading_days=config.dataset.dates,
             split_rates=cst.SPLIT_RATES,
             sampling_type=config.dataset.sampling_type,
             sampling_time=config.dataset.sampling_time,
             sampling_quantity=config.dataset.sampling_quantity,
+            memory_budget_mb=config.dataset.build_memory_budget_mb,
+            streaming=config.dataset.streaming_build,
+            sparse_representation=config.dataset.sparse_representation,
         )
         data_builder.prepare_save_datasets()
         
@@ -68,6 +73,8 @@ def hydra_app(config: Config):
         sampling_type=config.dataset.sampling_type,
         sampling_time=config.dataset.sampling_time,
         sampling_quantity=config.dataset.sampling_quantity,
+        streaming=config.dataset.streaming_build,
+        sparse_representation=config.dataset.sparse_representation,
         )
         data_builder.prepare_save_datasets()
 
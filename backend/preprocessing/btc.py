@@ -1,11 +1,16 @@
 import os
-from utils.utils_data import z_score_orderbook, labeling, reset_indexes
+import tempfile
+from functools import partial
+from utils.utils_data import z_score_orderbook, z_score_sparse, labeling, reset_indexes, to_sparse_representation
 import pandas as pd
 import numpy as np
 import torch
 import constants as cst
 from constants import SamplingType
 import kagglehub
+from preprocessing.day_cache import cached_day
+from preprocessing.ingest import read_btc_day, read_btc_kaggle
+from preprocessing.streaming import RunningStats, column_stats, merge_stats, write_split
 
 
 def btc_load(path, len_smooth, h, seq_size):
@@ -34,6 +39,10 @@ class BTCDataBuilder:
         sampling_type,
         sampling_time,
         sampling_quantity,
+        streaming=False,
+        ingest_cache=True,
+        day_cache=True,
+        sparse_representation=False,
     ):
         self.n_lob_levels = cst.N_LOB_LEVELS
         self.data_dir = data_dir
@@ -43,6 +52,14 @@ class BTCDataBuilder:
         self.sampling_type = sampling_type
         self.sampling_time = sampling_time
         self.sampling_quantity = sampling_quantity
+        # build the sets out of core, see _prepare_save_streaming
+        self.streaming = streaming
+        # cache the parsed raw files as Parquet, see preprocessing/ingest.py
+        self.ingest_cache = ingest_cache
+        # cache the preprocessed trading days, see preprocessing/day_cache.py
+        self.day_cache = day_cache
+        # the orderbook features are the volumes on a tick grid around the mid price, see to_sparse_representation
+        self.sparse_representation = sparse_representation
 
 
     def prepare_save_datasets(self):
@@ -68,8 +85,8 @@ class BTCDataBuilder:
             file_path = os.path.join(path, file)
             print(f"Processing {file}...")
             
-            # Load the CSV file
-            df = pd.read_csv(filepath_or_buffer=file_path, index_col='Unnamed: 0', parse_dates=True)
+            # Load the CSV file, not cached since it is split into the day files only once
+            df = read_btc_kaggle(file_path, cache=False)
             df.columns = np.arange(42)
             
             # Select specific columns for the order book and 
@@ -110,13 +127,16 @@ class BTCDataBuilder:
                 day_data.to_csv(file_path, index=False, header=False)
                 print(f"Saved {filename} with {len(day_data)} records")
             
-        self.dataframes = []
-        self._prepare_dataframes(save_dir)
-
         path_where_to_save = "{}/{}".format(
             self.data_dir,
             "BTC",
         )
+        if self.streaming:
+            self._prepare_save_streaming(save_dir, path_where_to_save)
+            return
+
+        self.dataframes = []
+        self._prepare_dataframes(save_dir)
         train_input = self.dataframes[0].values
         val_input = self.dataframes[1].values
         test_input = self.dataframes[2].values
@@ -127,20 +147,9 @@ class BTCDataBuilder:
 
 
     def _prepare_dataframes(self, path):
-        COLUMNS_NAMES = {"orderbook": ["timestamp",
-                                       "sell1", "vsell1", "buy1", "vbuy1",
-                                       "sell2", "vsell2", "buy2", "vbuy2",
-                                       "sell3", "vsell3", "buy3", "vbuy3",
-                                       "sell4", "vsell4", "buy4", "vbuy4",
-                                       "sell5", "vsell5", "buy5", "vbuy5",
-                                       "sell6", "vsell6", "buy6", "vbuy6",
-                                       "sell7", "vsell7", "buy7", "vbuy7",
-                                       "sell8", "vsell8", "buy8", "vbuy8",
-                                       "sell9", "vsell9", "buy9", "vbuy9",
-                                       "sell10", "vsell10", "buy10", "vbuy10"]}
         self.num_trading_days = len(os.listdir(path))
         split_days = self._split_days()
-        self._create_dataframes_splitted(path, split_days, COLUMNS_NAMES)
+        self._create_dataframes_splitted(path, split_days)
         
         train_input = self.dataframes[0].values
         val_input = self.dataframes[1].values
@@ -167,12 +176,18 @@ class BTCDataBuilder:
                 self.train_labels_horizons["label_h{}".format(cst.LOBSTER_HORIZONS[i])] = train_labels
                 self.val_labels_horizons["label_h{}".format(cst.LOBSTER_HORIZONS[i])] = val_labels
                 self.test_labels_horizons["label_h{}".format(cst.LOBSTER_HORIZONS[i])] = test_labels
-        
+
+        if self.sparse_representation:
+            # the labels are computed from the prices, then the orderbooks are replaced by their sparse representation
+            for i in range(len(self.dataframes)):
+                orderbook = self.dataframes[i]
+                self.dataframes[i] = pd.DataFrame(to_sparse_representation(orderbook.values, cst.BTC_TICK_SIZE), index=orderbook.index)
+
         # to conclude the preprocessing we normalize the dataframes
         self._normalize_dataframes()
 
 
-    def _create_dataframes_splitted(self, path, split_days, COLUMNS_NAMES):
+    def _create_dataframes_splitted(self, path, split_days):
         # Initialize empty dataframes for each split
         train_orderbooks = None
         val_orderbooks = None
@@ -180,10 +195,7 @@ class BTCDataBuilder:
         for i, filename in enumerate(sorted(os.listdir(path))):
             f = os.path.join(path, filename)
             if os.path.isfile(f):
-                df_ob = pd.read_csv(f, names=COLUMNS_NAMES["orderbook"])
-                # sample the dataframes according to the sampling type
-                if self.sampling_type == SamplingType.TIME:
-                    df_ob = self._sampling_time(df_ob, self.sampling_time)
+                df_ob = self._preprocess_day(f)
                 if i < split_days[0]:
                     train_orderbooks = df_ob if train_orderbooks is None else pd.concat([train_orderbooks, df_ob], axis=0)
                 elif split_days[0] <= i < split_days[1]:
@@ -193,16 +205,72 @@ class BTCDataBuilder:
             else:
                 raise ValueError(f"File {f} is not a file")
         # Save the splitted dataframes
-        train_orderbooks = train_orderbooks.drop(columns=["timestamp"])
-        val_orderbooks = val_orderbooks.drop(columns=["timestamp"])
-        test_orderbooks = test_orderbooks.drop(columns=["timestamp"])
         self.dataframes = [train_orderbooks, val_orderbooks, test_orderbooks]
 
 
+    def _prepare_save_streaming(self, path, path_where_to_save):
+        # same sets as _prepare_dataframes, built in two passes with one day in memory at a time:
+        # the first spills every day to disk and computes the statistics of the training days,
+        # the second normalizes the days of each split and writes them into the memory-mapped .npy file of the split
+        self.num_trading_days = len(os.listdir(path))
+        split_days = self._split_days()
+        files = [os.path.join(path, filename) for filename in sorted(os.listdir(path))]
+        bounds = [0, split_days[0], split_days[1], len(files)]
+        with tempfile.TemporaryDirectory(dir=path_where_to_save) as scratch_dir:
+            day_files = [os.path.join(scratch_dir, "day_{}.npy".format(i)) for i in range(len(files))]
+            stats = [self._spill_day(f, day_file) for f, day_file in zip(files, day_files)]
+            train_stats = merge_stats(stats[bounds[0]:bounds[1]])
+            for name, start, end in zip(["train", "val", "test"], bounds[:-1], bounds[1:]):
+                if start >= end:
+                    raise ValueError(f"There are no trading days for the {name} set")
+                write_split(day_files[start:end], "{}/{}.npy".format(path_where_to_save, name),
+                            partial(self._normalize_day, train_stats), [0, 2], cst.LOBSTER_HORIZONS, cst.LEN_SMOOTH)
+
+
+    def _spill_day(self, f, day_file):
+        # saves the orderbook of a day as a float64 array to day_file and returns the statistics used to normalize it
+        if not os.path.isfile(f):
+            raise ValueError(f"File {f} is not a file")
+        day = self._preprocess_day(f).values.astype(np.float64)
+        np.save(day_file, day)
+        stats = column_stats(day, {"size": slice(1, None, 2), "price": slice(0, None, 2)})
+        if self.sparse_representation:
+            stats["sparse_volume"] = RunningStats.of(to_sparse_representation(day, cst.BTC_TICK_SIZE))
+        return stats
+
+
+    def _preprocess_day(self, f):
+        # the orderbook of a day sampled according to the sampling type, without the timestamps,
+        # from the day cache when the file and the sampling did not change
+        config = {"builder": "btc", "sampling_type": self.sampling_type, "sampling_time": self.sampling_time}
+        return cached_day([f], config, partial(self._preprocess_raw_day, f), cache=self.day_cache)["orderbook"]
+
+
+    def _preprocess_raw_day(self, f):
+        df_ob = read_btc_day(f, cache=self.ingest_cache)
+        if self.sampling_type == SamplingType.TIME:
+            df_ob = self._sampling_time(df_ob, self.sampling_time)
+        return {"orderbook": df_ob.drop(columns=["timestamp"])}
+
+
+    def _normalize_day(self, stats, day):
+        # z-score of the orderbook of a day with the training statistics, as _normalize_dataframes
+        if self.sparse_representation:
+            day[:] = (to_sparse_representation(day, cst.BTC_TICK_SIZE) - stats["sparse_volume"].mean) / stats["sparse_volume"].std
+            return
+        day[:, 1::2] = (day[:, 1::2] - stats["size"].mean) / stats["size"].std
+        day[:, 0::2] = (day[:, 0::2] - stats["price"].mean) / stats["price"].std
+
+
     def _normalize_dataframes(self):
         #apply z score to orderbooks
         for i in range(len(self.dataframes)):
-            if (i == 0):
+            if self.sparse_representation:
+                if (i == 0):
+                    self.dataframes[i], mean_volume, std_volume = z_score_sparse(self.dataframes[i])
+                else:
+                    self.dataframes[i], _, _ = z_score_sparse(self.dataframes[i], mean_volume, std_volume)
+            elif (i == 0):
                 self.dataframes[i], mean_size, mean_prices, std_size, std_prices = z_score_orderbook(self.dataframes[i])
             else:
                 self.dataframes[i], _, _, _, _ = z_score_orderbook(self.dataframes[i], mean_size, mean_prices, std_size, std_prices)
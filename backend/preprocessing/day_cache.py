@@ -0,0 +1,87 @@
+import hashlib
+import json
+import os
+import zipfile
+import numpy as np
+import pandas as pd
+
+
+# name of the directory of the preprocessed days, next to the directory of the raw files as ingest_cache
+CACHE_DIR_NAME = "day_cache"
+# part of the keys, bump it when the preprocessing of the days changes so the cached days are preprocessed again
+CACHE_VERSION = 1
+
+
+def default_cache_dir(path):
+    # <data dir>/<stock>/day_cache for <data dir>/<stock>/<raw files dir>/<file>
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(path))), CACHE_DIR_NAME)
+
+
+def file_digest(path):
+    # sha1 of the contents of a file, so the days of raw files copied or downloaded again stay cached
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha1").hexdigest()
+
+
+def cache_path(files, config, cache_dir):
+    # the path of the preprocessed day of the raw files, keyed by their contents and the preprocessing config
+    key = json.dumps({"version": CACHE_VERSION, "files": [file_digest(f) for f in files], "config": config},
+                     sort_keys=True, default=str)
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    name = os.path.splitext(os.path.basename(files[0]))[0]
+    return os.path.join(cache_dir, "{}.{}.npz".format(name, digest))
+
+
+def _save(path, day):
+    # every column in its own array, so the dtypes of the columns are kept
+    arrays = {}
+    for name, value in day.items():
+        if isinstance(value, pd.DataFrame):
+            arrays[name + ".columns"] = np.array(value.columns, dtype=str)
+            for j, column in enumerate(value.columns):
+                arrays["{}.{}".format(name, j)] = value[column].values
+        else:
+            arrays[name] = np.asarray(value)
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, path)
+
+
+def _load(path):
+    day = {}
+    with np.load(path) as arrays:
+        for key in arrays.files:
+            if key.endswith(".columns"):
+                name = key[:-len(".columns")]
+                columns = [str(column) for column in arrays[key]]
+                day[name] = pd.DataFrame({column: arrays["{}.{}".format(name, j)] for j, column in enumerate(columns)})
+            elif "." not in key:
+                day[key] = arrays[key].item()
+    return day
+
+
+def cached_day(files, config, preprocess, cache=True, cache_dir=None):
+    """
+    preprocess() of the raw files of a trading day, a dict of DataFrames (with string column names and the default
+    index) and scalars. The result is saved to the cache and the next builds with the same file contents and config
+    load it instead, so adding a day or changing the split only preprocesses the new or changed days.
+    """
+    if not cache:
+        return preprocess()
+    cache_dir = cache_dir or default_cache_dir(files[0])
+    cached = cache_path(files, config, cache_dir)
+    if os.path.isfile(cached):
+        try:
+            return _load(cached)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+            print(f"Ignoring the unreadable cache {cached}: {e}")
+    day = preprocess()
+    os.makedirs(cache_dir, exist_ok=True)
+    # the entries of the day with other files or config are not needed anymore
+    prefix = os.path.splitext(os.path.basename(files[0]))[0] + "."
+    for filename in os.listdir(cache_dir):
+        if filename.startswith(prefix) and filename.endswith(".npz") and filename != os.path.basename(cached):
+            os.remove(os.path.join(cache_dir, filename))
+    _save(cached, day)
+    return day
@@ -0,0 +1,118 @@
+import hashlib
+import os
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:  # declared in the requirements, without it the files are parsed by pandas and not cached
+    pa = None
+
+
+# name of the directory of the Parquet files, next to the directory of the raw files it caches
+CACHE_DIR_NAME = "ingest_cache"
+
+LOBSTER_MESSAGE_DTYPES = {"time": "float64", "event_type": "int64", "order_id": "int64",
+                          "size": "int64", "price": "int64", "direction": "int64"}
+LOBSTER_PRICE_LEVELS = 10  # levels of the LOBSTER orderbook files
+BTC_PRICE_LEVELS = 10
+
+_warned_fallback = False
+
+
+def _orderbook_dtypes(num_levels, dtype):
+    dtypes = {}
+    for level in range(1, num_levels + 1):
+        for name in ("sell", "vsell", "buy", "vbuy"):
+            dtypes["{}{}".format(name, level)] = dtype
+    return dtypes
+
+
+LOBSTER_ORDERBOOK_DTYPES = _orderbook_dtypes(LOBSTER_PRICE_LEVELS, "int64")
+# the day files of the BTC dataset keep the timestamp as text
+BTC_ORDERBOOK_DTYPES = {"timestamp": "str", **_orderbook_dtypes(BTC_PRICE_LEVELS, "float64")}
+
+
+def default_cache_dir(path):
+    # <data dir>/<stock>/ingest_cache for <data dir>/<stock>/<raw files dir>/<file>, the raw dirs must only hold raw files
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(path))), CACHE_DIR_NAME)
+
+
+def cache_path(path, dtypes, cache_dir):
+    # the Parquet file caching path, keyed by the source path, size and mtime and the requested columns and dtypes
+    stat = os.stat(path)
+    key = "{}|{}|{}|{}".format(os.path.abspath(path), stat.st_size, stat.st_mtime_ns, sorted((dtypes or {}).items()))
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, "{}.{}.parquet".format(os.path.basename(path), digest))
+
+
+def _arrow_type(dtype):
+    return pa.string() if dtype == "str" else pa.from_numpy_dtype(np.dtype(dtype))
+
+
+def _read_arrow(path, dtypes, header):
+    read_options = pa_csv.ReadOptions(column_names=None if header else list(dtypes))
+    convert_options = pa_csv.ConvertOptions(column_types={name: _arrow_type(dtype) for name, dtype in (dtypes or {}).items()})
+    return pa_csv.read_csv(path, read_options=read_options, convert_options=convert_options)
+
+
+def _read_pandas(path, dtypes, header):
+    # round_trip parses the floats exactly as pyarrow does, the default parser can be off in the last digit
+    if header:
+        return pd.read_csv(path, dtype=dtypes, float_precision="round_trip")
+    return pd.read_csv(path, names=list(dtypes), dtype=dtypes, float_precision="round_trip")
+
+
+def read_csv(path, dtypes, header=False, cache=True, cache_dir=None):
+    """
+    Raw CSV file as a DataFrame with the columns (names -> dtype, "str" for text) of dtypes, or the header and
+    inferred types when header is True. With pyarrow the file is parsed by its multithreaded typed reader and cached
+    as Parquet, so the next builds skip the text parsing; a changed file (size or mtime) is parsed again.
+    """
+    if pa is None:
+        global _warned_fallback
+        if not _warned_fallback:
+            print("pyarrow is not installed, parsing the raw files with pandas without the Parquet cache")
+            _warned_fallback = True
+        return _read_pandas(path, dtypes, header)
+    cached = None
+    if cache:
+        cache_dir = cache_dir or default_cache_dir(path)
+        cached = cache_path(path, dtypes, cache_dir)
+        if os.path.isfile(cached):
+            try:
+                return pq.read_table(cached).to_pandas()
+            except (OSError, pa.ArrowInvalid) as e:
+                print(f"Ignoring the unreadable cache {cached}: {e}")
+    table = _read_arrow(path, dtypes, header)
+    if cached is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        # the entries of older versions of the file are not needed anymore
+        prefix = os.path.basename(path) + "."
+        for filename in os.listdir(cache_dir):
+            if filename.startswith(prefix) and filename.endswith(".parquet") and filename != os.path.basename(cached):
+                os.remove(os.path.join(cache_dir, filename))
+        tmp = "{}.{}.tmp".format(cached, os.getpid())
+        pq.write_table(table, tmp)
+        os.replace(tmp, cached)
+    return table.to_pandas()
+
+
+def read_lobster_messages(path, cache=True):
+    return read_csv(path, LOBSTER_MESSAGE_DTYPES, cache=cache)
+
+
+def read_lobster_orderbook(path, cache=True):
+    return read_csv(path, LOBSTER_ORDERBOOK_DTYPES, cache=cache)
+
+
+def read_btc_day(path, cache=True):
+    return read_csv(path, BTC_ORDERBOOK_DTYPES, cache=cache)
+
+
+def read_btc_kaggle(path, cache=True):
+    # the downloaded Kaggle file, with a header and the unnamed row number as first column
+    df = read_csv(path, None, header=True, cache=cache)
+    return df.set_index(df.columns[0]).rename_axis(None)
@@ -1,10 +1,33 @@
 import os
-from utils.utils_data import reset_indexes, z_score_orderbook, normalize_messages, labeling
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+from utils.utils_data import reset_indexes, z_score_orderbook, z_score_sparse, normalize_messages, labeling, print_peak_memory, to_sparse_representation, memory_check, total_memory_mb
 import pandas as pd
 import numpy as np
 import torch
 import constants as cst
 from torch.utils import data
+from preprocessing.day_cache import cached_day
+from preprocessing.ingest import read_lobster_messages, read_lobster_orderbook
+from preprocessing.streaming import RunningStats, column_stats, merge_stats, write_split
+
+
+# Columns of the LOBSTER message and orderbook files
+COLUMNS_NAMES = {"orderbook": ["sell1", "vsell1", "buy1", "vbuy1",
+                               "sell2", "vsell2", "buy2", "vbuy2",
+                               "sell3", "vsell3", "buy3", "vbuy3",
+                               "sell4", "vsell4", "buy4", "vbuy4",
+                               "sell5", "vsell5", "buy5", "vbuy5",
+                               "sell6", "vsell6", "buy6", "vbuy6",
+                               "sell7", "vsell7", "buy7", "vbuy7",
+                               "sell8", "vsell8", "buy8", "vbuy8",
+                               "sell9", "vsell9", "buy9", "vbuy9",
+                               "sell10", "vsell10", "buy10", "vbuy10"],
+                 "message": ["time", "event_type", "order_id", "size", "price", "direction"]}
+# Columns of the preprocessed messages, the orderbook columns follow them in the saved sets
+MESSAGE_COLUMNS = {name: j for j, name in enumerate(["time", "event_type", "size", "price", "direction", "depth"])}
 
 
 def lobster_load(path, all_features, len_smooth, h, seq_size):
@@ -35,6 +58,28 @@ def lobster_load(path, all_features, len_smooth, h, seq_size):
     return input, labels
 
 
+def order_depths(prices, directions, event_types, best_bids, best_asks):
+    """
+    Depth in ticks (100 price units) of every order from the best price of its side, 0 for the first order.
+    New orders (event type 1) are compared with the orderbook after the event, the others with the one before.
+    """
+    depths = np.zeros(len(prices), dtype=int)
+    if len(prices) < 2:
+        return depths
+    rows = np.arange(1, len(prices))
+    index = np.where(event_types[1:] == 1, rows, rows - 1)
+    depth = np.where(directions[1:] == 1,
+                     (best_bids[index] - prices[1:]) // 100,
+                     (prices[1:] - best_asks[index]) // 100)
+    depths[1:] = np.maximum(depth, 0)
+    return depths
+
+
+def signed_directions(directions, event_types):
+    """Direction of the orders, flipped for executions (event type 4) so it is the side of the aggressor"""
+    return directions * np.where(event_types == 4, -1, 1)
+
+
 class LOBSTERDataBuilder:
     def __init__(
         self,
@@ -45,6 +90,12 @@ class LOBSTERDataBuilder:
         sampling_type,
         sampling_time,
         sampling_quantity,
+        workers=None,
+        memory_budget_mb=None,
+        streaming=False,
+        ingest_cache=True,
+        day_cache=True,
+        sparse_representation=False,
     ):
         self.n_lob_levels = cst.N_LOB_LEVELS
         self.data_dir = data_dir
@@ -55,51 +106,96 @@ class LOBSTERDataBuilder:
         self.sampling_type = sampling_type
         self.sampling_time = sampling_time
         self.sampling_quantity = sampling_quantity
+        # processes building the stocks and preprocessing their trading days
+        self.workers = workers or os.cpu_count()
+        # resident memory in MB every stock built in parallel can hold, by default the physical memory split among them
+        self.memory_budget_mb = memory_budget_mb
+        # build the sets out of core, see _prepare_save_streaming
+        self.streaming = streaming
+        # cache the parsed raw files as Parquet, see preprocessing/ingest.py
+        self.ingest_cache = ingest_cache
+        # cache the preprocessed trading days, see preprocessing/day_cache.py
+        self.day_cache = day_cache
+        # the orderbook features are the volumes on a tick grid around the mid price, see to_sparse_representation
+        self.sparse_representation = sparse_representation
 
 
     def prepare_save_datasets(self):
-        for i in range(len(self.stocks)):
-            stock = self.stocks[i]
-            path = "{}/{}/{}_{}_{}".format(
-                self.data_dir,
-                stock,
-                stock,
-                self.date_trading_days[0],
-                self.date_trading_days[1],
-            )
-            self.dataframes = []
-            self._prepare_dataframes(path, stock)
-
-            path_where_to_save = "{}/{}".format(
-                self.data_dir,
-                stock,
-            )
-
-            self.train_input = pd.concat(self.dataframes[0], axis=1).values
-            self.val_input = pd.concat(self.dataframes[1], axis=1).values
-            self.test_input = pd.concat(self.dataframes[2], axis=1).values
-            self.train_set = pd.concat([pd.DataFrame(self.train_input), pd.DataFrame(self.train_labels_horizons)], axis=1).values
-            self.val_set = pd.concat([pd.DataFrame(self.val_input), pd.DataFrame(self.val_labels_horizons)], axis=1).values
-            self.test_set = pd.concat([pd.DataFrame(self.test_input), pd.DataFrame(self.test_labels_horizons)], axis=1).values
-            self._save(path_where_to_save)
-
-
-    def _prepare_dataframes(self, path, stock):
-        COLUMNS_NAMES = {"orderbook": ["sell1", "vsell1", "buy1", "vbuy1",
-                                       "sell2", "vsell2", "buy2", "vbuy2",
-                                       "sell3", "vsell3", "buy3", "vbuy3",
-                                       "sell4", "vsell4", "buy4", "vbuy4",
-                                       "sell5", "vsell5", "buy5", "vbuy5",
-                                       "sell6", "vsell6", "buy6", "vbuy6",
-                                       "sell7", "vsell7", "buy7", "vbuy7",
-                                       "sell8", "vsell8", "buy8", "vbuy8",
-                                       "sell9", "vsell9", "buy9", "vbuy9",
-                                       "sell10", "vsell10", "buy10", "vbuy10"],
-                         "message": ["time", "event_type", "order_id", "size", "price", "direction"]}
+        # the stocks are built in parallel, each in its own process within the memory budget,
+        # and the workers left preprocess the trading days of every stock in parallel
+        stock_workers = min(self.workers, len(self.stocks))
+        day_workers = max(self.workers // stock_workers, 1)
+        start = time.perf_counter()
+        if stock_workers == 1:
+            for done, stock in enumerate(self.stocks, 1):
+                elapsed = self._prepare_save_stock(stock, day_workers)
+                print(f"Built {stock} in {elapsed:.1f}s ({done}/{len(self.stocks)} stocks)")
+        else:
+            self._prepare_save_stocks(stock_workers, day_workers)
+        print(f"Built {len(self.stocks)} stocks in {time.perf_counter() - start:.1f}s")
+
+
+    def _prepare_save_stocks(self, stock_workers, day_workers):
+        memory_budget_mb = self.memory_budget_mb
+        if memory_budget_mb is None and total_memory_mb() is not None:
+            memory_budget_mb = total_memory_mb() / stock_workers
+        budget = "no memory limit" if memory_budget_mb is None else f"{memory_budget_mb:.0f} MB"
+        print(f"Building {len(self.stocks)} stocks on {stock_workers} processes, each with {day_workers} day worker(s) and {budget}")
+        failed = []
+        with ProcessPoolExecutor(max_workers=stock_workers) as executor:
+            futures = {executor.submit(self._prepare_save_stock, stock, day_workers, memory_budget_mb): stock for stock in self.stocks}
+            # the stocks are reported as they finish, the other stocks go on when one fails
+            for done, future in enumerate(as_completed(futures), 1):
+                stock = futures[future]
+                try:
+                    print(f"Built {stock} in {future.result():.1f}s ({done}/{len(self.stocks)} stocks)")
+                except Exception as e:
+                    print(f"Building {stock} failed ({done}/{len(self.stocks)} stocks): {e!r}")
+                    failed.append(stock)
+        if failed:
+            raise RuntimeError("Building the datasets of {} failed".format(", ".join(failed)))
+
+
+    def _prepare_save_stock(self, stock, day_workers, memory_budget_mb=None):
+        # builds and saves the train, val and test sets of a stock, returns the seconds it took.
+        # The memory the stock takes on top of what its process holds now is checked against the budget after every
+        # day, and raises MemoryError over it, so a process reused for the next stock starts again from its own memory
+        start = time.perf_counter()
+        check_memory = memory_check(memory_budget_mb)
+        path = "{}/{}/{}_{}_{}".format(
+            self.data_dir,
+            stock,
+            stock,
+            self.date_trading_days[0],
+            self.date_trading_days[1],
+        )
+        path_where_to_save = "{}/{}".format(
+            self.data_dir,
+            stock,
+        )
+        if self.streaming:
+            self._prepare_save_streaming(path, path_where_to_save, day_workers, check_memory)
+            return time.perf_counter() - start
+
+        self.dataframes = []
+        self._prepare_dataframes(path, stock, day_workers, check_memory)
+
+        self.train_input = pd.concat(self.dataframes[0], axis=1).values
+        self.val_input = pd.concat(self.dataframes[1], axis=1).values
+        self.test_input = pd.concat(self.dataframes[2], axis=1).values
+        self.train_set = pd.concat([pd.DataFrame(self.train_input), pd.DataFrame(self.train_labels_horizons)], axis=1).values
+        self.val_set = pd.concat([pd.DataFrame(self.val_input), pd.DataFrame(self.val_labels_horizons)], axis=1).values
+        self.test_set = pd.concat([pd.DataFrame(self.test_input), pd.DataFrame(self.test_labels_horizons)], axis=1).values
+        check_memory()
+        self._save(path_where_to_save)
+        return time.perf_counter() - start
+
+
+    def _prepare_dataframes(self, path, stock, workers=1, check_memory=None):
         self.num_trading_days = len(os.listdir(path))//2
         split_days = self._split_days()
         split_days = [i * 2 for i in split_days]
-        self._create_dataframes_splitted(path, split_days, COLUMNS_NAMES)
+        self._create_dataframes_splitted(path, split_days, workers, check_memory)
         # divide all the price, both of lob and messages, by 10000, to have dollars as unit
         for i in range(len(self.dataframes)):
             self.dataframes[i][0]["price"] = self.dataframes[i][0]["price"] / 10000
@@ -129,138 +225,163 @@ class LOBSTERDataBuilder:
                 self.train_labels_horizons["label_h{}".format(cst.LOBSTER_HORIZONS[i])] = train_labels
                 self.val_labels_horizons["label_h{}".format(cst.LOBSTER_HORIZONS[i])] = val_labels
                 self.test_labels_horizons["label_h{}".format(cst.LOBSTER_HORIZONS[i])] = test_labels
-        
+
+        if self.sparse_representation:
+            # the labels are computed from the prices, then the orderbooks are replaced by their sparse representation
+            for i in range(len(self.dataframes)):
+                orderbook = self.dataframes[i][1]
+                self.dataframes[i][1] = pd.DataFrame(to_sparse_representation(orderbook.values, cst.LOBSTER_TICK_SIZE), index=orderbook.index)
+
         # to conclude the preprocessing we normalize the dataframes
         self._normalize_dataframes()
 
 
-    def _sparse_representation(self):
-        tick_size = 0.01
-        for i in range(len(self.dataframes)):
-            dense_repr = self.dataframes[i][1].values
-            sparse_repr = np.zeros((dense_repr.shape[0], dense_repr.shape[1] + 1))
-            for row in range(dense_repr.shape[0]):
-                sparse_pos_ask = 0
-                sparse_pos_bid = 0
-                mid_price = (dense_repr[row][0] + dense_repr[row][2]) / 2
-                sparse_repr[row][-1] = mid_price
-                for col in range(0, dense_repr.shape[1], 2):
-                    if col == 0:
-                        start_ask = dense_repr[row][col]
-                    elif col == 2:
-                        start_bid = dense_repr[row][col]
-                    elif col % 4 == 0:
-                        if sparse_pos_ask < (sparse_repr.shape[1]) - 1 / 2:
-                            actual_ask = dense_repr[row][col]
-                            for level in range(0, actual_ask-start_ask, -tick_size):
-                                if sparse_pos_ask < (sparse_repr.shape[1]) - 1 / 2:
-                                    if level == actual_ask - start_ask - tick_size:
-                                        sparse_repr[row][sparse_pos_ask] = dense_repr[row][col+1]
-                                    else:
-                                        sparse_repr[row][sparse_pos_ask] = 0
-                                    sparse_pos_ask += 1
-                                else:
-                                    break
-                            start_ask = actual_ask
-                        else:
-                            continue
-                    elif col % 4 == 2:
-                        if sparse_pos_bid < (sparse_repr.shape[1]) - 1 / 2:
-                            actual_bid = dense_repr[row][col]
-                            for level in range(0, start_bid-actual_bid, -tick_size):
-                                if sparse_pos_bid < (sparse_repr.shape[1]) - 1 / 2:
-                                    if level == start_bid - actual_bid - tick_size:
-                                        sparse_repr[row][sparse_pos_ask] = dense_repr[row][col+1]
-                                    else:
-                                        sparse_repr[row][sparse_pos_ask] = 0
-                                    sparse_pos_bid += 1
-                                else:
-                                    break
-                            start_bid = actual_bid
-                        else:
-                            continue
-                
-
-    def _create_dataframes_splitted(self, path, split_days, COLUMNS_NAMES):
-        # iterate over files in the data directory of self.STOCK_NAME
-        total_shape = 0
-        for i, filename in enumerate(sorted(os.listdir(path))):
-            f = os.path.join(path, filename)
-            print(f)
-            if os.path.isfile(f):
-                # then we create the df for the training set
-                if i < split_days[0]:
-                    if (i % 2) == 0:
-                        if i == 0:
-                            train_messages = pd.read_csv(f, names=COLUMNS_NAMES["message"])
-                        else:
-                            train_message = pd.read_csv(f, names=COLUMNS_NAMES["message"])
-
-                    else:
-                        if i == 1:
-                            train_orderbooks = pd.read_csv(f, names=COLUMNS_NAMES["orderbook"])
-                            total_shape += train_orderbooks.shape[0]
-                            train_orderbooks, train_messages = self._preprocess_message_orderbook([train_messages, train_orderbooks], self.n_lob_levels, self.sampling_type, self.sampling_time, self.sampling_quantity)
-                            if (len(train_orderbooks) != len(train_messages)):
-                                raise ValueError("train_orderbook length is different than train_messages")
-                        else:
-                            train_orderbook = pd.read_csv(f, names=COLUMNS_NAMES["orderbook"])
-                            total_shape += train_orderbook.shape[0]
-                            train_orderbook, train_message = self._preprocess_message_orderbook([train_message, train_orderbook], self.n_lob_levels, self.sampling_type, self.sampling_time, self.sampling_quantity)
-                            train_messages = pd.concat([train_messages, train_message], axis=0)
-                            train_orderbooks = pd.concat([train_orderbooks, train_orderbook], axis=0)
-
-                elif split_days[0] <= i < split_days[1]:  # then we are creating the df for the validation set
-                    if (i % 2) == 0:
-                        if (i == split_days[0]):
-                            self.dataframes.append([train_messages, train_orderbooks])
-                            val_messages = pd.read_csv(f, names=COLUMNS_NAMES["message"])
-                        else:
-                            val_message = pd.read_csv(f, names=COLUMNS_NAMES["message"])
-                    else:
-                        if i == split_days[0] + 1:
-                            val_orderbooks = pd.read_csv(f, names=COLUMNS_NAMES["orderbook"])
-                            total_shape += val_orderbooks.shape[0]
-                            val_orderbooks, val_messages = self._preprocess_message_orderbook([val_messages, val_orderbooks], self.n_lob_levels, self.sampling_type, self.sampling_time, self.sampling_quantity)
-                            if (len(val_orderbooks) != len(val_messages)):
-                                raise ValueError("val_orderbook length is different than val_messages")
-                        else:
-                            val_orderbook = pd.read_csv(f, names=COLUMNS_NAMES["orderbook"])
-                            total_shape += val_orderbook.shape[0]
-                            val_orderbook, val_message = self._preprocess_message_orderbook([val_message, val_orderbook], self.n_lob_levels, self.sampling_type, self.sampling_time, self.sampling_quantity)
-                            val_messages = pd.concat([val_messages, val_message], axis=0)
-                            val_orderbooks = pd.concat([val_orderbooks, val_orderbook], axis=0)
-
-                else:  # then we are creating the df for the test set
-
-                    if (i % 2) == 0:
-                        if (i == split_days[1]):
-                            self.dataframes.append([val_messages, val_orderbooks])
-                            test_messages = pd.read_csv(f, names=COLUMNS_NAMES["message"])
-                        else:
-                            test_message = pd.read_csv(f, names=COLUMNS_NAMES["message"])
-
-                    else:
-                        if i == split_days[1] + 1:
-                            test_orderbooks = pd.read_csv(f, names=COLUMNS_NAMES["orderbook"])
-                            test_orderbooks, test_messages = self._preprocess_message_orderbook([test_messages, test_orderbooks], self.n_lob_levels, self.sampling_type, self.sampling_time, self.sampling_quantity)
-                            if (len(test_orderbooks) != len(test_messages)):
-                                raise ValueError("test_orderbook length is different than test_messages")
-                        else:
-                            test_orderbook = pd.read_csv(f, names=COLUMNS_NAMES["orderbook"])
-                            test_orderbook, test_message = self._preprocess_message_orderbook([test_message, test_orderbook], self.n_lob_levels, self.sampling_type, self.sampling_time, self.sampling_quantity)
-                            test_messages = pd.concat([test_messages, test_message], axis=0)
-                            test_orderbooks = pd.concat([test_orderbooks, test_orderbook], axis=0)
-            else:
-                raise ValueError("File {} is not a file".format(f))
-        self.dataframes.append([test_messages, test_orderbooks])
+    def _create_dataframes_splitted(self, path, split_days, workers=1, check_memory=None):
+        days = self._day_files(path)
+        # every day is preprocessed on its own, in parallel over the worker processes
+        results = self._map_days(self._preprocess_day, workers, days, check_memory=check_memory)
+
+        # then the days of each split are concatenated at once
+        for name, start, end in self._split_bounds(split_days, len(days)):
+            messages = pd.concat([day_messages for day_messages, _, _ in results[start:end]], axis=0)
+            orderbooks = pd.concat([day_orderbook for _, day_orderbook, _ in results[start:end]], axis=0)
+            self.dataframes.append([messages, orderbooks])
+        total_shape = sum(shape for _, _, shape in results)
         print(f"Total shape of the orderbooks is {total_shape}")
+        print_peak_memory()
+
+
+    def _day_files(self, path):
+        # the files of the data directory of self.STOCK_NAME come in pairs, messages and orderbook of a day
+        files = [os.path.join(path, filename) for filename in sorted(os.listdir(path))]
+        for f in files:
+            if not os.path.isfile(f):
+                raise ValueError("File {} is not a file".format(f))
+        return list(zip(files[0::2], files[1::2]))
+
+
+    def _map_days(self, fn, workers, *iterables, check_memory=None):
+        # fn over the days on up to workers processes, the results are in day order.
+        # check_memory is called after every day, the days not started yet are dropped when it raises
+        workers = min(workers, len(iterables[0]))
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                try:
+                    return self._collect_days(executor.map(fn, *iterables), check_memory)
+                except BaseException:
+                    executor.shutdown(cancel_futures=True)
+                    raise
+        return self._collect_days(map(fn, *iterables), check_memory)
+
+
+    def _collect_days(self, results, check_memory):
+        days = []
+        for result in results:
+            days.append(result)
+            if check_memory is not None:
+                check_memory()
+        return days
+
+
+    def _split_bounds(self, split_days, num_days):
+        # (name, first day, last day + 1) of the train, val and test sets, split_days counts files
+        bounds = [0, split_days[0] // 2, split_days[1] // 2, num_days]
+        splits = list(zip(["train", "val", "test"], bounds[:-1], bounds[1:]))
+        for name, start, end in splits:
+            if start >= end:
+                raise ValueError("There are no trading days for the {} set".format(name))
+        return splits
+
+
+    def _preprocess_day(self, files):
+        # returns the preprocessed messages and orderbook of one day and the rows of its raw orderbook,
+        # from the day cache when the files and the preprocessing config did not change
+        config = {"builder": "lobster", "n_lob_levels": self.n_lob_levels, "sampling_type": self.sampling_type,
+                  "sampling_time": self.sampling_time, "sampling_quantity": self.sampling_quantity}
+        day = cached_day(files, config, partial(self._preprocess_raw_day, files), cache=self.day_cache)
+        return day["messages"], day["orderbook"], day["raw_rows"]
+
+
+    def _preprocess_raw_day(self, files):
+        message_file, orderbook_file = files
+        print(f"{message_file}, {orderbook_file}")
+        messages = read_lobster_messages(message_file, cache=self.ingest_cache)
+        orderbook = read_lobster_orderbook(orderbook_file, cache=self.ingest_cache)
+        shape = orderbook.shape[0]
+        orderbook, messages = self._preprocess_message_orderbook([messages, orderbook], self.n_lob_levels, self.sampling_type, self.sampling_time, self.sampling_quantity)
+        if len(orderbook) != len(messages):
+            raise ValueError("orderbook length is different than messages in {}".format(orderbook_file))
+        return {"messages": messages, "orderbook": orderbook, "raw_rows": shape}
+
+
+    def _prepare_save_streaming(self, path, path_where_to_save, workers=1, check_memory=None):
+        # same sets as _prepare_dataframes, built in two passes with one day in memory at a time:
+        # the first preprocesses every day, spills it to disk and computes the statistics of the training days,
+        # the second normalizes the days of each split and writes them into the memory-mapped .npy file of the split
+        self.num_trading_days = len(os.listdir(path))//2
+        split_days = [i * 2 for i in self._split_days()]
+        days = self._day_files(path)
+        splits = self._split_bounds(split_days, len(days))
+        with tempfile.TemporaryDirectory(dir=path_where_to_save) as scratch_dir:
+            day_files = [os.path.join(scratch_dir, "day_{}.npy".format(i)) for i in range(len(days))]
+            stats = self._map_days(self._spill_day, workers, days, day_files, check_memory=check_memory)
+            _, start, end = splits[0]
+            train_stats = merge_stats(stats[start:end])
+            for name, start, end in splits:
+                write_split(day_files[start:end], "{}/{}.npy".format(path_where_to_save, name),
+                            partial(self._normalize_day, train_stats), [cst.LEN_ORDER, cst.LEN_ORDER + 2],
+                            cst.LOBSTER_HORIZONS, cst.LEN_SMOOTH)
+        print_peak_memory()
+
+
+    def _spill_day(self, files, day_file):
+        # preprocesses a day into a float64 array of the messages and orderbook columns (prices in dollars),
+        # saves it to day_file and returns the statistics used to normalize it
+        messages, orderbook, _ = self._preprocess_day(files)
+        day = np.empty((len(messages), messages.shape[1] + orderbook.shape[1]), dtype=np.float64)
+        day[:, :cst.LEN_ORDER] = messages.values
+        day[:, cst.LEN_ORDER:] = orderbook.values
+        # divide all the price, both of lob and messages, by 10000, to have dollars as unit
+        day[:, MESSAGE_COLUMNS["price"]] /= 10000
+        day[:, cst.LEN_ORDER::2] /= 10000
+        np.save(day_file, day)
+        stats = column_stats(day, {
+            "orderbook_size": slice(cst.LEN_ORDER + 1, None, 2),
+            "orderbook_price": slice(cst.LEN_ORDER, None, 2),
+            **{column: MESSAGE_COLUMNS[column] for column in ("time", "size", "price", "depth")},
+        })
+        if self.sparse_representation:
+            stats["sparse_volume"] = RunningStats.of(to_sparse_representation(day[:, cst.LEN_ORDER:], cst.LOBSTER_TICK_SIZE))
+        return stats
+
+
+    def _normalize_day(self, stats, day):
+        # z-score of the orderbook and messages of a day with the training statistics, as _normalize_dataframes
+        orderbook = day[:, cst.LEN_ORDER:]
+        if self.sparse_representation:
+            sparse_lob = to_sparse_representation(orderbook, cst.LOBSTER_TICK_SIZE)
+            orderbook[:] = (sparse_lob - stats["sparse_volume"].mean) / stats["sparse_volume"].std
+        else:
+            orderbook[:, 1::2] = (orderbook[:, 1::2] - stats["orderbook_size"].mean) / stats["orderbook_size"].std
+            orderbook[:, 0::2] = (orderbook[:, 0::2] - stats["orderbook_price"].mean) / stats["orderbook_price"].std
+        for column in ("time", "size", "price", "depth"):
+            j = MESSAGE_COLUMNS[column]
+            day[:, j] = (day[:, j] - stats[column].mean) / stats[column].std
+        event_type = day[:, MESSAGE_COLUMNS["event_type"]]
+        event_type -= 1.0
+        event_type[event_type == 2] = 1
+        event_type[event_type == 3] = 2
 
 
     def _normalize_dataframes(self):
         #apply z score to orderbooks
         for i in range(len(self.dataframes)):
-            if (i == 0):
+            if self.sparse_representation:
+                if (i == 0):
+                    self.dataframes[i][1], mean_volume, std_volume = z_score_sparse(self.dataframes[i][1])
+                else:
+                    self.dataframes[i][1], _, _ = z_score_sparse(self.dataframes[i][1], mean_volume, std_volume)
+            elif (i == 0):
                 self.dataframes[i][1], mean_size, mean_prices, std_size, std_prices = z_score_orderbook(self.dataframes[i][1])
             else:
                 self.dataframes[i][1], _, _, _, _ = z_score_orderbook(self.dataframes[i][1], mean_size, mean_prices, std_size, std_prices)
@@ -366,26 +487,9 @@ class LOBSTERDataBuilder:
         bid_sides = dataframes[1].iloc[:, 2::4].values
         ask_sides = dataframes[1].iloc[:, 0::4].values
         
-        # Initialize depth array
-        depths = np.zeros(dataframes[0].shape[0], dtype=int)
-
         # Compute the depth of the orders with respect to the orderbook
-        for j in range(1, len(prices)):
-            order_price = prices[j]
-            direction = directions[j]
-            event_type = event_types[j]
-            
-            index = j if event_type == 1 else j - 1
-            
-            if direction == 1:
-                bid_price = bid_sides[index, 0]
-                depth = (bid_price - order_price) // 100
-            else:
-                ask_price = ask_sides[index, 0]
-                depth = (order_price - ask_price) // 100
-            
-            depths[j] = max(depth, 0)
-        
+        depths = order_depths(prices, directions, event_types, bid_sides[:, 0], ask_sides[:, 0])
+
         # Assign the computed depths back to the DataFrame
         dataframes[0]["depth"] = depths
             
@@ -394,7 +498,6 @@ class LOBSTERDataBuilder:
         dataframes[1] = dataframes[1].iloc[1:, :]
         dataframes = reset_indexes(dataframes)
         
-        dataframes[0]["direction"] = dataframes[0]["direction"] * dataframes[0]["event_type"].apply(
-            lambda x: -1 if x == 4 else 1)
+        dataframes[0]["direction"] = signed_directions(dataframes[0]["direction"].values, dataframes[0]["event_type"].values)
             
         return dataframes[1], dataframes[0]
\ No newline at end of file
@@ -0,0 +1,142 @@
+import os
+import numpy as np
+from numpy.lib.format import open_memmap
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+# rows of the split processed at once when computing the labels
+LABELING_CHUNK_ROWS = 1_000_000
+
+
+class RunningStats:
+    """Count, mean and sum of squared deviations of a stream of values, merged batch by batch (Welford/Chan)"""
+
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    @classmethod
+    def of(cls, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if values.size == 0:
+            return cls()
+        mean = values.mean()
+        return cls(values.size, float(mean), float(((values - mean) ** 2).sum()))
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        return self
+
+    @property
+    def std(self):
+        # sample standard deviation, as pandas computes it
+        return (self.m2 / (self.count - 1)) ** 0.5 if self.count > 1 else float("nan")
+
+
+def column_stats(array, groups):
+    # RunningStats of every group of columns, groups maps a name to a column index or slice
+    return {name: RunningStats.of(array[:, columns]) for name, columns in groups.items()}
+
+
+def merge_stats(stats):
+    # merges a list of column_stats results, in order
+    merged = {}
+    for day_stats in stats:
+        for name, day in day_stats.items():
+            merged.setdefault(name, RunningStats()).merge(day)
+    return merged
+
+
+def streaming_labeling(prices_path, len_smooth, horizons, chunk_rows=LABELING_CHUNK_ROWS):
+    """
+    Same labels as utils_data.labeling for every horizon, computed chunk by chunk from the [rows, 2] best ask
+    and bid prices of a whole split saved in prices_path. Yields (start, end, float64 [end - start, horizons])
+    with inf in the rows without a label.
+    """
+    assert len_smooth > 0, "Length must be greater than 0"
+    num_rows = np.load(prices_path, mmap_mode="r").shape[0]
+
+    def percentage_change(start, end, len_smooth, h):
+        # of the labels start..end, the windows reach len_smooth + h - 1 rows further
+        prices = np.load(prices_path, mmap_mode="r")
+        X = np.array(prices[start:end + h + len_smooth - 1], dtype=np.float64)
+        del prices
+        previous_mid_prices = (sliding_window_view(X[:, 0], len_smooth)[:-h] + sliding_window_view(X[:, 1], len_smooth)[:-h]) / 2
+        future_mid_prices = (sliding_window_view(X[:, 0], len_smooth)[h:] + sliding_window_view(X[:, 1], len_smooth)[h:]) / 2
+        previous_mid_prices = np.mean(previous_mid_prices, axis=1)
+        future_mid_prices = np.mean(future_mid_prices, axis=1)
+        return (future_mid_prices - previous_mid_prices) / previous_mid_prices
+
+    # alpha is the average percentage change of the stock over the whole split, so a first pass for every horizon
+    windows, alphas = [], []
+    for h in horizons:
+        assert h > 0, "Horizon must be greater than 0"
+        length = min(len_smooth, h)
+        num_labels = max(num_rows - length + 1 - h, 0)
+        total = sum(np.abs(percentage_change(start, min(start + chunk_rows, num_labels), length, h)).sum()
+                    for start in range(0, num_labels, chunk_rows))
+        windows.append((length, num_labels))
+        alphas.append(total / num_labels / 2 if num_labels else float("nan"))
+
+    counts = np.zeros((len(horizons), 3), dtype=np.int64)
+    for start in range(0, num_rows, chunk_rows):
+        end = min(start + chunk_rows, num_rows)
+        labels = np.full((end - start, len(horizons)), np.inf)
+        for i, (h, (length, num_labels), alpha) in enumerate(zip(horizons, windows, alphas)):
+            last = min(end, num_labels)
+            if start < last:
+                change = percentage_change(start, last, length, h)
+                labels[:last - start, i] = np.where(change < -alpha, 2, np.where(change > alpha, 0, 1))
+                counts[i] += np.bincount(labels[:last - start, i].astype(np.int64), minlength=3)
+        yield start, end, labels
+
+    for h, (_, num_labels), alpha, count in zip(horizons, windows, alphas, counts):
+        print(f"Horizon {h}, alpha: {alpha}")
+        print(f"Number of labels: {count}")
+        print(f"Percentage of labels: {count / max(num_labels, 1)}")
+
+
+def write_split(day_files, path, normalize, price_columns, horizons, len_smooth, chunk_rows=LABELING_CHUNK_ROWS):
+    """
+    Writes the days of a split, spilled as float64 .npy files, into one .npy file with a label column per horizon.
+    normalize(day) normalizes a day in place; price_columns are the best ask and bid price columns the labels
+    are computed from, before the normalization. One day (or label chunk) is held in memory at a time, and
+    the output is mapped again for every write so the pages written before do not stay resident.
+    """
+    shapes = [np.load(f, mmap_mode="r").shape for f in day_files]
+    num_rows = sum(shape[0] for shape in shapes)
+    num_features = shapes[0][1]
+    prices_path = path + ".prices.npy"
+    # allocate the files, they are mapped again for every write
+    open_memmap(path, mode="w+", dtype=np.float64, shape=(num_rows, num_features + len(horizons)))
+    open_memmap(prices_path, mode="w+", dtype=np.float64, shape=(num_rows, 2))
+    try:
+        start = 0
+        for f in day_files:
+            day = np.load(f)
+            end = start + day.shape[0]
+            prices = open_memmap(prices_path, mode="r+")
+            prices[start:end] = day[:, price_columns]
+            del prices
+            normalize(day)
+            # check if there are null values, then raise value error
+            if np.isnan(day).any():
+                raise ValueError("data contains null value")
+            out = open_memmap(path, mode="r+")
+            out[start:end, :num_features] = day
+            del out, day
+            start = end
+        for start, end, labels in streaming_labeling(prices_path, len_smooth, horizons, chunk_rows):
+            out = open_memmap(path, mode="r+")
+            out[start:end, num_features:] = labels
+            del out
+    finally:
+        os.remove(prices_path)
+    print(f"Saved {path} with {num_rows} rows")
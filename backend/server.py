@@ -7,7 +7,15 @@ from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 import io
+import base64
+import asyncio
+import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from starlette.concurrency import run_in_threadpool
 from typing import List, Dict
+from collections import OrderedDict
 import warnings
 import constants as cst
 warnings.filterwarnings('ignore')
@@ -34,6 +42,29 @@ app.add_middleware(
 tlob_model = None
 mlplob_model = None
 
+# Static model metadata returned alongside predictions
+MODEL_METADATA = {
+    'tlob': {
+        'name': 'TLOB (Transformer for Limit Order Books)',
+        'architecture': 'Transformer-based',
+        'sequence_size': 128,
+        'num_layers': 4,
+        'hidden_dim': 40,
+        'num_heads': 1,
+        'features': 40,
+        'description': 'Uses multi-head attention to capture complex temporal patterns'
+    },
+    'mlplob': {
+        'name': 'MLPLOB (Multi-Layer Perceptron LOB)',
+        'architecture': 'MLP-based',
+        'sequence_size': 384,
+        'num_layers': 3,
+        'hidden_dim': 40,
+        'features': 40,
+        'description': 'Efficient baseline model using deep MLP layers'
+    }
+}
+
 def load_models():
     """Load pre-trained TLOB and MLPLOB models"""
     global tlob_model, mlplob_model
@@ -104,6 +135,159 @@ def load_models():
         print(f"Error loading models: {str(e)}")
         raise
 
+def orderbook_df_to_features(df: pd.DataFrame) -> np.ndarray:
+    """
+    Convert orderbook rows to one feature row per snapshot
+    Input columns: timestamp, symbol, bid_qty, bid_price, ask_price, ask_qty
+    Output: [num_snapshots, 40] array
+    """
+    # Convert numeric columns
+    numeric_cols = ['bid_qty', 'bid_price', 'ask_price', 'ask_qty']
+    for col in numeric_cols:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    
+    # Drop rows with NaN values
+    df = df.dropna()
+    
+    # Sort by timestamp
+    df = df.sort_values('timestamp').reset_index(drop=True)
+    
+    # Extract features
+    features = []
+    
+    # Group by timestamp to get order book snapshots
+    grouped = df.groupby('timestamp')
+    
+    for timestamp, group in grouped:
+        # Limit to top 10 levels (20 rows total - 10 bid, 10 ask)
+        group_sorted = group.head(20)
+        
+        # Extract bid and ask data
+        bids = group_sorted[['bid_price', 'bid_qty']].values
+        asks = group_sorted[['ask_price', 'ask_qty']].values
+        
+        # Pad if less than 10 levels
+        if len(bids) < 10:
+            bids = np.pad(bids, ((0, 10 - len(bids)), (0, 0)), mode='constant')
+        if len(asks) < 10:
+            asks = np.pad(asks, ((0, 10 - len(asks)), (0, 0)), mode='constant')
+        
+        bids = bids[:10]
+        asks = asks[:10]
+        
+        # Flatten: [bid_price_1, bid_qty_1, ask_price_1, ask_qty_1, ...]
+        # FI-2010 uses 40 LOB features (10 levels x 4 values per level)
+        snapshot_features = []
+        for i in range(10):
+            snapshot_features.extend([bids[i, 0], bids[i, 1], asks[i, 0], asks[i, 1]])
+        
+        features.append(snapshot_features)
+    
+    # Convert to numpy array
+    return np.array(features, dtype=np.float32)
+
+def _levels_to_array(levels) -> np.ndarray:
+    """Convert per-snapshot [[price, qty], ...] levels to a [T, 10, 2] array"""
+    try:
+        levels = np.asarray(levels, dtype=np.float32)
+    except ValueError:
+        # Ragged depth across snapshots, pad each snapshot on its own
+        padded = np.zeros((len(levels), cst.N_LOB_LEVELS, 2), dtype=np.float32)
+        for i, snapshot in enumerate(levels):
+            try:
+                snapshot = np.asarray(snapshot, dtype=np.float32)
+            except ValueError:
+                snapshot = None
+            if snapshot is None or snapshot.size and (snapshot.ndim != 2 or snapshot.shape[1] != 2):
+                raise ValueError("bids/asks must be shaped [num_snapshots, levels, 2]")
+            snapshot = snapshot.reshape(-1, 2)[:cst.N_LOB_LEVELS]
+            padded[i, :len(snapshot)] = snapshot
+        return padded
+    if levels.ndim == 2 and levels.shape[1] == 0:
+        # Every snapshot has an empty side ([[]] per snapshot): zero levels, padded below
+        levels = levels.reshape(len(levels), 0, 2)
+    if levels.ndim != 3 or levels.shape[2] != 2:
+        raise ValueError("bids/asks must be shaped [num_snapshots, levels, 2]")
+    if levels.shape[1] < cst.N_LOB_LEVELS:
+        levels = np.pad(levels, ((0, 0), (0, cst.N_LOB_LEVELS - levels.shape[1]), (0, 0)), mode='constant')
+    return levels[:, :cst.N_LOB_LEVELS]
+
+def columnar_payload_to_features(request: dict) -> np.ndarray:
+    """
+    Convert a pre-shaped JSON payload to a [num_snapshots, 40] array without pandas
+    Accepted layouts (feature order per level: bid_price, bid_qty, ask_price, ask_qty):
+      {"features": [[40 floats], ...]}
+      {"features_b64": <base64 little-endian float32 [T, 40]>}
+      {"bids": [[[price, qty], ...], ...], "asks": [[[price, qty], ...], ...]}
+    """
+    num_features = cst.N_LOB_LEVELS * cst.LEN_LEVEL
+    if "features_b64" in request:
+        raw = base64.b64decode(request["features_b64"])
+        features = np.frombuffer(raw, dtype='<f4').reshape(-1, num_features)
+    elif "features" in request:
+        features = np.asarray(request["features"], dtype=np.float32)
+        if features.ndim != 2 or features.shape[1] != num_features:
+            raise ValueError(f"features must be shaped [num_snapshots, {num_features}]")
+    else:
+        bids = _levels_to_array(request["bids"])
+        asks = _levels_to_array(request["asks"])
+        if len(bids) != len(asks):
+            raise ValueError("bids and asks must contain the same number of snapshots")
+        features = np.empty((len(bids), num_features), dtype=np.float32)
+        features[:, 0::4] = bids[:, :, 0]
+        features[:, 1::4] = bids[:, :, 1]
+        features[:, 2::4] = asks[:, :, 0]
+        features[:, 3::4] = asks[:, :, 1]
+
+    timestamps = request.get("timestamps")
+    if timestamps is not None:
+        if len(timestamps) != len(features):
+            raise ValueError("timestamps and snapshots have different lengths")
+        timestamps = np.asarray(timestamps)
+        if len(timestamps) > 1 and np.any(np.diff(timestamps) < 0):
+            features = features[np.argsort(timestamps, kind='stable')]
+    return features
+
+def is_columnar_payload(request: dict) -> bool:
+    return any(key in request for key in ("features", "features_b64", "bids", "session_id"))
+
+def features_to_sequences(features_array: np.ndarray, seq_size: int = 128, latest_only: bool = False) -> torch.Tensor:
+    """
+    Normalize [num_snapshots, 40] features and window them
+    Output: [num_sequences, seq_size, 40] tensor, or [1, seq_size, 40] with latest_only
+    """
+    # Replace any inf or nan values
+    features_array = np.nan_to_num(features_array, nan=0.0, posinf=1e6, neginf=-1e6)
+    
+    # Normalize
+    mean = features_array.mean(axis=0)
+    std = features_array.std(axis=0)
+    std = np.where(std < 1e-8, 1.0, std)  # Prevent division by zero
+    features_array = (features_array - mean) / std
+    
+    # Final check for any remaining non-finite values
+    features_array = np.nan_to_num(features_array, nan=0.0, posinf=0.0, neginf=0.0)
+    
+    if latest_only and len(features_array) >= seq_size:
+        # Only the most recent window, e.g. for a live tick on top of a rolling history
+        return torch.from_numpy(np.array(features_array[None, -seq_size:], dtype=np.float32))
+    
+    # Create sequences
+    sequences = []
+    for i in range(len(features_array) - seq_size + 1):
+        sequences.append(features_array[i:i + seq_size])
+    
+    if len(sequences) == 0:
+        # Not enough data, create a single sequence with padding
+        if len(features_array) > 0:
+            padded = np.zeros((seq_size, 40), dtype=np.float32)
+            padded[:len(features_array)] = features_array
+            sequences.append(padded)
+        else:
+            raise ValueError("No valid data found in CSV")
+    
+    return torch.from_numpy(np.array(sequences, dtype=np.float32))
+
 def preprocess_orderbook_csv(df: pd.DataFrame, seq_size: int = 128) -> torch.Tensor:
     """
     Convert orderbook CSV to model input format
@@ -111,86 +295,292 @@ def preprocess_orderbook_csv(df: pd.DataFrame, seq_size: int = 128) -> torch.Ten
     Output: [num_sequences, seq_size, 40] tensor
     """
     try:
-        # Convert numeric columns
-        numeric_cols = ['bid_qty', 'bid_price', 'ask_price', 'ask_qty']
-        for col in numeric_cols:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-        
-        # Drop rows with NaN values
-        df = df.dropna()
-        
-        # Sort by timestamp
-        df = df.sort_values('timestamp').reset_index(drop=True)
-        
-        # Extract features
-        features = []
-        
-        # Group by timestamp to get order book snapshots
-        grouped = df.groupby('timestamp')
-        
-        for timestamp, group in grouped:
-            # Limit to top 10 levels (20 rows total - 10 bid, 10 ask)
-            group_sorted = group.head(20)
-            
-            # Extract bid and ask data
-            bids = group_sorted[['bid_price', 'bid_qty']].values
-            asks = group_sorted[['ask_price', 'ask_qty']].values
-            
-            # Pad if less than 10 levels
-            if len(bids) < 10:
-                bids = np.pad(bids, ((0, 10 - len(bids)), (0, 0)), mode='constant')
-            if len(asks) < 10:
-                asks = np.pad(asks, ((0, 10 - len(asks)), (0, 0)), mode='constant')
-            
-            bids = bids[:10]
-            asks = asks[:10]
-            
-            # Flatten: [bid_price_1, bid_qty_1, ask_price_1, ask_qty_1, ...]
-            # FI-2010 uses 40 LOB features (10 levels x 4 values per level)
-            snapshot_features = []
-            for i in range(10):
-                snapshot_features.extend([bids[i, 0], bids[i, 1], asks[i, 0], asks[i, 1]])
-            
-            features.append(snapshot_features)
-        
-        # Convert to numpy array
-        features_array = np.array(features, dtype=np.float32)
-        
-        # Replace any inf or nan values
-        features_array = np.nan_to_num(features_array, nan=0.0, posinf=1e6, neginf=-1e6)
-        
-        # Normalize
-        mean = features_array.mean(axis=0)
-        std = features_array.std(axis=0)
-        std = np.where(std < 1e-8, 1.0, std)  # Prevent division by zero
-        features_array = (features_array - mean) / std
-        
-        # Final check for any remaining non-finite values
-        features_array = np.nan_to_num(features_array, nan=0.0, posinf=0.0, neginf=0.0)
-        
-        # Create sequences
-        sequences = []
-        for i in range(len(features_array) - seq_size + 1):
-            sequences.append(features_array[i:i + seq_size])
-        
-        if len(sequences) == 0:
-            # Not enough data, create a single sequence with padding
-            if len(features_array) > 0:
-                padded = np.zeros((seq_size, 40), dtype=np.float32)
-                padded[:len(features_array)] = features_array
-                sequences.append(padded)
-            else:
-                raise ValueError("No valid data found in CSV")
-        
-        return torch.from_numpy(np.array(sequences))
-        
+        return features_to_sequences(orderbook_df_to_features(df), seq_size)
     except Exception as e:
         print(f"Error in preprocessing: {str(e)}")
         raise
 
+# Serving profile written by autotune.py: thread counts and batch buckets per model
+SERVING_PROFILE_PATH = os.environ.get("SERVING_PROFILE", os.path.join(cst.DATA_DIR, "serving_profile.json"))
+serving_profile = {}
+model_executors: Dict[str, ThreadPoolExecutor] = {}
+
+def load_serving_profile(path: str = SERVING_PROFILE_PATH):
+    """Apply thread settings and per-model batch buckets from a serving profile, if present"""
+    global serving_profile
+    if not os.path.exists(path):
+        print(f"No serving profile at {path}, using torch defaults")
+        return
+    with open(path) as f:
+        serving_profile = json.load(f)
+    
+    threads = serving_profile.get('threads', {})
+    if threads.get('intra_op'):
+        torch.set_num_threads(threads['intra_op'])
+    if threads.get('inter_op'):
+        # Not written by autotune.py (the batch workers are the model executors below), only set by hand
+        try:
+            torch.set_num_interop_threads(threads['inter_op'])
+        except RuntimeError as e:
+            # Can only be set before any inter-op parallel work has started
+            print(f"Could not set inter-op threads: {e}")
+    
+    for name, model_profile in serving_profile.get('models', {}).items():
+        workers = model_profile.get('workers', 1)
+        if workers > 1:
+            model_executors[name] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{name}-batch")
+    print(f"✓ Serving profile loaded from {path}: {threads}, "
+          f"{ {name: p.get('batch_buckets') for name, p in serving_profile.get('models', {}).items()} }")
+
+def split_into_buckets(num_sequences: int, buckets: List[int]) -> List[int]:
+    """Greedily split num_sequences into chunk sizes taken from the batch buckets"""
+    buckets = sorted(buckets, reverse=True)
+    chunks = []
+    remaining = num_sequences
+    while remaining > 0:
+        size = next((b for b in buckets if b <= remaining), remaining)
+        chunks.append(size)
+        remaining -= size
+    return chunks
+
+def model_forward(name: str, model, model_input: torch.Tensor) -> torch.Tensor:
+    """Forward pass split into the profile's batch buckets, run on the model's pool when it has one"""
+    buckets = serving_profile.get('models', {}).get(name, {}).get('batch_buckets')
+    
+    def forward(batch):
+        with torch.no_grad():
+            return model(batch.to(cst.DEVICE))
+    
+    if not buckets or len(model_input) <= min(buckets):
+        return forward(model_input)
+    batches = torch.split(model_input, split_into_buckets(len(model_input), buckets))
+    executor = model_executors.get(name)
+    if executor is not None and len(batches) > 1:
+        outputs = list(executor.map(forward, batches))
+    else:
+        outputs = [forward(batch) for batch in batches]
+    return torch.cat(outputs, dim=0)
+
+def format_model_output(output: torch.Tensor) -> dict:
+    """Turn model logits into JSON-compliant predictions and probabilities"""
+    probs = torch.softmax(output, dim=1)
+    preds = torch.argmax(probs, dim=1)
+    
+    # Convert to numpy and ensure JSON-compliant values
+    preds_np = preds.cpu().numpy()
+    probs_np = probs.cpu().numpy()
+    
+    # Replace any non-finite values
+    preds_np = np.nan_to_num(preds_np, nan=1, posinf=1, neginf=1).astype(int)
+    probs_np = np.nan_to_num(probs_np, nan=0.33, posinf=1.0, neginf=0.0)
+    
+    return {
+        'predictions': preds_np.tolist(),
+        'probabilities': probs_np.tolist(),
+        'num_predictions': int(len(preds)),
+        'class_names': ['Up', 'Stationary', 'Down']
+    }
+
+def run_model(name: str, model, features_array: np.ndarray, seq_size: int, latest_only: bool = False) -> dict:
+    """Run one model over the snapshot features and return JSON-compliant results"""
+    model_input = features_to_sequences(features_array, seq_size, latest_only)
+    return format_model_output(model_forward(name, model, model_input))
+
+def get_models() -> Dict[str, Engine]:
+    """Registered models by name, in the order they are run"""
+    return {'tlob': tlob_model, 'mlplob': mlplob_model}
+
+def parse_model_names(request: dict) -> List[str]:
+    """Model set requested via the optional "models" field, all models by default"""
+    names = request.get("models")
+    if not names:
+        return list(MODEL_METADATA)
+    unknown = [name for name in names if name not in MODEL_METADATA]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown models: {unknown}")
+    # Keep registry order so equivalent model sets share one fingerprint
+    return [name for name in MODEL_METADATA if name in names]
+
+def predict_from_features(features_array: np.ndarray, summary: dict, model_names: List[str] = None, latest_only: bool = False) -> dict:
+    """Get predictions from the requested models for [num_snapshots, 40] features"""
+    models = get_models()
+    model_names = model_names or list(MODEL_METADATA)
+    results = {}
+    
+    for name in model_names:
+        print(f"Processing with {name.upper()} model...")
+        results[name] = run_model(name, models[name], features_array, MODEL_METADATA[name]['sequence_size'], latest_only)
+    
+    results['summary'] = summary
+    results['model_metadata'] = {name: MODEL_METADATA[name] for name in model_names}
+    return results
+
+def predict_batch_from_features(blocks: List[tuple], model_names: List[str] = None) -> List[dict]:
+    """
+    Predictions for several independent (features_array, summary, latest_only) blocks.
+    Each block is normalized and windowed on its own, then the windows of all
+    blocks go through every model as a single forward pass.
+    """
+    models = get_models()
+    model_names = model_names or list(MODEL_METADATA)
+    results = [{} for _ in blocks]
+    
+    for name in model_names:
+        print(f"Processing {len(blocks)} blocks with {name.upper()} model...")
+        seq_size = MODEL_METADATA[name]['sequence_size']
+        inputs = [features_to_sequences(features_array, seq_size, latest_only) for features_array, _, latest_only in blocks]
+        output = model_forward(name, models[name], torch.cat(inputs, dim=0))
+        for result, block_output in zip(results, torch.split(output, [len(x) for x in inputs])):
+            result[name] = format_model_output(block_output)
+    
+    for result, (_, summary, _) in zip(results, blocks):
+        result['summary'] = summary
+        result['model_metadata'] = {name: MODEL_METADATA[name] for name in model_names}
+    return results
+
+# Single-flight coalescing: identical requests arriving while one is being
+# computed await the same task instead of running the models again
+inflight_predictions: Dict[str, asyncio.Task] = {}
+coalesce_stats = {'computed': 0, 'coalesced': 0}
+
+def prediction_fingerprint(features_array: np.ndarray, summary: dict, model_names: List[str], latest_only: bool = False) -> str:
+    """Hash of the snapshot block, its summary and the model set"""
+    digest = hashlib.sha1(np.ascontiguousarray(features_array, dtype=np.float32).tobytes())
+    digest.update(json.dumps(summary, sort_keys=True, default=str).encode())
+    digest.update(",".join(model_names).encode())
+    digest.update(b"latest" if latest_only else b"all")
+    return digest.hexdigest()
+
+async def predict_coalesced(features_array: np.ndarray, summary: dict, model_names: List[str], latest_only: bool = False) -> dict:
+    """Run predict_from_features off the event loop, sharing the result with in-flight duplicates"""
+    key = prediction_fingerprint(features_array, summary, model_names, latest_only)
+    task = inflight_predictions.get(key)
+    if task is None:
+        coalesce_stats['computed'] += 1
+        task = asyncio.ensure_future(run_in_threadpool(predict_from_features, features_array, summary, model_names, latest_only))
+        inflight_predictions[key] = task
+        task.add_done_callback(lambda _: inflight_predictions.pop(key, None))
+    else:
+        coalesce_stats['coalesced'] += 1
+    # Shield so a disconnecting client does not cancel the work for the others
+    return await asyncio.shield(task)
+
+def rows_summary(df: pd.DataFrame) -> dict:
+    """Aggregate statistics for row-per-level payloads"""
+    return {
+        'total_rows': len(df),
+        'symbol': df['symbol'].iloc[0] if len(df) > 0 else 'Unknown',
+        'time_range': {
+            'start': str(df['timestamp'].min()),
+            'end': str(df['timestamp'].max())
+        }
+    }
+
+def columnar_summary(request: dict, features_array: np.ndarray) -> dict:
+    """Aggregate statistics for pre-shaped payloads, one row per snapshot"""
+    timestamps = request.get("timestamps") or []
+    return {
+        'total_rows': int(len(features_array)),
+        'symbol': request.get("symbol", 'Unknown'),
+        'time_range': {
+            'start': str(min(timestamps)) if timestamps else 'None',
+            'end': str(max(timestamps)) if timestamps else 'None'
+        }
+    }
+
+# Stateful sessions: a client (e.g. the Redis consumer, one session per symbol)
+# ships only the snapshots added since its last call and the server keeps the
+# rolling window. Snapshots carry absolute sequence numbers so a client that is
+# out of sync (server restart, evicted session, lost request) gets a 409 and
+# resends its window with session_reset.
+SESSION_CAPACITY = max(meta['sequence_size'] for meta in MODEL_METADATA.values())
+MAX_SESSIONS = 1024
+prediction_sessions: "OrderedDict[str, PredictionSession]" = OrderedDict()
+
+class SessionConflict(Exception):
+    """The client's session sequence does not match the server's"""
+
+class PredictionSession:
+    """Rolling window of the last `capacity` snapshots of one session"""
+
+    def __init__(self, start_seq: int, capacity: int = SESSION_CAPACITY):
+        self.capacity = capacity
+        # Every row is written twice, so any window is one contiguous slice
+        self.features = np.zeros((2 * capacity, cst.N_LOB_LEVELS * cst.LEN_LEVEL), dtype=np.float32)
+        self.timestamps = np.zeros(2 * capacity, dtype=np.int64)
+        self.start_seq = start_seq
+        self.next_seq = start_seq
+
+    def append(self, features_array: np.ndarray, timestamps) -> None:
+        skipped = max(0, len(features_array) - self.capacity)
+        features_array = features_array[skipped:]
+        positions = (self.next_seq + skipped + np.arange(len(features_array))) % self.capacity
+        timestamps = np.asarray(timestamps, dtype=np.int64)[skipped:]
+        for offset in (0, self.capacity):
+            self.features[positions + offset] = features_array
+            self.timestamps[positions + offset] = timestamps
+        self.next_seq += skipped + len(features_array)
+
+    def window(self) -> tuple:
+        """Copies of the stored snapshots and their timestamps, oldest first"""
+        size = min(self.next_seq - self.start_seq, self.capacity)
+        start = (self.next_seq - size) % self.capacity
+        return self.features[start:start + size].copy(), self.timestamps[start:start + size].tolist()
+
+def apply_session_delta(payload: dict, delta: np.ndarray) -> tuple:
+    """Append a payload's snapshots to its session and return the session window"""
+    session_id = str(payload["session_id"])
+    seq = int(payload.get("session_seq", 0))
+    timestamps = payload.get("timestamps") or [0] * len(delta)
+    session = prediction_sessions.get(session_id)
+    if payload.get("session_reset") or (session is None and seq == 0):
+        session = PredictionSession(seq)
+        prediction_sessions[session_id] = session
+        while len(prediction_sessions) > MAX_SESSIONS:
+            prediction_sessions.popitem(last=False)
+    elif session is None:
+        raise SessionConflict(f"Unknown session {session_id}")
+    elif seq != session.next_seq:
+        raise SessionConflict(f"Session {session_id} expects seq {session.next_seq}, got {seq}")
+    prediction_sessions.move_to_end(session_id)
+    session.append(delta, timestamps)
+    return session.window()
+
+def resolve_payload(payload: dict) -> tuple:
+    """(features_array, summary, latest_only) for a pre-shaped payload, applying session deltas"""
+    features_array = columnar_payload_to_features(payload)
+    if "session_id" in payload:
+        features_array, timestamps = apply_session_delta(payload, features_array)
+        summary = columnar_summary({"symbol": payload.get("symbol", 'Unknown'), "timestamps": timestamps}, features_array)
+    else:
+        summary = columnar_summary(payload, features_array)
+    if len(features_array) == 0:
+        raise ValueError("no snapshots")
+    return features_array, summary, bool(payload.get("latest_only", False))
+
+def wall_ms() -> float:
+    return time.time() * 1000
+
+def elapsed_ms(start: float) -> float:
+    """Milliseconds since a time.perf_counter() value"""
+    return round((time.perf_counter() - start) * 1000, 3)
+
+def trace_result(result: dict, trace, received_ms: float, stages: dict) -> dict:
+    """
+    Result carrying the request's "trace" stamps (see lambda/tracing.py) plus the
+    server's receive/send wall-clock times and per-stage durations in ms
+    """
+    if not isinstance(trace, dict):
+        return result
+    # Coalesced results are shared between requests, each gets its own trace
+    result = dict(result)
+    result['trace'] = {**trace, 'server_received': received_ms, 'server_sent': wall_ms(), 'stages': stages}
+    return result
+
 @app.on_event("startup")
 async def startup_event():
-    """Load models on startup"""
+    """Load serving profile and models on startup"""
+    load_serving_profile()
     load_models()
 
 @app.get("/api/health")
@@ -200,7 +590,9 @@ async def health_check():
         "status": "healthy",
         "tlob_loaded": tlob_model is not None,
         "mlplob_loaded": mlplob_model is not None,
-        "device": str(cst.DEVICE)
+        "device": str(cst.DEVICE),
+        "inflight_predictions": len(inflight_predictions),
+        "coalesce_stats": coalesce_stats
     }
 
 @app.post("/api/predict")
@@ -226,90 +618,7 @@ async def predict(file: UploadFile = File(...)):
                 detail=f"Missing required columns: {missing_cols}"
             )
         
-        # Get predictions from both models
-        results = {}
-        
-        # TLOB predictions (seq_size=128)
-        print("Processing with TLOB model...")
-        tlob_input = preprocess_orderbook_csv(df, seq_size=128)
-        
-        with torch.no_grad():
-            tlob_output = tlob_model(tlob_input.to(cst.DEVICE))
-            tlob_probs = torch.softmax(tlob_output, dim=1)
-            tlob_preds = torch.argmax(tlob_probs, dim=1)
-        
-        # Convert to numpy and ensure JSON-compliant values
-        tlob_preds_np = tlob_preds.cpu().numpy()
-        tlob_probs_np = tlob_probs.cpu().numpy()
-        
-        # Replace any non-finite values
-        tlob_preds_np = np.nan_to_num(tlob_preds_np, nan=1, posinf=1, neginf=1).astype(int)
-        tlob_probs_np = np.nan_to_num(tlob_probs_np, nan=0.33, posinf=1.0, neginf=0.0)
-        
-        results['tlob'] = {
-            'predictions': tlob_preds_np.tolist(),
-            'probabilities': tlob_probs_np.tolist(),
-            'num_predictions': int(len(tlob_preds)),
-            'class_names': ['Up', 'Stationary', 'Down']
-        }
-        
-        # MLPLOB predictions (seq_size=384)
-        print("Processing with MLPLOB model...")
-        mlplob_input = preprocess_orderbook_csv(df, seq_size=384)
-        
-        with torch.no_grad():
-            mlplob_output = mlplob_model(mlplob_input.to(cst.DEVICE))
-            mlplob_probs = torch.softmax(mlplob_output, dim=1)
-            mlplob_preds = torch.argmax(mlplob_probs, dim=1)
-        
-        # Convert to numpy and ensure JSON-compliant values
-        mlplob_preds_np = mlplob_preds.cpu().numpy()
-        mlplob_probs_np = mlplob_probs.cpu().numpy()
-        
-        # Replace any non-finite values
-        mlplob_preds_np = np.nan_to_num(mlplob_preds_np, nan=1, posinf=1, neginf=1).astype(int)
-        mlplob_probs_np = np.nan_to_num(mlplob_probs_np, nan=0.33, posinf=1.0, neginf=0.0)
-        
-        results['mlplob'] = {
-            'predictions': mlplob_preds_np.tolist(),
-            'probabilities': mlplob_probs_np.tolist(),
-            'num_predictions': int(len(mlplob_preds)),
-            'class_names': ['Up', 'Stationary', 'Down']
-        }
-        
-        # Calculate aggregate statistics
-        results['summary'] = {
-            'total_rows': len(df),
-            'symbol': df['symbol'].iloc[0] if len(df) > 0 else 'Unknown',
-            'time_range': {
-                'start': str(df['timestamp'].min()),
-                'end': str(df['timestamp'].max())
-            }
-        }
-        
-        # Add model metadata
-        results['model_metadata'] = {
-            'tlob': {
-                'name': 'TLOB (Transformer for Limit Order Books)',
-                'architecture': 'Transformer-based',
-                'sequence_size': 128,
-                'num_layers': 4,
-                'hidden_dim': 40,
-                'num_heads': 1,
-                'features': 40,
-                'description': 'Uses multi-head attention to capture complex temporal patterns'
-            },
-            'mlplob': {
-                'name': 'MLPLOB (Multi-Layer Perceptron LOB)',
-                'architecture': 'MLP-based',
-                'sequence_size': 384,
-                'num_layers': 3,
-                'hidden_dim': 40,
-                'features': 40,
-                'description': 'Efficient baseline model using deep MLP layers'
-            }
-        }
-        
+        results = predict_from_features(orderbook_df_to_features(df), rows_summary(df))
         return JSONResponse(content=results)
         
     except Exception as e:
@@ -321,8 +630,35 @@ async def predict_json(request: dict):
     """
     Accept JSON order book data and get predictions from both models
     Expected format: {"data": [{"timestamp": ..., "symbol": ..., "bid_qty": ..., "bid_price": ..., "ask_price": ..., "ask_qty": ...}, ...]}
+    or a pre-shaped payload (see columnar_payload_to_features):
+    {"symbol": ..., "timestamps": [...], "bids": [[[price, qty], ...], ...], "asks": [...]}
+    {"symbol": ..., "timestamps": [...], "features": [[40 floats], ...]}
+    "latest_only": true predicts only the most recent window of each model.
+    "session_id"/"session_seq" append the snapshots to a server-side rolling window
+    (see apply_session_delta); a 409 means the client must resend with "session_reset".
+    An optional "models" list (e.g. ["tlob"]) restricts the models that are run.
+    Identical requests in flight at the same time are computed once.
+    A "trace" object is returned with server timings added (pre-shaped payloads).
     """
     try:
+        received_ms = wall_ms()
+        model_names = parse_model_names(request)
+        
+        if is_columnar_payload(request):
+            start = time.perf_counter()
+            try:
+                features_array, summary, latest_only = resolve_payload(request)
+            except SessionConflict as e:
+                raise HTTPException(status_code=409, detail=str(e))
+            except (KeyError, ValueError) as e:
+                raise HTTPException(status_code=400, detail=f"Invalid order book payload: {e}")
+            decode_ms = elapsed_ms(start)
+            start = time.perf_counter()
+            results = await predict_coalesced(features_array, summary, model_names, latest_only)
+            results = trace_result(results, request.get("trace"), received_ms,
+                                   {'decode': decode_ms, 'inference': elapsed_ms(start)})
+            return JSONResponse(content=results)
+        
         # Extract data from request
         data_list = request.get("data", [])
         
@@ -341,92 +677,59 @@ async def predict_json(request: dict):
                 detail=f"Missing required columns: {missing_cols}"
             )
         
-        # Get predictions from both models
-        results = {}
-        
-        # TLOB predictions (seq_size=128)
-        print("Processing with TLOB model...")
-        tlob_input = preprocess_orderbook_csv(df, seq_size=128)
-        
-        with torch.no_grad():
-            tlob_output = tlob_model(tlob_input.to(cst.DEVICE))
-            tlob_probs = torch.softmax(tlob_output, dim=1)
-            tlob_preds = torch.argmax(tlob_probs, dim=1)
-        
-        # Convert to numpy and ensure JSON-compliant values
-        tlob_preds_np = tlob_preds.cpu().numpy()
-        tlob_probs_np = tlob_probs.cpu().numpy()
-        
-        # Replace any non-finite values
-        tlob_preds_np = np.nan_to_num(tlob_preds_np, nan=1, posinf=1, neginf=1).astype(int)
-        tlob_probs_np = np.nan_to_num(tlob_probs_np, nan=0.33, posinf=1.0, neginf=0.0)
-        
-        results['tlob'] = {
-            'predictions': tlob_preds_np.tolist(),
-            'probabilities': tlob_probs_np.tolist(),
-            'num_predictions': int(len(tlob_preds)),
-            'class_names': ['Up', 'Stationary', 'Down']
-        }
-        
-        # MLPLOB predictions (seq_size=384)
-        print("Processing with MLPLOB model...")
-        mlplob_input = preprocess_orderbook_csv(df, seq_size=384)
-        
-        with torch.no_grad():
-            mlplob_output = mlplob_model(mlplob_input.to(cst.DEVICE))
-            mlplob_probs = torch.softmax(mlplob_output, dim=1)
-            mlplob_preds = torch.argmax(mlplob_probs, dim=1)
-        
-        # Convert to numpy and ensure JSON-compliant values
-        mlplob_preds_np = mlplob_preds.cpu().numpy()
-        mlplob_probs_np = mlplob_probs.cpu().numpy()
-        
-        # Replace any non-finite values
-        mlplob_preds_np = np.nan_to_num(mlplob_preds_np, nan=1, posinf=1, neginf=1).astype(int)
-        mlplob_probs_np = np.nan_to_num(mlplob_probs_np, nan=0.33, posinf=1.0, neginf=0.0)
-        
-        results['mlplob'] = {
-            'predictions': mlplob_preds_np.tolist(),
-            'probabilities': mlplob_probs_np.tolist(),
-            'num_predictions': int(len(mlplob_preds)),
-            'class_names': ['Up', 'Stationary', 'Down']
-        }
-        
-        # Calculate aggregate statistics
-        results['summary'] = {
-            'total_rows': len(df),
-            'symbol': df['symbol'].iloc[0] if len(df) > 0 else 'Unknown',
-            'time_range': {
-                'start': str(df['timestamp'].min()),
-                'end': str(df['timestamp'].max())
-            }
-        }
-        
-        # Add model metadata
-        results['model_metadata'] = {
-            'tlob': {
-                'name': 'TLOB (Transformer for Limit Order Books)',
-                'architecture': 'Transformer-based',
-                'sequence_size': 128,
-                'num_layers': 4,
-                'hidden_dim': 40,
-                'num_heads': 1,
-                'features': 40,
-                'description': 'Uses multi-head attention to capture complex temporal patterns'
-            },
-            'mlplob': {
-                'name': 'MLPLOB (Multi-Layer Perceptron LOB)',
-                'architecture': 'MLP-based',
-                'sequence_size': 384,
-                'num_layers': 3,
-                'hidden_dim': 40,
-                'features': 40,
-                'description': 'Efficient baseline model using deep MLP layers'
-            }
-        }
-        
+        results = await predict_coalesced(orderbook_df_to_features(df), rows_summary(df), model_names)
         return JSONResponse(content=results)
         
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Prediction error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/predict-batch")
+async def predict_batch(request: dict):
+    """
+    Predictions for several pre-shaped payloads in one call, e.g. a drained queue backlog
+    Expected format: {"requests": [<pre-shaped /api/predict-json payload>, ...], "models": [...]}
+    Returns {"results": [...]} in request order; invalid payloads get {"error": ...},
+    session conflicts additionally carry "session_conflict": true.
+    Payloads with a "trace" object get it back with server timings; "inference"
+    is the shared forward pass of the whole batch
+    """
+    try:
+        received_ms = wall_ms()
+        model_names = parse_model_names(request)
+        payloads = request.get("requests", [])
+        if not payloads:
+            raise HTTPException(status_code=400, detail="No data provided")
+        
+        blocks, positions, results = [], [], [None] * len(payloads)
+        decode_ms = [0.0] * len(payloads)
+        for i, payload in enumerate(payloads):
+            start = time.perf_counter()
+            try:
+                blocks.append(resolve_payload(payload))
+            except SessionConflict as e:
+                results[i] = {'error': str(e), 'session_conflict': True}
+                continue
+            except (KeyError, ValueError) as e:
+                results[i] = {'error': f"Invalid order book payload: {e}"}
+                continue
+            decode_ms[i] = elapsed_ms(start)
+            positions.append(i)
+        
+        if blocks:
+            start = time.perf_counter()
+            predictions = await run_in_threadpool(predict_batch_from_features, blocks, model_names)
+            inference_ms = elapsed_ms(start)
+            for i, prediction in zip(positions, predictions):
+                results[i] = trace_result(prediction, payloads[i].get("trace"), received_ms,
+                                          {'decode': decode_ms[i], 'inference': inference_ms})
+        
+        return JSONResponse(content={'results': results})
+    
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Prediction error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,120 @@
+"""order_depths and signed_directions against the per-row loop and .apply they replaced"""
+import constants as cst  # noqa: F401, imported first like the entry points do
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.lobster import make_day
+from preprocessing.lobster import order_depths, signed_directions
+
+
+def loop_depths(prices, directions, event_types, bid_sides, ask_sides):
+    """The per-row loop of _preprocess_message_orderbook before order_depths"""
+    depths = np.zeros(len(prices), dtype=int)
+    for j in range(1, len(prices)):
+        order_price = prices[j]
+        direction = directions[j]
+        event_type = event_types[j]
+
+        index = j if event_type == 1 else j - 1
+
+        if direction == 1:
+            bid_price = bid_sides[index, 0]
+            depth = (bid_price - order_price) // 100
+        else:
+            ask_price = ask_sides[index, 0]
+            depth = (order_price - ask_price) // 100
+
+        depths[j] = max(depth, 0)
+    return depths
+
+
+def apply_directions(messages):
+    """The .apply of _preprocess_message_orderbook before signed_directions"""
+    return messages["direction"] * messages["event_type"].apply(lambda x: -1 if x == 4 else 1)
+
+
+def check_depths(messages, orderbook):
+    prices, directions, event_types = (messages[name].values for name in ("price", "direction", "event_type"))
+    bid_sides = orderbook.iloc[:, 2::4].values
+    ask_sides = orderbook.iloc[:, 0::4].values
+    expected = loop_depths(prices, directions, event_types, bid_sides, ask_sides)
+    depths = order_depths(prices, directions, event_types, bid_sides[:, 0], ask_sides[:, 0])
+    assert depths.dtype == expected.dtype
+    np.testing.assert_array_equal(depths, expected)
+    return depths
+
+
+def check_directions(messages):
+    expected = apply_directions(messages)
+    directions = signed_directions(messages["direction"].values, messages["event_type"].values)
+    np.testing.assert_array_equal(directions, expected.values)
+    assert directions.dtype == expected.dtype
+
+
+def frames(rows):
+    """(messages, orderbook) of (event_type, direction, price, best_ask, best_bid) rows with one level"""
+    event_types, directions, prices, asks, bids = np.array(rows, dtype=np.int64).reshape(-1, 5).T
+    messages = pd.DataFrame({"time": np.arange(len(rows), dtype=float), "event_type": event_types,
+                             "order_id": np.arange(len(rows)), "size": np.ones(len(rows), dtype=np.int64),
+                             "price": prices, "direction": directions})
+    orderbook = pd.DataFrame({"sell1": asks, "vsell1": 1, "buy1": bids, "vbuy1": 1})
+    return messages, orderbook
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_synthetic_days(seed):
+    messages, orderbook = make_day(5000, seed=seed)
+    assert check_depths(messages, orderbook).any()
+    check_directions(messages)
+
+
+def test_float_prices():
+    messages, orderbook = make_day(2000, seed=3)
+    messages["price"] = messages["price"].astype(np.float64)
+    check_depths(messages, orderbook.astype(np.float64))
+
+
+def test_new_orders_use_the_book_after_the_event():
+    # the best quotes move by 5 ticks at row 1 and row 2: new orders (event 1) see the new book,
+    # cancellations and executions the book before them
+    messages, orderbook = frames([
+        (1, 1, 1_999_900, 2_000_000, 1_999_900),
+        (1, 1, 1_999_000, 2_000_500, 2_000_400),
+        (3, 1, 1_999_000, 2_001_000, 2_000_900),
+        (1, -1, 2_002_000, 2_000_000, 1_999_900),
+        (4, -1, 2_002_000, 2_003_000, 2_002_900),
+    ])
+    depths = check_depths(messages, orderbook)
+    np.testing.assert_array_equal(depths, [0, 14, 14, 20, 20])
+
+
+@pytest.mark.parametrize("event_type", [1, 2, 3, 4, 5])
+def test_event_types(event_type):
+    messages, orderbook = make_day(1000, seed=event_type)
+    messages["event_type"] = event_type
+    check_depths(messages, orderbook)
+    check_directions(messages)
+
+
+def test_prices_past_the_best_quote():
+    # orders priced through the other side or between the quotes have no depth
+    messages, orderbook = frames([
+        (1, 1, 1_999_900, 2_000_000, 1_999_900),
+        (1, 1, 2_000_100, 2_000_000, 1_999_900),
+        (2, -1, 1_999_800, 2_000_000, 1_999_900),
+        (1, 1, 1_999_950, 2_000_000, 1_999_900),
+        (3, -1, 2_000_050, 2_000_000, 1_999_900),
+        (1, -1, 2_000_250, 2_000_000, 1_999_900),
+    ])
+    depths = check_depths(messages, orderbook)
+    np.testing.assert_array_equal(depths, [0, 0, 0, 0, 0, 2])
+
+
+@pytest.mark.parametrize("num_rows", [0, 1, 2])
+def test_short_days(num_rows):
+    messages, orderbook = frames([(4, 1, 1_999_800, 2_000_000, 1_999_900),
+                                  (4, -1, 2_000_300, 2_000_000, 1_999_900)][:num_rows])
+    depths = check_depths(messages, orderbook)
+    assert len(depths) == num_rows and not depths[:1].any()
+    check_directions(messages)
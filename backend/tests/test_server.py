@@ -0,0 +1,41 @@
+"""Pre-shaped /api/predict-json payloads as model features"""
+import numpy as np
+import pytest
+
+import constants as cst
+from server import columnar_payload_to_features
+
+
+def test_levels_are_interleaved_and_padded():
+    features = columnar_payload_to_features({"bids": [[[100.0, 1.0], [99.0, 3.0]]], "asks": [[[101.0, 2.0]]]})
+    assert features.shape == (1, cst.N_LOB_LEVELS * cst.LEN_LEVEL)
+    np.testing.assert_array_equal(features[0, :8], [100.0, 1.0, 101.0, 2.0, 99.0, 3.0, 0.0, 0.0])
+    assert not features[0, 8:].any()
+
+
+def test_empty_side():
+    # transform_orderbook_to_columnar sends [[]] for a side without levels
+    features = columnar_payload_to_features({"bids": [[]], "asks": [[[101.0, 2.0]]]})
+    np.testing.assert_array_equal(features[0, :4], [0.0, 0.0, 101.0, 2.0])
+    assert not features[0, 4:].any()
+
+
+def test_empty_sides_in_some_snapshots():
+    features = columnar_payload_to_features({"bids": [[], [[100.0, 1.0]]], "asks": [[[101.0, 2.0]], []]})
+    np.testing.assert_array_equal(features[:, :4], [[0.0, 0.0, 101.0, 2.0], [100.0, 1.0, 0.0, 0.0]])
+    assert not columnar_payload_to_features({"bids": [[], []], "asks": [[], []]}).any()
+
+
+def test_malformed_levels():
+    with pytest.raises(ValueError):
+        columnar_payload_to_features({"bids": [[[100.0, 1.0, 5.0]]], "asks": [[[101.0, 2.0]]]})
+    with pytest.raises(ValueError):
+        columnar_payload_to_features({"bids": [[[100.0, 1.0]]], "asks": [[[101.0, 2.0]], [[102.0, 1.0]]]})
+
+
+def test_malformed_snapshot_among_ragged_levels():
+    # a flat snapshot of the right size must not be reshaped into levels
+    with pytest.raises(ValueError, match="shaped"):
+        columnar_payload_to_features({"bids": [[[100.0, 1.0], [99.0, 2.0]], [100.0, 1.0, 99.0, 2.0]], "asks": [[[101.0, 2.0]], [[101.0, 2.0]]]})
+    with pytest.raises(ValueError, match="shaped"):
+        columnar_payload_to_features({"bids": [[[100.0, 1.0], [99.0, 2.0]], [[100.0, 1.0], [99.0]]], "asks": [[[101.0, 2.0]], [[101.0, 2.0]]]})
@@ -1,38 +1,42 @@
 import pandas as pd
 import numpy as np
 import os
+import sys
 
 import torch
 import pandas
 import constants as cst
 
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
 
 def z_score_orderbook(data, mean_size=None, mean_prices=None, std_size=None, std_prices=None):
     """ DONE: remember to use the mean/std of the training set, to z-normalize the test set. """
+    # all the sizes and all the prices as one float64 array, the statistics are over all their values
+    values = data.to_numpy(dtype=np.float64, copy=True)
+    sizes = values[:, 1::2]
+    prices = values[:, 0::2]
     if (mean_size is None) or (std_size is None):
-        mean_size = data.iloc[:, 1::2].stack().mean()
-        std_size = data.iloc[:, 1::2].stack().std()
+        mean_size = sizes.mean()
+        std_size = sizes.std(ddof=1)
 
     #do the same thing for prices
     if (mean_prices is None) or (std_prices is None):
-        mean_prices = data.iloc[:, 0::2].stack().mean() #price
-        std_prices = data.iloc[:, 0::2].stack().std() #price
-
-    # apply the z score to the original data using .loc with explicit float cast
-    price_cols = data.columns[0::2]
-    size_cols = data.columns[1::2]
+        mean_prices = prices.mean() #price
+        std_prices = prices.std(ddof=1) #price
 
     #apply the z score to the original data
-    for col in size_cols:
-        data[col] = data[col].astype("float64")
-        data[col] = (data[col] - mean_size) / std_size
-
-    for col in price_cols:
-        data[col] = data[col].astype("float64")
-        data[col] = (data[col] - mean_prices) / std_prices
+    sizes -= mean_size
+    sizes /= std_size
+    prices -= mean_prices
+    prices /= std_prices
+    data = pd.DataFrame(values, index=data.index, columns=data.columns)
 
     # check if there are null values, then raise value error
-    if data.isnull().values.any():
+    if np.isnan(values).any():
         raise ValueError("data contains null value")
 
     return data, mean_size, mean_prices, std_size,  std_prices
@@ -83,6 +87,85 @@ def reset_indexes(dataframes):
 
  
 
+def peak_memory_mb():
+    # peak resident memory of this process and of its largest finished child process, in MB
+    if resource is None:
+        return None, None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit / 2**20
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit / 2**20
+    return own, children
+
+
+def total_memory_mb():
+    # physical memory of the machine in MB, None where sysconf does not report it
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def _process_tree(pid):
+    # pid and the pids of all its descendants, from the parent pids in /proc
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open("/proc/{}/stat".format(entry)) as f:
+                # the command name in parentheses may hold spaces, the parent pid is the second field after it
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    tree, stack = [], [pid]
+    while stack:
+        pid = stack.pop()
+        tree.append(pid)
+        stack.extend(children.get(pid, []))
+    return tree
+
+
+def _private_mb(pid):
+    # resident memory of a process in MB that no other process shares (unique set size): the pages inherited by fork
+    # count once they are copied on write, the libraries and the interpreter do not. 0 once the process is gone
+    private_kb = 0
+    try:
+        with open("/proc/{}/smaps_rollup".format(pid)) as f:
+            for line in f:
+                if line.startswith("Private_"):
+                    private_kb += int(line.split()[1])
+    except OSError:
+        pass
+    return private_kb / 1024
+
+
+def memory_check(budget_mb):
+    # returns a function that raises MemoryError once this process and the processes it started hold more than
+    # budget_mb MB of private physical memory on top of what they hold now (see _private_mb). The resident memory is
+    # checked, not the address space (RLIMIT_AS), which thread stacks, malloc arenas and the threads of pyarrow reserve
+    # without using it. The caller checks between two steps of its work, so a step can overshoot the budget before the
+    # error. Does nothing without a budget or off Linux, where /proc does not report the resident memory
+    if budget_mb is None or not os.path.exists("/proc/self/smaps_rollup"):
+        return lambda: None
+    pid = os.getpid()
+    baseline = sum(_private_mb(p) for p in _process_tree(pid))
+
+    def check():
+        used = sum(_private_mb(p) for p in _process_tree(pid)) - baseline
+        if used > budget_mb:
+            raise MemoryError("{:.0f} MB used over the budget of {:.0f} MB".format(used, budget_mb))
+
+    return check
+
+
+def print_peak_memory():
+    own, children = peak_memory_mb()
+    if own is not None:
+        print(f"Peak memory: {own:.0f} MB in the main process, {children:.0f} MB in the largest worker process")
+
+
 def unnormalize(x, mean, std):
     return x * std + mean
 
@@ -104,26 +187,54 @@ def tanh_encoding_type(data):
     return data
 
 
-def to_sparse_representation(lob, n_levels):
-    if not isinstance(lob, np.ndarray):
-        lob = np.array(lob)
-    sparse_lob = np.zeros(n_levels * 2)
-    for j in range(lob.shape[0] // 2):
-        if j % 2 == 0:
-            ask_price = lob[0]
-            current_ask_price = lob[j*2]
-            depth = (current_ask_price - ask_price) // 100
-            if depth < n_levels and int(lob[j*2]) != 0:
-                sparse_lob[2*int(depth)] = lob[j*2+1]
-        else:
-            bid_price = lob[2]
-            current_bid_price = lob[j*2]
-            depth = (bid_price - current_bid_price) // 100
-            if depth < n_levels and int(lob[j*2]) != 0:
-                sparse_lob[2*int(depth)+1] = lob[j*2+1]
+# rows to_sparse_representation converts at once, few enough for the temporary arrays to stay in the CPU cache
+SPARSE_CHUNK_ROWS = 8192
+
+
+def to_sparse_representation(orderbook, tick_size, n_ticks=None):
+    """
+    Volumes of the orderbook rows (sell, vsell, buy, vbuy of every level) on a fixed grid of n_ticks ticks per side
+    around the mid price, as many columns as the dense orderbook by default: column 2k is the ask volume k whole
+    ticks above the mid price, column 2k + 1 the bid volume k whole ticks below it, 0 where there is no order.
+    The levels beyond the grid are dropped.
+    """
+    orderbook = np.asarray(orderbook)
+    if n_ticks is None:
+        n_ticks = orderbook.shape[1] // 2
+    sparse_lob = np.zeros((orderbook.shape[0], 2 * n_ticks), dtype=np.float64)
+    for start in range(0, orderbook.shape[0], SPARSE_CHUNK_ROWS):
+        end = start + SPARSE_CHUNK_ROWS
+        _scatter_sparse(orderbook[start:end], tick_size, sparse_lob[start:end])
     return sparse_lob
 
 
+def _scatter_sparse(orderbook, tick_size, sparse_lob):
+    # writes the volumes of the orderbook rows into the zeroed rows of sparse_lob, at their offset from the mid price
+    num_rows, width = sparse_lob.shape
+    # twice the mid price in ticks, the distances of the tick aligned prices from it are whole numbers of half ticks
+    mid_prices = (orderbook[:, 0:1] + orderbook[:, 2:3]) / tick_size
+    row_starts = np.arange(0, num_rows * width, width)[:, None]
+    flat_lob = sparse_lob.reshape(-1)
+    for prices, sizes, sign, side in ((orderbook[:, 0::4], orderbook[:, 1::4], 1, 0),
+                                      (orderbook[:, 2::4], orderbook[:, 3::4], -1, 1)):
+        half_ticks = np.rint(sign * (2 / tick_size * prices - mid_prices)).astype(np.int64)
+        offsets = half_ticks >> 1
+        on_grid = (offsets >= 0) & (offsets < width // 2)
+        flat_lob[(row_starts + 2 * offsets + side)[on_grid]] = sizes[on_grid]
+
+
+def z_score_sparse(data, mean_volume=None, std_volume=None):
+    # z score of all the columns of a sparse representation with the same statistics, of the training set
+    values = data.values
+    if (mean_volume is None) or (std_volume is None):
+        mean_volume = values.mean()
+        std_volume = values.std(ddof=1)
+    data = pd.DataFrame((values - mean_volume) / std_volume, index=data.index, columns=data.columns)
+    if data.isnull().values.any():
+        raise ValueError("data contains null value")
+    return data, mean_volume, std_volume
+
+
 def labeling(X, len, h):
     # X is the orderbook
     # len is the time window smoothing length
@@ -36,11 +36,17 @@ export interface AnalysisResults {
 }
 
 // WebSocket Live Prediction Types
+// The consumer publishes trimmed results by default: the newest prediction per
+// model plus symbol and snapshot time, without summary or model metadata
+export type LiveModelPrediction = Pick<ModelPrediction, "predictions" | "probabilities"> & Partial<ModelPrediction>
+
 export interface LivePrediction {
-  summary: Summary
-  tlob: ModelPrediction
-  mlplob: ModelPrediction
-  model_metadata: {
+  symbol?: string
+  ts?: number | null
+  summary?: Summary
+  tlob: LiveModelPrediction
+  mlplob: LiveModelPrediction
+  model_metadata?: {
     tlob: ModelMetadata
     mlplob: ModelMetadata
   }
@@ -0,0 +1,147 @@
+"""
+Benchmark and check the depth-diff order book (book.py)
+
+Applies a recorded file of depthUpdate events and snapshots (JSON lines, the
+format --source book --book-file replays) or a synthetic diff stream with
+missed events and resync snapshots, and reports updates per second. Synthetic
+streams are checked against a reference dict book first; --write saves them
+so they can be replayed through the consumer.
+
+Run from the lambda directory:
+    python -m benchmarks.book --events 100000 --updates 20
+    python -m benchmarks.book --input depth_diffs.jsonl
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from book import BookSync
+from history import N_LOB_LEVELS
+
+
+def make_events(num_events, updates_per_event, depth, gap_every, symbol="BTCUSDT", seed=0):
+    """
+    Synthetic depth diffs around a fixed mid price, as (lines, final reference book).
+    The stream starts with diffs the first snapshot partly covers; every gap_every
+    events one event is lost and a newer snapshot follows a few events later.
+    """
+    rng = np.random.default_rng(seed)
+    mid = 100_000  # in ticks of 0.01
+    books = {"b": {}, "a": {}}
+
+    def qty():
+        # As printed in the messages, never rounded down to a removal
+        return max(round(float(rng.exponential(1.0)), 4), 0.0001)
+
+    for k in range(1, depth + 1):
+        books["b"][mid - k] = qty()
+        books["a"][mid + k] = qty()
+
+    def price(tick):
+        return f"{tick / 100:.2f}"
+
+    def snapshot(update_id):
+        return {"symbol": symbol, "lastUpdateId": update_id,
+                "bids": [[price(t), f"{q:.4f}"] for t, q in sorted(books["b"].items(), reverse=True)],
+                "asks": [[price(t), f"{q:.4f}"] for t, q in sorted(books["a"].items())]}
+
+    lines, resync_at, last_id = [], None, 1000
+    first_snapshot = snapshot(last_id)
+    for i in range(num_events):
+        first = last_id + 1
+        last_id = first + int(rng.integers(0, 3))
+        event = {"e": "depthUpdate", "E": 1_700_000_000_000 + 100 * i, "s": symbol, "U": first, "u": last_id,
+                 "b": [], "a": []}
+        for _ in range(updates_per_event):
+            side = "b" if rng.random() < 0.5 else "a"
+            roll = rng.random()
+            # Most updates hit the levels close to the top
+            offset = int(rng.integers(1, 50 if roll < 0.6 else depth + 1))
+            tick = mid - offset if side == "b" else mid + offset
+            if 0.6 <= roll < 0.8:
+                # Removal, Binance also sends these for levels the book no longer has
+                books[side].pop(tick, None)
+                event[side].append([price(tick), "0.00000000"])
+                continue
+            books[side][tick] = qty()
+            event[side].append([price(tick), f"{books[side][tick]:.4f}"])
+        if i == 3:
+            # Subscribed before the snapshot: it lands after the stream's first events
+            lines.append(first_snapshot)
+        if gap_every and i % gap_every == gap_every - 1 and i + 3 < num_events:
+            # Lost event: the book resyncs from a snapshot taken a few events later,
+            # the events buffered meanwhile are already covered by it
+            resync_at = i + 3
+            continue
+        lines.append(event)
+        if i == resync_at:
+            lines.append(snapshot(last_id))
+    return lines, books
+
+
+def reference_levels(books, num_levels):
+    levels = np.zeros((num_levels, 4))
+    for column, side in ((0, "b"), (2, "a")):
+        for row, (tick, qty) in enumerate(sorted(books[side].items(), reverse=side == "b")[:num_levels]):
+            levels[row, column:column + 2] = (tick / 100, qty)
+    return levels
+
+
+def run(lines, emit_every):
+    """Feed every line through BookSync, returns (seconds, syncs by symbol)"""
+    syncs = {}
+    start = time.perf_counter()
+    for i, line in enumerate(lines):
+        if "lastUpdateId" in line:
+            symbol = line["symbol"]
+            syncs.setdefault(symbol, BookSync(symbol)).on_snapshot(line)
+            continue
+        sync = syncs.setdefault(line["s"], BookSync(line["s"]))
+        if sync.on_diff(line) and i % emit_every == 0:
+            sync.book.levels(N_LOB_LEVELS)
+    return time.perf_counter() - start, syncs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the depth-diff order book")
+    parser.add_argument("--input", default=None, help="recorded depthUpdate events and snapshots as JSON lines")
+    parser.add_argument("--events", type=int, default=50_000, help="synthetic events")
+    parser.add_argument("--updates", type=int, default=20, help="level updates per synthetic event")
+    parser.add_argument("--depth", type=int, default=1000, help="synthetic levels per side")
+    parser.add_argument("--gap-every", type=int, default=10_000, help="synthetic events between lost events, 0 never")
+    parser.add_argument("--emit-every", type=int, default=10, help="events between top-10 extractions")
+    parser.add_argument("--write", default=None, help="save the synthetic stream as JSON lines")
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input) as f:
+            lines = [json.loads(line) for line in f if line.strip()]
+        books = None
+    else:
+        lines, books = make_events(args.events, args.updates, args.depth, args.gap_every)
+        if args.write:
+            with open(args.write, "w") as f:
+                f.writelines(json.dumps(line) + "\n" for line in lines)
+            print(f"Synthetic stream saved to {args.write}")
+
+    elapsed, syncs = run(lines, args.emit_every)
+    if books is not None:
+        (sync,) = syncs.values()
+        assert not sync.needs_snapshot, "book left unsynced"
+        assert np.allclose(sync.book.levels(args.depth), reference_levels(books, args.depth)), "book differs from reference"
+        print(f"Book matches the reference over {args.depth} levels per side")
+    for symbol, sync in syncs.items():
+        stats = sync.stats
+        print(f"{symbol}: {stats['applied']} events applied, {stats['dropped']} dropped, "
+              f"{stats['resyncs']} resyncs, {stats['snapshots']} snapshots, "
+              f"{len(sync.book.bids)}/{len(sync.book.asks)} bid/ask levels")
+    events = sum(sync.stats["applied"] for sync in syncs.values())
+    levels = sum(sync.stats["levels"] for sync in syncs.values())
+    print(f"{elapsed:.3f}s: {events / elapsed:,.0f} events/s, {levels / elapsed:,.0f} level updates/s "
+          f"(top-{N_LOB_LEVELS} every {args.emit_every} events)")
+
+
+if __name__ == "__main__":
+    main()
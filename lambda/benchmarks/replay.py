@@ -0,0 +1,235 @@
+"""
+Replay order book snapshots through the consumer without Redis or a backend server
+
+Snapshots, either recorded lob_queue messages (JSON lines as the orchestrator
+pushes them) or a synthetic random walk per symbol, are pushed to an in-memory
+Redis stand-in (fakeredis) on their recorded schedule, sped up by --speed
+(1 = real time, 10 = ten times faster, 0 = as fast as possible). They are consumed
+by consumer.AsyncConsumer with the backend app running in this process, over
+ASGI (--mode http) or embedded (--mode embedded), and results are received
+like the orchestrator does (subscribed to predictions:*). Reports sustained throughput, queue growth and per-hop
+latency percentiles; every consumer flag applies.
+
+Run from the lambda directory (needs fakeredis and the backend requirements):
+    python -m benchmarks.replay --random-weights --symbols 4 --snapshots 200 --interval-ms 100 --speed 0
+    python -m benchmarks.replay --input lob_queue.jsonl --speed 10 --batch-size 8 --history window
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from consumer import RESULTS_CHANNEL, AsyncConsumer, HttpBackend, build_parser
+from embedded import BACKEND_DIR
+from main import LOB_QUEUE
+from sources import ListSource, StreamSource, publish_orderbook
+from tracing import TraceCollector, stamp
+from wire import FORMATS, decode_result, encode_orderbook
+
+try:
+    import fakeredis
+except ImportError:  # only needed by this harness
+    fakeredis = None
+
+
+def load_snapshots(path):
+    """Recorded order book messages, one JSON object per line, oldest first"""
+    with open(path) as f:
+        snapshots = [json.loads(line) for line in f if line.strip()]
+    for i, snapshot in enumerate(snapshots):
+        # Replay schedule from the recorded ingest times, 1 s apart when missing
+        snapshot.setdefault("ingest_ts", snapshots[i - 1]["ingest_ts"] + 1000 if i else 0)
+    return snapshots
+
+
+def make_snapshots(num_symbols, num_snapshots, interval_ms, num_levels, repeat=0.0, seed=42):
+    """
+    Synthetic Binance depth messages: a random walk per symbol, one snapshot every interval_ms;
+    with probability `repeat` a snapshot's book is the same as the previous one (quiet market)
+    """
+    rng = np.random.default_rng(seed)
+    ticks = np.arange(1, num_levels + 1) * 0.01
+    snapshots = []
+    for s in range(num_symbols):
+        mid = 100.0 * (s + 1) + np.cumsum(rng.normal(0, 0.02, num_snapshots))
+        quantities = rng.exponential(1.0, (num_snapshots, 2, num_levels))
+        for i in range(num_snapshots):
+            if i and rng.random() < repeat:
+                mid[i], quantities[i] = mid[i - 1], quantities[i - 1]
+            snapshots.append({
+                "symbol": f"SYM{s}USDT",
+                "ingest_ts": i * interval_ms,
+                "bids": [[f"{mid[i] - t:.2f}", f"{q:.4f}"] for t, q in zip(ticks, quantities[i, 0])],
+                "asks": [[f"{mid[i] + t:.2f}", f"{q:.4f}"] for t, q in zip(ticks, quantities[i, 1])],
+            })
+    snapshots.sort(key=lambda snapshot: snapshot["ingest_ts"])
+    return snapshots
+
+
+def load_backend(args):
+    """Consumer backend running the backend app in this process"""
+    if BACKEND_DIR not in sys.path:
+        sys.path.append(BACKEND_DIR)
+    import server
+    from autotune import build_models
+
+    models = build_models(args.random_weights)
+    server.tlob_model, server.mlplob_model = models["tlob"], models["mlplob"]
+    if args.mode == "embedded":
+        from embedded import EmbeddedBackend
+        return EmbeddedBackend(args.backend_dir, workers=args.inference_workers, load=False)
+    import httpx
+    return HttpBackend("http://replay/api/predict-json", "http://replay/api/predict-batch",
+                       max_connections=args.concurrency, timeout=args.timeout,
+                       transport=httpx.ASGITransport(app=server.app))
+
+
+async def produce(redis, snapshots, args, done):
+    """Push the snapshots on their schedule with a fresh ingest_ts, returns the seconds it took"""
+    start = time.perf_counter()
+    first_ts = snapshots[0]["ingest_ts"] if snapshots else 0
+    for snapshot in snapshots:
+        if args.speed > 0:
+            delay = (snapshot["ingest_ts"] - first_ts) / 1000 / args.speed - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        message = dict(snapshot, ingest_ts=int(time.time() * 1000))
+        if args.source == "stream":
+            await publish_orderbook(redis, message, args.stream_shards, fmt=args.lob_format)
+        else:
+            await redis.lpush(LOB_QUEUE, encode_orderbook(message, args.lob_format))
+        # Let the consumer run between pushes, also at full speed
+        await asyncio.sleep(0)
+    done.set()
+    return time.perf_counter() - start
+
+
+async def sample_depth(source, interval, samples):
+    """(seconds since start, queued messages) every interval"""
+    start = time.perf_counter()
+    while True:
+        samples.append((time.perf_counter() - start, await source.depth()))
+        await asyncio.sleep(interval)
+
+
+async def read_results(pubsub, collector, delivered):
+    """Receive results like the orchestrator does (subscribed to predictions:*), stamping their delivery"""
+    while True:
+        message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=0.1)
+        data = message and message["data"]
+        if not data:
+            continue
+        delivered.append(time.perf_counter())
+        result = decode_result(data)
+        if "trace" in result:
+            collector.record(stamp(result["trace"], "delivered_ts"))
+
+
+def queue_growth(samples, until):
+    """Max depth and depth growth in messages/s (least squares) while snapshots were being pushed"""
+    points = np.array([(t, depth) for t, depth in samples if t <= until] or [(0.0, 0)], dtype=np.float64)
+    slope = float(np.polyfit(points[:, 0], points[:, 1], 1)[0]) if len(points) > 1 else 0.0
+    return {"max_depth": int(max(depth for _, depth in samples)) if samples else 0,
+            "depth_at_end_of_replay": int(points[-1, 1]), "growth_per_s": round(slope, 2)}
+
+
+async def replay(args):
+    snapshots = load_snapshots(args.input) if args.input else make_snapshots(
+        args.symbols, args.snapshots, args.interval_ms, args.levels, args.repeat)
+    redis = fakeredis.FakeAsyncRedis()
+    backend = load_backend(args)
+    if args.source == "stream":
+        source = StreamSource(redis, shards=args.stream_shards, consumer_name="replay")
+    else:
+        source = ListSource(redis)
+    consumer = AsyncConsumer(redis, backend, concurrency=args.concurrency, batch_size=args.batch_size,
+                             history=args.history, history_size=args.history_size, source=source,
+                             max_queue_depth=args.max_queue_depth, keep_newest=args.keep_newest,
+                             max_age_ms=args.max_age_ms, wire_format=args.wire_format,
+                             trim_results=not args.full_results, trace=True,
+                             latest_ttl=args.latest_ttl)
+    collector, delivered, samples = TraceCollector(), [], []
+    pubsub = redis.pubsub()
+    await pubsub.psubscribe(f"{RESULTS_CHANNEL}:*")
+    produced = asyncio.Event()
+
+    start = time.perf_counter()
+    running = asyncio.create_task(consumer.run(drain_timeout=args.drain_timeout))
+    helpers = [asyncio.create_task(sample_depth(source, args.sample_interval, samples)),
+               asyncio.create_task(read_results(pubsub, collector, delivered))]
+    replay_s = await produce(redis, snapshots, args, produced)
+    # Wait for the consumer to work through the queue
+    deadline = time.perf_counter() + args.drain_timeout
+    while (await source.depth() or consumer._backlog or consumer._tasks) and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    consumer.stop()
+    await running
+    while len(delivered) < consumer.stats["published"] and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    for task in helpers:
+        task.cancel()
+    await backend.aclose()
+    await pubsub.aclose()
+
+    sustained = (len(delivered) - 1) / (delivered[-1] - delivered[0]) if len(delivered) > 1 else 0.0
+    return {
+        "config": {key: value for key, value in vars(args).items() if key not in ("redis_host", "redis_port")},
+        "snapshots": len(snapshots),
+        "replay_s": round(replay_s, 3),
+        "offered_per_s": round(len(snapshots) / replay_s, 2) if replay_s > 0 else None,
+        "elapsed_s": round(elapsed, 3),
+        "results": len(delivered),
+        "sustained_per_s": round(sustained, 2),
+        "queue": queue_growth(samples, replay_s),
+        "consumer": consumer.stats,
+        "skip_rate": round(consumer.stats["skipped"] / consumer.stats["received"], 4) if consumer.stats["received"] else 0.0,
+        # Traces are dropped by the struct results format, the consumer's own view still has them
+        "latency_ms": collector.summary() or consumer.tracer.summary(),
+    }
+
+
+def print_report(report):
+    queue = report["queue"]
+    print(f"snapshots={report['snapshots']} offered={report['offered_per_s']}/s over {report['replay_s']}s, "
+          f"results={report['results']} sustained={report['sustained_per_s']}/s, elapsed {report['elapsed_s']}s")
+    print(f"queue: max depth {queue['max_depth']}, {queue['depth_at_end_of_replay']} queued at end of replay, "
+          f"growth {queue['growth_per_s']}/s")
+    print(f"consumer: {report['consumer']}, skip rate {report['skip_rate']}")
+    print(f"{'hop':>16} {'count':>7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for hop, summary in report["latency_ms"].items():
+        print(f"{hop:>16} {summary['count']:>7} {summary['p50']:>9.2f} {summary['p90']:>9.2f} "
+              f"{summary['p99']:>9.2f} {summary['max']:>9.2f}")
+
+
+def main():
+    parser = build_parser("Replay order book snapshots through the consumer and an in-process backend")
+    parser.add_argument("--input", default=None, help="recorded lob_queue messages as JSON lines (default: synthetic)")
+    parser.add_argument("--symbols", type=int, default=4, help="synthetic symbols")
+    parser.add_argument("--snapshots", type=int, default=200, help="synthetic snapshots per symbol")
+    parser.add_argument("--interval-ms", type=int, default=1000, help="synthetic time between snapshots of a symbol")
+    parser.add_argument("--levels", type=int, default=100, help="synthetic depth levels per side")
+    parser.add_argument("--repeat", type=float, default=0.0, help="share of synthetic snapshots repeating the previous book")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed-up, 1 = real time, 0 = as fast as possible")
+    parser.add_argument("--lob-format", choices=FORMATS, default="json", help="lob_queue encoding of the snapshots")
+    parser.add_argument("--random-weights", action="store_true", help="freshly initialised models, no checkpoints needed")
+    parser.add_argument("--sample-interval", type=float, default=0.1, help="seconds between queue depth samples")
+    parser.add_argument("--output", default=None, help="save the report as JSON")
+    args = parser.parse_args()
+    if fakeredis is None:
+        raise SystemExit("the replay harness needs fakeredis (pip install fakeredis)")
+
+    report = asyncio.run(replay(args))
+    print_report(report)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
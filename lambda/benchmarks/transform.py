@@ -0,0 +1,91 @@
+"""
+Benchmark the Binance depth payload transforms
+
+Compares the per-level loop the consumer used to run against the NumPy
+transform in main.py on synthetic depth payloads, checking both give the same
+rows first.
+
+Run from the lambda directory:
+    python -m benchmarks.transform --levels 100 1000 5000
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from history import orderbook_to_levels
+from main import transform_orderbook_to_csv_format
+
+
+def legacy_transform(orderbook_data):
+    """Previous transform_orderbook_to_csv_format: one dict, float() calls and time.time() per level"""
+    bids = orderbook_data.get("bids", [])
+    asks = orderbook_data.get("asks", [])
+    rows = []
+    for i in range(max(len(bids), len(asks))):
+        row = {"timestamp": int(time.time() * 1000), "symbol": "BTCUSDT"}
+        if i < len(bids):
+            row["bid_price"] = float(bids[i][0])
+            row["bid_qty"] = float(bids[i][1])
+        else:
+            row["bid_price"] = 0.0
+            row["bid_qty"] = 0.0
+        if i < len(asks):
+            row["ask_price"] = float(asks[i][0])
+            row["ask_qty"] = float(asks[i][1])
+        else:
+            row["ask_price"] = 0.0
+            row["ask_qty"] = 0.0
+        rows.append(row)
+    return rows
+
+
+def make_payload(num_levels, seed=0):
+    """Depth payload shaped like the Binance REST response, prices and quantities as strings"""
+    rng = np.random.default_rng(seed)
+    ticks = np.arange(1, num_levels + 1) * 0.01
+    quantities = rng.exponential(1.0, (2, num_levels))
+    return json.loads(json.dumps({
+        "symbol": "BTCUSDT",
+        "bids": [[f"{100 - t:.2f}", f"{q:.5f}"] for t, q in zip(ticks, quantities[0])],
+        "asks": [[f"{100 + t:.2f}", f"{q:.5f}"] for t, q in zip(ticks, quantities[1])],
+    }))
+
+
+def time_call(function, payload, min_time):
+    """Median seconds per call over repeated calls for at least min_time"""
+    timings = []
+    start = time.perf_counter()
+    while time.perf_counter() - start < min_time or len(timings) < 5:
+        call_start = time.perf_counter()
+        function(payload)
+        timings.append(time.perf_counter() - call_start)
+    return float(np.median(timings))
+
+
+def check_equivalent(payload):
+    strip = lambda rows: [{k: v for k, v in row.items() if k != "timestamp"} for row in rows]
+    new_rows = transform_orderbook_to_csv_format(payload)
+    assert strip(new_rows) == strip(legacy_transform(payload)), "transforms disagree"
+    assert len({row["timestamp"] for row in new_rows}) <= 1, "rows of one snapshot must share a timestamp"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Binance depth payload transforms")
+    parser.add_argument("--levels", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--min-time", type=float, default=1.0, help="seconds measured per transform and depth")
+    args = parser.parse_args()
+
+    print(f"{'levels':>7} {'legacy ms':>10} {'rows ms':>10} {'levels ms':>10} {'speedup':>8}")
+    for num_levels in args.levels:
+        payload = make_payload(num_levels)
+        check_equivalent(payload)
+        legacy = time_call(legacy_transform, payload, args.min_time)
+        rows = time_call(transform_orderbook_to_csv_format, payload, args.min_time)
+        levels = time_call(orderbook_to_levels, payload, args.min_time)
+        print(f"{num_levels:>7} {legacy * 1000:>10.3f} {rows * 1000:>10.3f} {levels * 1000:>10.3f} {legacy / rows:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from itertools import chain
+
+import numpy as np
+
+try:
+    import websockets
+except ImportError:  # optional, only needed for live depth diffs
+    websockets = None
+
+from history import N_LOB_LEVELS, LEN_LEVEL
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+MAX_BOOK_LEVELS = 5000  # levels kept per side, the far end is dropped beyond this
+MAX_BUFFERED_EVENTS = 10_000  # diffs held per symbol while waiting for a snapshot
+EMIT_INTERVAL_MS = 1000  # event time between two order book messages of a symbol
+SNAPSHOT_LIMIT = 1000  # levels of the REST snapshot used to (re)sync
+RESYNC_DELAY = 1  # seconds before retrying a failed snapshot request
+RECONNECT_DELAY = 1  # seconds before reopening a dropped live stream, doubled on every failed attempt
+MAX_RECONNECT_DELAY = 60
+BINANCE_WS_URL = "wss://stream.binance.com:9443/stream"
+BINANCE_DEPTH_URL = "https://api.binance.com/api/v3/depth"
+POP_TIMEOUT = 1  # seconds, bounds how long shutdown waits on an idle source
+
+
+class BookGap(Exception):
+    """A depth diff does not continue the book's update sequence, the book must be resynced"""
+
+
+def _parse_levels(levels):
+    """[price, qty] string pairs (or a [levels, 2] array) as float64 [levels, 2]"""
+    if isinstance(levels, np.ndarray):
+        return levels.astype(np.float64, copy=False).reshape(-1, 2)
+    values = np.fromiter(map(float, chain.from_iterable(levels)), dtype=np.float64, count=2 * len(levels))
+    return values.reshape(-1, 2)
+
+
+class BookSide:
+    """
+    Price levels of one side as two sorted arrays, best level first.
+    Bids are stored with negated prices so both sides sort ascending.
+    """
+
+    def __init__(self, descending, max_levels=MAX_BOOK_LEVELS):
+        self.sign = -1.0 if descending else 1.0
+        self.max_levels = max_levels
+        self.keys = np.empty(0, dtype=np.float64)
+        self.qtys = np.empty(0, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def reset(self, levels):
+        levels = _parse_levels(levels)
+        levels = levels[levels[:, 1] > 0]
+        order = np.argsort(levels[:, 0] * self.sign, kind="stable")[:self.max_levels]
+        self.keys = levels[order, 0] * self.sign
+        self.qtys = levels[order, 1]
+
+    def apply(self, levels):
+        """Set the quantity of every [price, qty] level, qty 0 removes the level"""
+        if not len(levels):
+            return
+        updates = _parse_levels(levels)
+        keys = updates[:, 0] * self.sign
+        order = np.argsort(keys, kind="stable")
+        keys, qtys = keys[order], updates[order, 1]
+        # A price listed twice takes its last quantity
+        last = np.append(keys[1:] != keys[:-1], True)
+        keys, qtys = keys[last], qtys[last]
+        positions = np.searchsorted(self.keys, keys)
+        found = positions < len(self.keys)
+        found[found] = self.keys[positions[found]] == keys[found]
+        live = qtys > 0
+        changed = found & live
+        self.qtys[positions[changed]] = qtys[changed]
+        removed = positions[found & ~live]
+        if len(removed):
+            self.keys = np.delete(self.keys, removed)
+            self.qtys = np.delete(self.qtys, removed)
+        added = ~found & live
+        if added.any():
+            at = np.searchsorted(self.keys, keys[added])
+            self.keys = np.insert(self.keys, at, keys[added])
+            self.qtys = np.insert(self.qtys, at, qtys[added])
+            if len(self.keys) > self.max_levels:
+                self.keys = self.keys[:self.max_levels]
+                self.qtys = self.qtys[:self.max_levels]
+
+    def top(self, num_levels):
+        """float64 [<= num_levels, 2] price, qty of the best levels"""
+        top = np.empty((min(num_levels, len(self.keys)), 2), dtype=np.float64)
+        top[:, 0] = self.keys[:len(top)] * self.sign
+        top[:, 1] = self.qtys[:len(top)]
+        return top
+
+
+class L2Book:
+    """Price-aggregated order book of one symbol, kept current by Binance depth diffs"""
+
+    def __init__(self, symbol, max_levels=MAX_BOOK_LEVELS):
+        self.symbol = symbol
+        self.bids = BookSide(descending=True, max_levels=max_levels)
+        self.asks = BookSide(descending=False, max_levels=max_levels)
+        self.last_update_id = None
+        self.event_ts = None
+        self._first_diff = True
+
+    def load_snapshot(self, snapshot):
+        """REST /api/v3/depth response: {"lastUpdateId", "bids", "asks"}"""
+        self.bids.reset(snapshot.get("bids", []))
+        self.asks.reset(snapshot.get("asks", []))
+        self.last_update_id = int(snapshot["lastUpdateId"])
+        self._first_diff = True
+
+    def apply_diff(self, event):
+        """
+        Apply one depthUpdate event ({"U", "u", "b", "a", "E"}), returns False for events
+        the book already covers; raises BookGap when updates are missing
+        """
+        first, last = int(event["U"]), int(event["u"])
+        if last <= self.last_update_id:
+            return False
+        expected = self.last_update_id + 1
+        # The first diff after a snapshot straddles it, later ones continue at the previous u + 1
+        if first > expected or (not self._first_diff and first != expected):
+            raise BookGap(f"{self.symbol}: expected update {expected}, got {first}..{last}")
+        self.bids.apply(event.get("b", []))
+        self.asks.apply(event.get("a", []))
+        self.last_update_id = last
+        self.event_ts = event.get("E")
+        self._first_diff = False
+        return True
+
+    def levels(self, num_levels=N_LOB_LEVELS):
+        """float64 [num_levels, 4] bid_price, bid_qty, ask_price, ask_qty, zero-padded (see history.py)"""
+        levels = np.zeros((num_levels, LEN_LEVEL), dtype=np.float64)
+        bids, asks = self.bids.top(num_levels), self.asks.top(num_levels)
+        levels[:len(bids), 0:2] = bids
+        levels[:len(asks), 2:4] = asks
+        return levels
+
+    def orderbook(self, num_levels=N_LOB_LEVELS):
+        """The best levels as an order book message with float [levels, 2] bids/asks"""
+        return {"symbol": self.symbol, "bids": self.bids.top(num_levels), "asks": self.asks.top(num_levels)}
+
+
+class BookSync:
+    """
+    Keeps an L2Book in sync with a diff stream, following Binance's procedure for a
+    local order book: diffs are buffered until a snapshot is loaded, diffs the snapshot
+    already covers are dropped, and a gap in the update ids discards the book until
+    the next snapshot.
+    """
+
+    def __init__(self, symbol, max_levels=MAX_BOOK_LEVELS, max_buffered=MAX_BUFFERED_EVENTS):
+        self.book = L2Book(symbol, max_levels)
+        self.needs_snapshot = True
+        self._buffer = deque(maxlen=max_buffered)
+        self.stats = {"applied": 0, "dropped": 0, "levels": 0, "resyncs": 0, "snapshots": 0}
+
+    def on_snapshot(self, snapshot):
+        self.book.load_snapshot(snapshot)
+        self.needs_snapshot = False
+        self.stats["snapshots"] += 1
+        buffered = list(self._buffer)
+        self._buffer.clear()
+        for event in buffered:
+            self.on_diff(event)
+
+    def invalidate(self):
+        """Diffs were missed (e.g. the stream reconnected): discard the book until the next snapshot"""
+        if not self.needs_snapshot:
+            self.stats["resyncs"] += 1
+        self.needs_snapshot = True
+        self._buffer.clear()
+
+    def on_diff(self, event):
+        """True if the event changed the book"""
+        if self.needs_snapshot:
+            self._buffer.append(event)
+            return False
+        try:
+            applied = self.book.apply_diff(event)
+        except BookGap as e:
+            logger.warning(f"Depth diff gap, resyncing: {e}")
+            self.stats["resyncs"] += 1
+            self.needs_snapshot = True
+            # The next snapshot may already cover this event
+            self._buffer.append(event)
+            return False
+        if applied:
+            self.stats["applied"] += 1
+            self.stats["levels"] += len(event.get("b", [])) + len(event.get("a", []))
+        else:
+            self.stats["dropped"] += 1
+        return applied
+
+
+class BookSource:
+    """
+    Order books maintained from depth diffs, as a consumer source (consumer.py --source book).
+    `events` is an async iterator of depthUpdate events and snapshots (objects with
+    "lastUpdateId" and "symbol"), read once (recorded files), or a callable opening
+    a new such iterator (live streams): when the stream drops or fails it is opened
+    again with exponential backoff and every book is resynced, as diffs were missed
+    in between. Every `emit_interval_ms` of event time the top
+    `num_levels` of each synced book are queued as an order book message and handed
+    to the consumer as is, without serialization. Books are (re)synced with
+    `fetch_snapshot(symbol)` when given, otherwise with the snapshots in `events`
+    (recorded files).
+    """
+
+    def __init__(self, events, fetch_snapshot=None, emit_interval_ms=EMIT_INTERVAL_MS, num_levels=N_LOB_LEVELS,
+                 max_levels=MAX_BOOK_LEVELS):
+        self.events = events
+        self.fetch_snapshot = fetch_snapshot
+        self.emit_interval_ms = emit_interval_ms
+        self.num_levels = num_levels
+        self.max_levels = max_levels
+        self.books = {}  # symbol -> BookSync
+        self.done = False
+        self._queue = asyncio.Queue()
+        self._next_emit = {}
+        self._resyncs = {}
+        self._task = None
+
+    @property
+    def name(self):
+        return "depth diffs"
+
+    def _sync(self, symbol):
+        sync = self.books.get(symbol)
+        if sync is None:
+            sync = self.books[symbol] = BookSync(symbol, self.max_levels)
+        return sync
+
+    async def _run(self):
+        reconnect = callable(self.events)
+        delay = RECONNECT_DELAY
+        try:
+            while True:
+                received = False
+                try:
+                    async for event in self.events() if reconnect else self.events:
+                        received = True
+                        self._on_event(event)
+                    if not reconnect:
+                        return
+                    logger.warning("Depth diff stream closed")
+                except Exception as e:
+                    logger.error(f"Error reading depth diffs: {e}")
+                    if not reconnect:
+                        return
+                if received:
+                    delay = RECONNECT_DELAY
+                for sync in self.books.values():
+                    sync.invalidate()
+                logger.info(f"Reconnecting to the depth diff stream in {delay}s")
+                await asyncio.sleep(delay)
+                delay = min(2 * delay, MAX_RECONNECT_DELAY)
+        finally:
+            self.done = True
+
+    def _on_event(self, event):
+        if "lastUpdateId" in event:
+            self._sync(event["symbol"]).on_snapshot(event)
+            return
+        symbol = event["s"]
+        sync = self._sync(symbol)
+        if sync.on_diff(event):
+            self._emit(sync.book)
+        elif sync.needs_snapshot and self.fetch_snapshot is not None and symbol not in self._resyncs:
+            # Started by the first diff of the (re)opened stream, so the snapshot does not predate the buffered diffs
+            self._resyncs[symbol] = asyncio.create_task(self._resync(symbol))
+
+    async def _resync(self, symbol):
+        sync = self.books[symbol]
+        try:
+            while sync.needs_snapshot:
+                try:
+                    sync.on_snapshot(await self.fetch_snapshot(symbol))
+                except Exception as e:
+                    logger.error(f"Error fetching the {symbol} depth snapshot: {e}")
+                    await asyncio.sleep(RESYNC_DELAY)
+        finally:
+            del self._resyncs[symbol]
+
+    def _emit(self, book):
+        event_ts = book.event_ts or 0
+        next_emit = self._next_emit.get(book.symbol)
+        if next_emit is not None and event_ts < next_emit:
+            return
+        self._next_emit[book.symbol] = (event_ts // self.emit_interval_ms + 1) * self.emit_interval_ms
+        orderbook = book.orderbook(self.num_levels)
+        orderbook.update(ingest_ts=int(time.time() * 1000), event_ts=event_ts)
+        self._queue.put_nowait(orderbook)
+
+    async def fetch(self, count):
+        """Wait for one order book message, then take whatever else is queued up to count"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        try:
+            messages = [await asyncio.wait_for(self._queue.get(), POP_TIMEOUT)]
+        except asyncio.TimeoutError:
+            return []
+        while len(messages) < count and not self._queue.empty():
+            messages.append(self._queue.get_nowait())
+        return [(None, orderbook) for orderbook in messages]
+
+    async def ack(self, ids):
+        pass
+
+    async def depth(self):
+        """Order book messages waiting to be fetched"""
+        return self._queue.qsize()
+
+    async def lag(self):
+        return {symbol: {"last_update_id": sync.book.last_update_id, "synced": not sync.needs_snapshot, **sync.stats}
+                for symbol, sync in self.books.items()}
+
+
+async def file_events(path, yield_every=100):
+    """Recorded depthUpdate events and snapshots, one JSON object per line"""
+    with open(path) as f:
+        for i, line in enumerate(f):
+            if line.strip():
+                yield json.loads(line)
+            if i % yield_every == 0:
+                await asyncio.sleep(0)
+
+
+def binance_events(symbols, speed="100ms"):
+    """
+    Opener of the Binance combined diff depth stream for BookSource: every call connects
+    again and returns an async iterator of its live depthUpdate events
+    """
+    if websockets is None:
+        raise RuntimeError("live depth diffs need the websockets package (pip install websockets)")
+    streams = "/".join(f"{symbol.lower()}@depth@{speed}" for symbol in symbols)
+
+    async def connect():
+        async with websockets.connect(f"{BINANCE_WS_URL}?streams={streams}") as ws:
+            async for message in ws:
+                yield json.loads(message)["data"]
+
+    return connect
+
+
+def binance_snapshot_fetcher(client, limit=SNAPSHOT_LIMIT):
+    """fetch_snapshot for BookSource using an httpx.AsyncClient"""
+
+    async def fetch_snapshot(symbol):
+        response = await client.get(BINANCE_DEPTH_URL, params={"symbol": symbol, "limit": limit})
+        response.raise_for_status()
+        return {"symbol": symbol, **response.json()}
+
+    return fetch_snapshot
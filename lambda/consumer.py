@@ -0,0 +1,562 @@
+import argparse
+import asyncio
+import logging
+import signal
+import time
+from collections import deque
+
+import httpx
+import redis.asyncio as aioredis
+
+from main import (
+    BACKEND_URL,
+    BACKEND_BATCH_URL,
+    LATEST_TTL,
+    LOB_QUEUE,
+    RESULTS_CHANNEL,
+    RETRY_DELAY,
+    DEFAULT_SYMBOL,
+    KEEP_NEWEST,
+    MAX_AGE_MS,
+    MAX_QUEUE_DEPTH,
+    is_stale,
+    keep_newest,
+    latest_key,
+    results_channel,
+    transform_orderbook_to_columnar,
+)
+from sources import STREAM_SHARDS, ListSource, StreamSource
+from book import EMIT_INTERVAL_MS, BookSource, binance_events, binance_snapshot_fetcher, file_events
+from wire import FORMATS, decode_orderbook, encode_result, msgpack
+from history import HISTORY_SIZE, SnapshotHistory, orderbook_to_feature_row, session_payload, window_payload
+from tracing import TraceCollector, stamp
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+REDIS_HOST = "localhost"
+REDIS_PORT = 6379
+CONCURRENCY = 8  # backend calls in flight at once
+BATCH_SIZE = 1  # queued messages drained into one backend call
+REQUEST_TIMEOUT = 10  # seconds
+DRAIN_TIMEOUT = 30  # seconds to finish in-flight work on shutdown
+WIRE_FORMAT = "json"  # result encoding, lob_queue messages are accepted in any format
+TRIM_RESULTS = True  # publish only the newest prediction per model, no metadata
+METRICS_INTERVAL = 30  # seconds between stats/lag log lines
+DEPTH_CHECK_INTERVAL = 0.5  # seconds between backlog depth checks
+MAX_SHED_BATCH = 10_000  # messages read at once when shedding a backlog
+HISTORY = "session"  # none: latest snapshot only, window: full window per call, session: delta per call
+TRACE = True  # stamp messages along the pipeline and report per-hop latency percentiles
+MAX_SKIPS = 10  # unchanged snapshots in a row answered with the previous prediction, 0 disables
+
+
+class HttpBackend:
+    """Backend client over a keep-alive connection pool"""
+
+    def __init__(self, url=BACKEND_URL, batch_url=BACKEND_BATCH_URL, max_connections=CONCURRENCY, timeout=REQUEST_TIMEOUT,
+                 transport=None):
+        self.url = url
+        self.batch_url = batch_url
+        # transport=httpx.ASGITransport(app=...) calls an in-process backend app
+        self._client = httpx.AsyncClient(
+            transport=transport,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    async def predict(self, payload):
+        """POST one payload, returns the decoded result or None on error"""
+        return await self._post(self.url, payload)
+
+    async def predict_batch(self, payloads):
+        """POST several payloads as one call, returns one result (or None) per payload"""
+        response = await self._post(self.batch_url, {"requests": payloads})
+        if response is None or "error" in response:
+            return [None] * len(payloads)
+        # Session conflicts are passed through so the caller can resend with a reset
+        return [None if "error" in result and not result.get("session_conflict") else result
+                for result in response["results"]]
+
+    async def _post(self, url, body):
+        try:
+            response = await self._client.post(url, json=body)
+        except httpx.TimeoutException:
+            logger.error("Backend API timeout")
+            return None
+        except httpx.TransportError as e:
+            logger.error(f"Backend API connection error: {e}")
+            return None
+        if response.status_code == 409:
+            logger.warning(f"Backend session conflict: {response.text}")
+            return {"error": response.text, "session_conflict": True}
+        if response.status_code != 200:
+            logger.error(f"Backend API error: {response.status_code} - {response.text}")
+            return None
+        return response.json()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+class AsyncConsumer:
+    """
+    Consumes lob_queue (or another source, see sources.py and book.py) with up to `concurrency`
+    backend calls in flight. Each cycle drains up to `batch_size` queued messages
+    into one backend call, publishes their results in one pipeline and then
+    acks the messages to the source.
+    Each result is published on its symbol's channel (predictions:<symbol>), which
+    the orchestrator fans out to its clients, and overwrites latest:<symbol>
+    (expiring after `latest_ttl` seconds) for late joiners.
+    Results of one symbol are published in the order its messages were popped:
+    each batch waits for the previous batches holding the same symbols before pushing.
+
+    With `history` other than "none", every snapshot is appended to its symbol's
+    SnapshotHistory and the backend predicts on the newest window of up to
+    `history_size` snapshots instead of a zero-padded single snapshot.
+    "window" sends the whole window with every call; "session" sends only the
+    snapshots the backend session of the symbol has not seen yet, so calls of one
+    symbol are sent one after the other.
+
+    Backpressure: snapshots older than `max_age_ms` are dropped, and when more than
+    `max_queue_depth` messages are waiting the backlog is read at once and only the
+    newest `keep_newest` snapshots of every symbol are processed (see main.py).
+
+    Unchanged books: when a snapshot's top N_LOB_LEVELS levels (the feature row the
+    models see) equal those of the symbol's previous snapshot, the previous prediction
+    is republished (flagged "reused") instead of calling the backend, at most
+    `max_skips` times in a row. The snapshot still joins the history, so
+    the next real prediction covers it. With history the models would see the
+    window shifted by one repeated row, so `max_skips` bounds how stale a reused
+    window prediction can get.
+
+    With `trace`, every message gets a "trace" dict of wall-clock stamps (see
+    tracing.py) that travels with its payload through the backend, which adds its
+    own stage timings, and ends up in the published result; the latencies of
+    published messages are summarized per hop in metrics().
+    """
+
+    def __init__(self, redis, backend, lob_queue=LOB_QUEUE,
+                 concurrency=CONCURRENCY, batch_size=BATCH_SIZE, history=HISTORY, history_size=HISTORY_SIZE,
+                 source=None, max_queue_depth=MAX_QUEUE_DEPTH, keep_newest=KEEP_NEWEST, max_age_ms=MAX_AGE_MS,
+                 wire_format=WIRE_FORMAT, trim_results=TRIM_RESULTS, trace=TRACE,
+                 latest_ttl=LATEST_TTL, max_skips=MAX_SKIPS):
+        self.redis = redis
+        self.backend = backend
+        self.source = source or ListSource(redis, lob_queue)
+        self.latest_ttl = latest_ttl
+        self.max_skips = max_skips
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.history = history
+        self.history_size = history_size
+        self.max_queue_depth = max_queue_depth
+        self.keep_newest = keep_newest
+        self.max_age_ms = max_age_ms
+        self.wire_format = wire_format
+        self.trim_results = trim_results
+        self.trace = trace
+        self.tracer = TraceCollector()
+        self.stats = {"received": 0, "published": 0, "failed": 0, "batches": 0, "session_resets": 0, "acked": 0,
+                      "shed_stale": 0, "shed_coalesced": 0, "skipped": 0}
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tails = {}  # symbol -> task of the last batch popped for it
+        self._histories = {}  # symbol -> SnapshotHistory
+        self._acked = {}  # symbol -> next sequence number its backend session expects
+        self._last_results = {}  # symbol -> (feature row bytes, result) of its last published prediction
+        self._fingerprints = {}  # symbol -> feature row bytes of its last dispatched snapshot
+        self._skips = {}  # symbol -> snapshots answered with the previous prediction in a row
+        self._tasks = set()
+        self._backlog = deque()  # messages kept from a shed backlog, processed before new ones
+        self._next_depth_check = 0.0
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        """Stop popping new messages, in-flight ones are drained by run()"""
+        self._stopping.set()
+
+    async def run(self, drain_timeout=DRAIN_TIMEOUT):
+        logger.info(f"Consuming {self.source.name} with {self.concurrency} calls in flight, "
+                    f"up to {self.batch_size} message(s) per call")
+        while not self._stopping.is_set():
+            # Take a slot before popping so messages wait in Redis, not in memory
+            await self._slots.acquire()
+            try:
+                messages = await self._next_messages()
+            except Exception as e:
+                self._slots.release()
+                logger.error(f"Error reading from {self.source.name}: {e}")
+                logger.info(f"Retrying in {RETRY_DELAY} seconds...")
+                await asyncio.sleep(RETRY_DELAY)
+                continue
+            if not messages:
+                self._slots.release()
+                continue
+            self._dispatch(messages)
+        await self.drain(drain_timeout)
+
+    async def _next_messages(self):
+        if not self._backlog and self.max_queue_depth and time.monotonic() >= self._next_depth_check:
+            self._next_depth_check = time.monotonic() + DEPTH_CHECK_INTERVAL
+            depth = await self.source.depth()
+            if depth > self.max_queue_depth:
+                await self._shed(await self.source.fetch(min(depth, MAX_SHED_BATCH)))
+        if not self._backlog:
+            return await self.source.fetch(self.batch_size)
+        return [self._backlog.popleft() for _ in range(min(self.batch_size, len(self._backlog)))]
+
+    async def _shed(self, messages):
+        """Keep the newest snapshots of every symbol from a backlog, ack the rest"""
+        orderbooks = []
+        for _, data in messages:
+            try:
+                orderbooks.append(decode_orderbook(data))
+            except ValueError:
+                orderbooks.append({})
+        kept = set(keep_newest(orderbooks, self.keep_newest))
+        dropped = [message_id for i, (message_id, _) in enumerate(messages) if i not in kept and message_id is not None]
+        self._backlog.extend(message for i, message in enumerate(messages) if i in kept)
+        self.stats["shed_coalesced"] += len(messages) - len(kept)
+        logger.warning(f"Backlog of {len(messages)} messages on {self.source.name}, "
+                       f"kept the newest {len(kept)}")
+        if dropped:
+            await self.source.ack(dropped)
+
+    async def metrics(self):
+        """Consumer stats and the source's backlog"""
+        metrics = {"stats": dict(self.stats), "in_flight": len(self._tasks), "lag": await self.source.lag()}
+        metrics["skip_rate"] = round(self.stats["skipped"] / self.stats["received"], 4) if self.stats["received"] else 0.0
+        if self.trace:
+            metrics["latency"] = self.tracer.summary()
+        return metrics
+
+    async def drain(self, timeout=DRAIN_TIMEOUT):
+        """Wait for in-flight messages to be published"""
+        if not self._tasks:
+            return
+        logger.info(f"Draining {len(self._tasks)} in-flight batch(es)...")
+        done, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        if pending:
+            logger.warning(f"{len(pending)} batch(es) still in flight after {timeout}s, cancelling")
+            for task in pending:
+                task.cancel()
+
+    def _dispatch(self, messages):
+        self.stats["received"] += len(messages)
+        # Messages that will never get a result are acked with the batch, the others once their result is published
+        shed_ids, item_ids = [], []
+        now_ms = time.time() * 1000
+        items, reused = [], {}
+        for message_id, data in messages:
+            try:
+                orderbook = decode_orderbook(data)
+            except ValueError as e:
+                logger.error(f"Invalid order book message: {e}")
+                self.stats["failed"] += 1
+                shed_ids.append(message_id)
+                continue
+            if is_stale(orderbook, now_ms, self.max_age_ms):
+                self.stats["shed_stale"] += 1
+                shed_ids.append(message_id)
+                continue
+            symbol = orderbook.get("symbol", DEFAULT_SYMBOL)
+            timestamp = int(orderbook.get("ingest_ts", now_ms))
+            row = orderbook_to_feature_row(orderbook)
+            seq = None
+            if self.history != "none":
+                # Appended here, in pop order, so histories do not depend on backend latency
+                history = self._histories.get(symbol)
+                if history is None:
+                    # created once per symbol, setdefault would allocate a buffer for every message
+                    history = self._histories[symbol] = SnapshotHistory(2 * self.history_size)
+                seq = history.append(row, timestamp)
+            trace = {"ingest_ts": orderbook.get("ingest_ts"), "pop_ts": now_ms} if self.trace else None
+            fingerprint = row.tobytes()
+            if self._unchanged(symbol, fingerprint):
+                reused[len(items)] = (fingerprint, timestamp)
+            items.append((symbol, orderbook, seq, trace))
+            item_ids.append(message_id)
+        symbols = {symbol for symbol, _, _, _ in items}
+        previous = {self._tails[symbol] for symbol in symbols if symbol in self._tails}
+        task = asyncio.create_task(self._process(items, item_ids, shed_ids, previous, reused))
+        for symbol in symbols:
+            self._tails[symbol] = task
+        self._tasks.add(task)
+        task.add_done_callback(lambda t: self._on_done(symbols, t))
+
+    def _unchanged(self, symbol, fingerprint):
+        """True if the snapshot can be answered with the prediction of the symbol's previous one"""
+        unchanged = (self.max_skips > 0 and self._fingerprints.get(symbol) == fingerprint
+                     and self._skips.get(symbol, 0) < self.max_skips)
+        self._fingerprints[symbol] = fingerprint
+        self._skips[symbol] = self._skips.get(symbol, 0) + 1 if unchanged else 0
+        return unchanged
+
+    def _reuse(self, previous, timestamp, trace):
+        """A previous result as the result of a newer, unchanged snapshot"""
+        self.stats["skipped"] += 1
+        result = {key: value for key, value in previous.items() if key != "trace"}
+        summary = result.get("summary", {})
+        result["summary"] = {**summary, "time_range": {**summary.get("time_range", {}), "end": str(timestamp)}}
+        result["reused"] = True
+        if trace is not None:
+            result["trace"] = trace
+        return result
+
+    def _on_done(self, symbols, task):
+        self._tasks.discard(task)
+        for symbol in symbols:
+            if self._tails.get(symbol) is task:
+                del self._tails[symbol]
+
+    def _payload(self, symbol, orderbook, seq, trace):
+        """Backend payload of one message, None if its snapshot left the history"""
+        if self.history == "none":
+            payload = transform_orderbook_to_columnar(orderbook)
+        elif self.history == "window":
+            payload = window_payload(symbol, self._histories[symbol], seq, self.history_size)
+        else:
+            payload = session_payload(symbol, self._histories[symbol], seq, self._acked.get(symbol), self.history_size)
+            # Later messages of the symbol in the same call only carry their own snapshot
+            self._acked[symbol] = seq + 1
+        if payload is not None and trace is not None:
+            payload["trace"] = trace
+        return payload
+
+    async def _call(self, payloads):
+        results = [None] * len(payloads)
+        positions = [i for i, payload in enumerate(payloads) if payload is not None]
+        if not positions:
+            return results
+        self.stats["batches"] += 1
+        for i in positions:
+            if "trace" in payloads[i]:
+                stamp(payloads[i]["trace"], "request_start")
+        if len(positions) == 1:
+            returned = [await self.backend.predict(payloads[positions[0]])]
+        else:
+            returned = await self.backend.predict_batch([payloads[i] for i in positions])
+        end_ms = time.time() * 1000
+        for i, result in zip(positions, returned):
+            trace = payloads[i].get("trace")
+            if result is not None and trace is not None and "error" not in result:
+                # Backends without tracing do not echo the stamps
+                result.setdefault("trace", dict(trace))["request_end"] = end_ms
+            results[i] = result
+        return results
+
+    async def _predict(self, items):
+        results = await self._call([self._payload(*item) for item in items])
+        if self.history != "session":
+            return results
+
+        # The backend lost or disagrees with a session (restart, eviction, failed call):
+        # resend those messages once, resetting the session with a full window
+        conflicts = [i for i, result in enumerate(results) if result is not None and result.get("session_conflict")]
+        if conflicts:
+            self.stats["session_resets"] += len({items[i][0] for i in conflicts})
+            for i in conflicts:
+                self._acked.pop(items[i][0], None)
+            for i, result in zip(conflicts, await self._call([self._payload(*items[i]) for i in conflicts])):
+                results[i] = result
+        for (symbol, _, seq, _), result in zip(items, results):
+            if result is None or "error" in result:
+                self._acked.pop(symbol, None)
+            else:
+                self._acked[symbol] = seq + 1
+        return results
+
+    async def _process(self, items, item_ids, shed_ids, previous, reused=None):
+        reused = reused or {}
+        predict = [item for i, item in enumerate(items) if i not in reused]
+        if previous and self.history == "session":
+            # Session deltas of a symbol must reach the backend in order
+            await asyncio.wait(previous)
+        try:
+            returned = await self._predict(predict)
+        except Exception as e:
+            logger.error(f"Error processing data: {e}")
+            returned = [None] * len(predict)
+            for symbol, _, _, _ in predict:
+                self._acked.pop(symbol, None)
+        finally:
+            self._slots.release()
+
+        # Keep per-symbol ordering: publish only after earlier batches of these symbols
+        if previous:
+            await asyncio.wait(previous)
+        results, latest = self._results(items, reused, iter(returned))
+        self.stats["failed"] += len(items) - len(results)
+        if len(results) < len(items):
+            logger.warning(f"No result from backend API for {len(items) - len(results)} message(s)")
+        traces = [stamp(result["trace"], "push_ts") for _, _, result in results if "trace" in result]
+        published = [(symbol, encode_result(result, self.wire_format, self.trim_results)) for _, symbol, result in results]
+        # Messages without a published result are not acked: they stay pending, are reclaimed
+        # later and dead-lettered by the source after too many deliveries
+        ids = [message_id for message_id in shed_ids if message_id is not None]
+        if published:
+            try:
+                await self._publish(published)
+                self.stats["published"] += len(published)
+                for trace in traces:
+                    self.tracer.record(trace)
+                self._last_results.update(latest)
+                ids += [item_ids[i] for i, _, _ in results if item_ids[i] is not None]
+            except Exception as e:
+                self.stats["failed"] += len(published)
+                logger.error(f"Error publishing results: {e}")
+        if not ids:
+            return
+        try:
+            await self.source.ack(ids)
+            self.stats["acked"] += len(ids)
+        except Exception as e:
+            logger.error(f"Error acking {len(ids)} message(s) on {self.source.name}: {e}")
+
+    def _results(self, items, reused, returned):
+        """
+        (item index, symbol, result) in pop order, unchanged snapshots answered with the newest
+        prediction before them, and the newest (feature row bytes, prediction) per symbol
+        """
+        results, latest = [], {}
+        for i, (symbol, orderbook, _, trace) in enumerate(items):
+            if i in reused:
+                fingerprint, timestamp = reused[i]
+                last = latest.get(symbol) or self._last_results.get(symbol)
+                if last is None or last[0] != fingerprint:
+                    # The prediction it would repeat failed
+                    continue
+                results.append((i, symbol, self._reuse(last[1], timestamp, trace)))
+                continue
+            result = next(returned)
+            if result is None or "error" in result:
+                continue
+            latest[symbol] = (orderbook_to_feature_row(orderbook).tobytes(), result)
+            results.append((i, symbol, result))
+        return results, latest
+
+    async def _publish(self, messages):
+        """Publish (symbol, encoded result) pairs in a single round trip"""
+        pipe = self.redis.pipeline(transaction=False)
+        latest = {}
+        for symbol, data in messages:
+            pipe.publish(results_channel(symbol), data)
+            latest[symbol] = data
+        for symbol, data in latest.items():
+            pipe.set(latest_key(symbol), data, ex=self.latest_ttl)
+        await pipe.execute()
+
+
+async def log_metrics(consumer, interval=METRICS_INTERVAL, report=None):
+    """Log the consumer metrics every interval, or hand them to report (e.g. a supervisor queue)"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            metrics = await consumer.metrics()
+            if report is None:
+                logger.info(f"Metrics: {metrics}")
+            else:
+                report(metrics)
+        except Exception as e:
+            logger.error(f"Error collecting metrics: {e}")
+
+
+async def serve(args, report=None):
+    if args.wire_format == "msgpack" and msgpack is None:
+        raise SystemExit("--wire-format msgpack needs the msgpack package")
+    # Raw bytes: order book and result messages may use the binary wire formats
+    redis = aioredis.Redis(host=args.redis_host, port=args.redis_port, db=0)
+    if args.mode == "embedded":
+        from embedded import EmbeddedBackend
+        backend = EmbeddedBackend(args.backend_dir, workers=args.inference_workers)
+    else:
+        backend = HttpBackend(args.backend_url, args.backend_batch_url, max_connections=args.concurrency, timeout=args.timeout)
+    snapshot_client = None
+    if args.source == "stream":
+        source = StreamSource(redis, args.shard_ids, shards=args.stream_shards, consumer_name=args.consumer_name)
+    elif args.source == "book":
+        if args.book_file:
+            source = BookSource(file_events(args.book_file), emit_interval_ms=args.emit_interval_ms)
+        else:
+            snapshot_client = httpx.AsyncClient(timeout=args.timeout)
+            source = BookSource(binance_events(args.book_symbols), binance_snapshot_fetcher(snapshot_client),
+                                emit_interval_ms=args.emit_interval_ms)
+    else:
+        source = ListSource(redis)
+    consumer = AsyncConsumer(redis, backend, concurrency=args.concurrency, batch_size=args.batch_size,
+                             history=args.history, history_size=args.history_size, source=source,
+                             max_queue_depth=args.max_queue_depth, keep_newest=args.keep_newest, max_age_ms=args.max_age_ms,
+                             wire_format=args.wire_format, trim_results=not args.full_results, trace=not args.no_trace,
+                             latest_ttl=args.latest_ttl, max_skips=args.max_skips)
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, consumer.stop)
+
+    logger.info(f"Starting async Lambda processor...")
+    logger.info(f"Publishing results to: {results_channel('<symbol>')}, {latest_key('<symbol>')}")
+    logger.info(f"Backend: {'in process' if args.mode == 'embedded' else args.backend_url}")
+    metrics = asyncio.create_task(log_metrics(consumer, args.metrics_interval, report))
+    try:
+        await consumer.run(drain_timeout=args.drain_timeout)
+    finally:
+        metrics.cancel()
+        logger.info(f"Shutting down gracefully... {consumer.stats}")
+        await backend.aclose()
+        if snapshot_client is not None:
+            await snapshot_client.aclose()
+        await redis.aclose()
+
+
+def build_parser(description="Asyncio Redis consumer for order book predictions"):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="backend calls in flight at once")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="queued messages drained into one backend call")
+    parser.add_argument("--source", choices=["list", "stream", "book"], default="list",
+                        help="lob_queue list, symbol-sharded lob_stream:<shard> streams with a consumer group, "
+                             "or order books maintained here from Binance depth diffs (book.py)")
+    parser.add_argument("--book-symbols", nargs="+", default=[DEFAULT_SYMBOL], help="symbols of --source book")
+    parser.add_argument("--book-file", default=None,
+                        help="recorded depth diffs and snapshots (JSON lines) for --source book instead of Binance")
+    parser.add_argument("--emit-interval-ms", type=int, default=EMIT_INTERVAL_MS,
+                        help="event time between order book messages of a symbol with --source book")
+    parser.add_argument("--stream-shards", type=int, default=STREAM_SHARDS, help="total shard streams")
+    parser.add_argument("--shard-ids", type=int, nargs="+", default=None,
+                        help="shards read by this process (default: all); give each shard to one process")
+    parser.add_argument("--consumer-name", default=None,
+                        help="consumer group member name, keep it stable across restarts to replay pending entries")
+    parser.add_argument("--max-queue-depth", type=int, default=MAX_QUEUE_DEPTH,
+                        help="backlog above which only the newest snapshots per symbol are kept, 0 disables")
+    parser.add_argument("--keep-newest", type=int, default=KEEP_NEWEST, help="snapshots kept per symbol when shedding")
+    parser.add_argument("--max-age-ms", type=int, default=MAX_AGE_MS, help="drop snapshots ingested longer ago, 0 disables")
+    parser.add_argument("--wire-format", choices=FORMATS, default=WIRE_FORMAT,
+                        help="result encoding (struct: fixed float32 layout, see wire.py)")
+    parser.add_argument("--latest-ttl", type=int, default=LATEST_TTL, help="seconds latest:<symbol> is kept")
+    parser.add_argument("--max-skips", type=int, default=MAX_SKIPS,
+                        help="unchanged snapshots in a row answered with the previous prediction, 0 always predicts")
+    parser.add_argument("--full-results", action="store_true",
+                        help="publish the whole backend response instead of the trimmed result (json only)")
+    parser.add_argument("--metrics-interval", type=float, default=METRICS_INTERVAL)
+    parser.add_argument("--no-trace", action="store_true",
+                        help="do not stamp messages with trace timings nor report per-hop latencies")
+    parser.add_argument("--history", choices=["none", "window", "session"], default=HISTORY,
+                        help="per-symbol snapshot history sent with each prediction")
+    parser.add_argument("--history-size", type=int, default=HISTORY_SIZE, help="snapshots per prediction window")
+    parser.add_argument("--mode", choices=["http", "embedded"], default="http",
+                        help="call the backend over HTTP or run its models in this process")
+    parser.add_argument("--backend-url", default=BACKEND_URL)
+    parser.add_argument("--backend-batch-url", default=BACKEND_BATCH_URL)
+    parser.add_argument("--backend-dir", default=None, help="backend sources for --mode embedded")
+    parser.add_argument("--inference-workers", type=int, default=1, help="inference threads for --mode embedded")
+    parser.add_argument("--timeout", type=float, default=REQUEST_TIMEOUT, help="backend request timeout in seconds")
+    parser.add_argument("--drain-timeout", type=float, default=DRAIN_TIMEOUT)
+    parser.add_argument("--redis-host", default=REDIS_HOST)
+    parser.add_argument("--redis-port", type=int, default=REDIS_PORT)
+    return parser
+
+
+def parse_args():
+    return build_parser().parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(serve(parse_args()))
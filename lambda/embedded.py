@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+INFERENCE_WORKERS = 1  # threads running model forwards, torch parallelises inside each
+
+
+class EmbeddedBackend:
+    """
+    Runs backend/server.py preprocessing and models inside the consumer process,
+    for colocated deployments. Same interface as HttpBackend, but payloads are
+    handed over as Python objects: no JSON encoding and no loopback hop.
+    """
+
+    def __init__(self, backend_dir=None, workers=INFERENCE_WORKERS, load=True):
+        backend_dir = os.path.abspath(backend_dir or BACKEND_DIR)
+        if backend_dir not in sys.path:
+            sys.path.append(backend_dir)
+        import server  # backend/server.py, imports torch and the models
+
+        self._server = server
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inference")
+        profile_path = server.SERVING_PROFILE_PATH
+        if not os.path.isabs(profile_path):
+            profile_path = os.path.join(backend_dir, profile_path)
+        server.load_serving_profile(profile_path)
+        if load:
+            # load=False keeps models the caller already set up (e.g. benchmarks.replay)
+            server.load_models()
+        logger.info(f"Embedded inference ready using {backend_dir}")
+
+    def _predict_blocks(self, payloads):
+        server = self._server
+        received_ms = server.wall_ms()
+        blocks, positions, results = [], [], [None] * len(payloads)
+        decode_ms = [0.0] * len(payloads)
+        for i, payload in enumerate(payloads):
+            start = time.perf_counter()
+            try:
+                blocks.append(self._server.resolve_payload(payload))
+            except self._server.SessionConflict as e:
+                results[i] = {"error": str(e), "session_conflict": True}
+                continue
+            except (KeyError, ValueError) as e:
+                logger.error(f"Invalid order book payload: {e}")
+                continue
+            decode_ms[i] = server.elapsed_ms(start)
+            positions.append(i)
+        if blocks:
+            start = time.perf_counter()
+            predictions = server.predict_batch_from_features(blocks)
+            inference_ms = server.elapsed_ms(start)
+            for i, result in zip(positions, predictions):
+                results[i] = server.trace_result(result, payloads[i].get("trace"), received_ms,
+                                                 {"decode": decode_ms[i], "inference": inference_ms})
+        return results
+
+    async def _run(self, payloads):
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._executor, self._predict_blocks, payloads)
+        except Exception as e:
+            logger.error(f"Embedded inference error: {e}")
+            return [None] * len(payloads)
+
+    async def predict(self, payload):
+        """Predict one payload in process, returns the result or None on error"""
+        return (await self._run([payload]))[0]
+
+    async def predict_batch(self, payloads):
+        """Predict several payloads with one forward pass per model"""
+        return await self._run(payloads)
+
+    async def aclose(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,119 @@
+import base64
+from itertools import chain
+
+import numpy as np
+
+# Configuration
+N_LOB_LEVELS = 10  # levels consumed by the models
+LEN_LEVEL = 4  # bid_price, bid_qty, ask_price, ask_qty
+HISTORY_SIZE = 384  # snapshots sent per window, the longest model sequence (MLPLOB)
+
+
+def orderbook_to_levels(orderbook_data, num_levels=None):
+    """
+    Parse the Binance "bids"/"asks" [price, qty] string pairs (or [levels, 2] arrays) into one array
+    Output: float64 [num_levels, 4] with columns bid_price, bid_qty, ask_price, ask_qty,
+    zero-padded where one side is shallower; num_levels defaults to the deeper side
+    """
+    bids = orderbook_data.get("bids", [])
+    asks = orderbook_data.get("asks", [])
+    if num_levels is None:
+        num_levels = max(len(bids), len(asks))
+    levels = np.zeros((num_levels, LEN_LEVEL), dtype=np.float64)
+    for column, side in ((0, bids), (2, asks)):
+        side = side[:num_levels]
+        if isinstance(side, np.ndarray):
+            # Already numeric, e.g. decoded from the struct wire format
+            levels[:len(side), column:column + 2] = side
+        elif side:
+            # One pass over the flattened pairs, no intermediate string array
+            pairs = np.fromiter(map(float, chain.from_iterable(side)), dtype=np.float64, count=2 * len(side))
+            levels[:len(side), column:column + 2] = pairs.reshape(-1, 2)
+    return levels
+
+
+def orderbook_to_feature_row(orderbook_data):
+    """
+    One Binance order book snapshot as the backend's feature row
+    Output: float32 [N_LOB_LEVELS * 4], per level bid_price, bid_qty, ask_price, ask_qty,
+    zero-padded when the book is shallower than N_LOB_LEVELS
+    """
+    return orderbook_to_levels(orderbook_data, N_LOB_LEVELS).astype(np.float32).reshape(-1)
+
+
+class SnapshotHistory:
+    """
+    Bounded history of one symbol's feature rows, addressed by absolute sequence
+    numbers (0 for the first snapshot ever appended).
+    Rows are written twice into a buffer of 2 * capacity, so every retained range
+    is a single contiguous slice.
+    """
+
+    def __init__(self, capacity=2 * HISTORY_SIZE):
+        self.capacity = capacity
+        self.features = np.zeros((2 * capacity, N_LOB_LEVELS * LEN_LEVEL), dtype=np.float32)
+        self.timestamps = np.zeros(2 * capacity, dtype=np.int64)
+        self.total = 0  # snapshots appended so far, i.e. the next sequence number
+
+    def append(self, row, timestamp):
+        """Append one feature row, returns its sequence number"""
+        position = self.total % self.capacity
+        self.features[position] = row
+        self.features[position + self.capacity] = row
+        self.timestamps[position] = timestamp
+        self.timestamps[position + self.capacity] = timestamp
+        self.total += 1
+        return self.total - 1
+
+    def retained(self, start):
+        """True if snapshot `start` has not been overwritten yet"""
+        return start >= max(0, self.total - self.capacity)
+
+    def window(self, start, end):
+        """
+        Views of the rows and timestamps of sequence numbers [start, end),
+        or None if part of the range is no longer retained
+        """
+        if start > end or not self.retained(start) or end > self.total or end - start > self.capacity:
+            return None
+        offset = start % self.capacity
+        return self.features[offset:offset + end - start], self.timestamps[offset:offset + end - start]
+
+
+def features_payload(symbol, features, timestamps, **fields):
+    """Pre-shaped /api/predict-json payload carrying raw float32 feature rows"""
+    payload = {
+        "symbol": symbol,
+        "timestamps": timestamps.tolist(),
+        "features_b64": base64.b64encode(np.ascontiguousarray(features, dtype="<f4").tobytes()).decode("ascii"),
+    }
+    payload.update(fields)
+    return payload
+
+
+def window_payload(symbol, history, seq, size=HISTORY_SIZE):
+    """
+    Payload predicting only the newest window ending at snapshot `seq`,
+    with up to `size` snapshots of history; None if `seq` is no longer retained
+    """
+    if not history.retained(seq):
+        return None
+    window = history.window(max(0, seq + 1 - size, history.total - history.capacity), seq + 1)
+    return features_payload(symbol, *window, latest_only=True)
+
+
+def session_payload(symbol, history, seq, acked, size=HISTORY_SIZE):
+    """
+    Payload for a backend session that already holds snapshots [.., acked):
+    only the delta up to `seq` is shipped. When the session is unknown (acked is None)
+    or the delta is no longer retained, the session is reset with a full window.
+    """
+    if not history.retained(seq):
+        return None
+    if acked is not None and acked <= seq:
+        delta = history.window(acked, seq + 1)
+        if delta is not None:
+            return features_payload(symbol, *delta, session_id=symbol, session_seq=acked, latest_only=True)
+    window = history.window(max(0, seq + 1 - size, history.total - history.capacity), seq + 1)
+    return features_payload(symbol, *window, session_id=symbol, session_seq=seq + 1 - len(window[0]),
+                            session_reset=True, latest_only=True)
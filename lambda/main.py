@@ -3,6 +3,7 @@ import json
 import time
 import logging
 from redis_client import redis_client
+from history import N_LOB_LEVELS, SnapshotHistory, orderbook_to_feature_row, orderbook_to_levels, window_payload
 
 # Configure logging
 logging.basicConfig(
@@ -13,47 +14,81 @@ logger = logging.getLogger(__name__)
 
 # Configuration
 BACKEND_URL = "http://localhost:8001/api/predict-json"
+BACKEND_BATCH_URL = "http://localhost:8001/api/predict-batch"
 LOB_QUEUE = "lob_queue"
-RESULTS_QUEUE = "results_queue"
+RESULTS_CHANNEL = "predictions"  # pub/sub channel prefix, one channel per symbol
+LATEST_KEY = "latest"  # key prefix of the newest result per symbol
+LATEST_TTL = 300  # seconds, latest:<symbol> expires once a symbol stops getting results
 RETRY_DELAY = 5  # seconds
+DEFAULT_SYMBOL = "BTCUSDT"
+
+# Backpressure: when the backend falls behind, skip to the freshest snapshots
+MAX_QUEUE_DEPTH = 200  # backlog above which only the newest snapshots per symbol are kept
+KEEP_NEWEST = 5  # snapshots kept per symbol when shedding a backlog
+MAX_AGE_MS = 30_000  # snapshots ingested longer ago than this are dropped, 0 disables
+
+shed_stats = {"stale": 0, "coalesced": 0}
+
+# Recent snapshots per symbol, so every prediction sees a full model window
+histories = {}
+
+def results_channel(symbol):
+    return f"{RESULTS_CHANNEL}:{symbol}"
+
+def latest_key(symbol):
+    return f"{LATEST_KEY}:{symbol}"
+
+def publish_result(symbol, result_str, latest_ttl=LATEST_TTL):
+    """PUBLISH a result on predictions:<symbol> and keep it in latest:<symbol> for late joiners, in one round trip"""
+    pipe = redis_client.get_redis().pipeline(transaction=False)
+    pipe.publish(results_channel(symbol), result_str)
+    pipe.set(latest_key(symbol), result_str, ex=latest_ttl)
+    pipe.execute()
 
 def transform_orderbook_to_csv_format(orderbook_data):
     """
     Transform Binance order book format to the format expected by backend
     Input: {"bids": [[price, qty], ...], "asks": [[price, qty], ...]}
     Output: List of dicts with timestamp, symbol, bid_qty, bid_price, ask_price, ask_qty
+    All rows share one timestamp, so the backend keeps them in one snapshot
     """
     try:
-        bids = orderbook_data.get("bids", [])
-        asks = orderbook_data.get("asks", [])
-        
-        # Create rows for each price level
-        rows = []
-        max_levels = max(len(bids), len(asks))
+        levels = orderbook_to_levels(orderbook_data)
+        timestamp = int(time.time() * 1000)  # milliseconds
+        symbol = orderbook_data.get("symbol", DEFAULT_SYMBOL)
         
-        for i in range(max_levels):
-            row = {
-                "timestamp": int(time.time() * 1000),  # milliseconds
-                "symbol": "BTCUSDT"
+        return [
+            {
+                "timestamp": timestamp,
+                "symbol": symbol,
+                "bid_price": bid_price,
+                "bid_qty": bid_qty,
+                "ask_price": ask_price,
+                "ask_qty": ask_qty
             }
-            
-            if i < len(bids):
-                row["bid_price"] = float(bids[i][0])
-                row["bid_qty"] = float(bids[i][1])
-            else:
-                row["bid_price"] = 0.0
-                row["bid_qty"] = 0.0
-            
-            if i < len(asks):
-                row["ask_price"] = float(asks[i][0])
-                row["ask_qty"] = float(asks[i][1])
-            else:
-                row["ask_price"] = 0.0
-                row["ask_qty"] = 0.0
-            
-            rows.append(row)
+            for bid_price, bid_qty, ask_price, ask_qty in levels.tolist()
+        ]
+    except Exception as e:
+        logger.error(f"Error transforming order book data: {e}")
+        raise
+
+def transform_orderbook_to_columnar(orderbook_data):
+    """
+    Transform Binance order book format to the pre-shaped payload of /api/predict-json
+    Input: {"bids": [[price, qty], ...], "asks": [[price, qty], ...]}
+    Output: {"symbol": ..., "timestamps": [ts], "bids": [[[price, qty], ...]], "asks": [[[price, qty], ...]]}
+    with one snapshot of the top N_LOB_LEVELS levels
+    """
+    try:
+        bids = orderbook_data.get("bids", [])[:N_LOB_LEVELS]
+        asks = orderbook_data.get("asks", [])[:N_LOB_LEVELS]
         
-        return rows
+        return {
+            "symbol": orderbook_data.get("symbol", DEFAULT_SYMBOL),
+            "timestamps": [int(time.time() * 1000)],  # milliseconds
+            "bids": [[[float(price), float(qty)] for price, qty in bids]],
+            "asks": [[[float(price), float(qty)] for price, qty in asks]]
+        }
     except Exception as e:
         logger.error(f"Error transforming order book data: {e}")
         raise
@@ -61,18 +96,24 @@ def transform_orderbook_to_csv_format(orderbook_data):
 def call_backend_api(orderbook_data):
     """
     Call the Python backend API with order book data
+    The snapshot is appended to its symbol's history and the backend predicts
+    on the newest window of that history
     Returns prediction results or None on error
     """
     try:
-        # Transform data to expected format
-        csv_format_data = transform_orderbook_to_csv_format(orderbook_data)
+        symbol = orderbook_data.get("symbol", DEFAULT_SYMBOL)
+        history = histories.get(symbol)
+        if history is None:
+            history = histories[symbol] = SnapshotHistory()
+        seq = history.append(orderbook_to_feature_row(orderbook_data), int(time.time() * 1000))
+        payload = window_payload(symbol, history, seq)
         
-        logger.info(f"Calling backend API with {len(csv_format_data)} rows")
+        logger.info(f"Calling backend API with {len(payload['timestamps'])} snapshot(s)")
         
         # Call backend API
         response = requests.post(
             BACKEND_URL,
-            json={"data": csv_format_data},
+            json=payload,
             headers={"Content-Type": "application/json"},
             timeout=30
         )
@@ -95,29 +136,71 @@ def call_backend_api(orderbook_data):
         logger.error(f"Error calling backend API: {e}")
         return None
 
+def is_stale(orderbook_data, now_ms, max_age_ms=MAX_AGE_MS):
+    """True if the snapshot was ingested (orchestrator "ingest_ts", ms) more than max_age_ms ago"""
+    ingest_ts = orderbook_data.get("ingest_ts")
+    return bool(max_age_ms) and ingest_ts is not None and now_ms - ingest_ts > max_age_ms
+
+def keep_newest(orderbooks, keep=KEEP_NEWEST):
+    """Indices of the newest `keep` order books of every symbol, in queue order"""
+    counts = {}
+    kept = []
+    for i in range(len(orderbooks) - 1, -1, -1):
+        symbol = orderbooks[i].get("symbol", DEFAULT_SYMBOL)
+        if counts.get(symbol, 0) < keep:
+            counts[symbol] = counts.get(symbol, 0) + 1
+            kept.append(i)
+    return kept[::-1]
+
+def shed_backlog(messages):
+    """
+    If lob_queue holds more than MAX_QUEUE_DEPTH messages, pop the whole backlog
+    and keep only the newest KEEP_NEWEST snapshots per symbol
+    Returns the messages to process, oldest first
+    """
+    r = redis_client.get_redis()
+    depth = r.llen(LOB_QUEUE)
+    if depth <= MAX_QUEUE_DEPTH:
+        return messages
+    messages = messages + (r.rpop(LOB_QUEUE, depth) or [])
+    orderbooks = []
+    for data in messages:
+        try:
+            orderbooks.append(json.loads(data))
+        except json.JSONDecodeError:
+            orderbooks.append({})
+    kept = [messages[i] for i in keep_newest(orderbooks)]
+    shed_stats["coalesced"] += len(messages) - len(kept)
+    logger.warning(f"Backlog of {len(messages)} messages on {LOB_QUEUE}, kept the newest {len(kept)} "
+                   f"(shed so far: {shed_stats})")
+    return kept
+
 def process_data(data_str):
     """
     Process order book data from Redis queue
     1. Parse JSON data
     2. Call backend API
-    3. Push results to results queue
+    3. Publish the result on its symbol's channel (see publish_result)
     """
     try:
         # Parse JSON data
         orderbook_data = json.loads(data_str)
+        if is_stale(orderbook_data, time.time() * 1000):
+            shed_stats["stale"] += 1
+            logger.warning(f"Dropped snapshot older than {MAX_AGE_MS} ms (shed so far: {shed_stats})")
+            return False
         logger.info(f"Processing order book data with {len(orderbook_data.get('bids', []))} bids and {len(orderbook_data.get('asks', []))} asks")
         
         # Call backend API
         result = call_backend_api(orderbook_data)
         
         if result:
-            # Push result to results queue
-            result_str = json.dumps(result)
-            redis_client.push(RESULTS_QUEUE, result_str)
-            logger.info(f"Pushed result to {RESULTS_QUEUE}")
+            symbol = orderbook_data.get("symbol", DEFAULT_SYMBOL)
+            publish_result(symbol, json.dumps(result))
+            logger.info(f"Published result to {results_channel(symbol)}")
             return True
         else:
-            logger.warning("No result from backend API, skipping push to results queue")
+            logger.warning("No result from backend API, nothing published")
             return False
             
     except json.JSONDecodeError as e:
@@ -133,7 +216,7 @@ def main():
     """
     logger.info(f"Starting Lambda processor...")
     logger.info(f"Listening to queue: {LOB_QUEUE}")
-    logger.info(f"Publishing results to: {RESULTS_QUEUE}")
+    logger.info(f"Publishing results to: {results_channel('<symbol>')}, {latest_key('<symbol>')}")
     logger.info(f"Backend API: {BACKEND_URL}")
     
     while True:
@@ -145,7 +228,8 @@ def main():
             if result:
                 queue_name, data = result
                 logger.info(f"Received message from {queue_name}")
-                process_data(data)
+                for data in shed_backlog([data]):
+                    process_data(data)
             
         except KeyboardInterrupt:
             logger.info("Shutting down gracefully...")
@@ -0,0 +1,220 @@
+import logging
+import os
+import socket
+import time
+
+from redis.exceptions import ResponseError
+
+from main import LOB_QUEUE
+from wire import encode_orderbook
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+LOB_STREAM = "lob_stream"  # shard streams are lob_stream:0, lob_stream:1, ...
+STREAM_SHARDS = 4
+CONSUMER_GROUP = "lambda"
+STREAM_MAXLEN = 100_000  # approximate entries kept per shard
+CLAIM_IDLE_MS = 30_000  # pending entries idle this long belong to a dead consumer
+CLAIM_INTERVAL = 5  # seconds between reclaim passes
+MAX_DELIVERIES = 5  # reclaimed entries delivered more often than this are dead-lettered
+DEAD_LETTER_STREAM = f"{LOB_STREAM}:dead"
+POP_TIMEOUT = 1  # seconds, bounds how long shutdown waits on an idle source
+
+
+def _text(value):
+    """Redis replies are bytes on connections without decode_responses (binary wire formats)"""
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _data(fields):
+    return fields.get(b"data", fields.get("data"))
+
+
+def shard_of(symbol, shards=STREAM_SHARDS):
+    """Stable shard of a symbol (32-bit FNV-1a, same as orchestator/utils.ts)"""
+    h = 0x811C9DC5
+    for byte in symbol.encode():
+        h = ((h ^ byte) * 0x01000193) & 0xFFFFFFFF
+    return h % shards
+
+
+def stream_key(shard):
+    return f"{LOB_STREAM}:{shard}"
+
+
+async def publish_orderbook(redis, orderbook_data, shards=STREAM_SHARDS, maxlen=STREAM_MAXLEN, fmt="json"):
+    """XADD one order book message to the shard stream of its symbol"""
+    symbol = orderbook_data.get("symbol", "BTCUSDT")
+    return await redis.xadd(stream_key(shard_of(symbol, shards)), {"data": encode_orderbook(orderbook_data, fmt)},
+                            maxlen=maxlen, approximate=True)
+
+
+class ListSource:
+    """lob_queue as a Redis list: messages are gone once popped, ack is a no-op"""
+
+    def __init__(self, redis, queue=LOB_QUEUE):
+        self.redis = redis
+        self.queue = queue
+
+    @property
+    def name(self):
+        return self.queue
+
+    async def fetch(self, count):
+        """Block for one message, then take whatever else is queued up to count"""
+        message = await self.redis.brpop(self.queue, timeout=POP_TIMEOUT)
+        if message is None:
+            return []
+        messages = [message[1]]
+        if count > 1:
+            # RPOP with a count (Redis >= 6.2) keeps FIFO order in a single round trip
+            messages.extend(await self.redis.rpop(self.queue, count - 1) or [])
+        return [(None, data) for data in messages]
+
+    async def ack(self, ids):
+        pass
+
+    async def depth(self):
+        """Messages waiting to be fetched"""
+        return await self.redis.llen(self.queue)
+
+    async def lag(self):
+        return {self.queue: {"length": await self.depth()}}
+
+
+class StreamSource:
+    """
+    Shard streams read through a consumer group.
+    Each symbol maps to one shard and each shard should be read by one consumer
+    process at a time (--shard-ids), which keeps per-symbol order while
+    throughput scales with the number of processes.
+    Entries stay pending until acked, so a consumer that crashes between read
+    and publish does not lose them: on restart under the same name it replays
+    its own pending entries first, and other consumers reclaim entries that
+    stayed idle longer than claim_idle_ms. Reclaimed entries are late, their
+    results can land after newer results of the same symbol. Entries whose
+    results keep failing are moved to the dead_letter stream once they have
+    been delivered more than max_deliveries times.
+    """
+
+    def __init__(self, redis, shard_ids=None, shards=STREAM_SHARDS, group=CONSUMER_GROUP, consumer_name=None,
+                 claim_idle_ms=CLAIM_IDLE_MS, max_deliveries=MAX_DELIVERIES, dead_letter=DEAD_LETTER_STREAM):
+        self.redis = redis
+        self.group = group
+        self.consumer_name = consumer_name or f"{socket.gethostname()}-{os.getpid()}"
+        self.claim_idle_ms = claim_idle_ms
+        self.max_deliveries = max_deliveries
+        self.dead_letter = dead_letter
+        self.keys = [stream_key(shard) for shard in (range(shards) if shard_ids is None else shard_ids)]
+        # Read position per stream: "0" replays this consumer's own pending entries, ">" reads new ones
+        self._cursors = {key: "0" for key in self.keys}
+        self._claim_cursors = {key: "0-0" for key in self.keys}
+        self._next_claim = 0.0
+        self._ready = False
+
+    @property
+    def name(self):
+        return ",".join(self.keys)
+
+    async def _ensure_groups(self):
+        for key in self.keys:
+            try:
+                await self.redis.xgroup_create(key, self.group, id="0", mkstream=True)
+            except ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+        self._ready = True
+
+    async def fetch(self, count):
+        """Own pending entries after a restart, then reclaimed, then new ones, about count in total"""
+        if not self._ready:
+            await self._ensure_groups()
+        replaying = any(cursor != ">" for cursor in self._cursors.values())
+        if not replaying:
+            # Only once replay is over, reclaimed entries join this consumer's pending list
+            messages = await self._reclaim(count)
+            if messages:
+                return messages
+        per_stream = max(1, -(-count // len(self.keys)))
+        response = await self.redis.xreadgroup(self.group, self.consumer_name, self._cursors, count=per_stream,
+                                               block=None if replaying else POP_TIMEOUT * 1000)
+        entries = {_text(key): stream_entries for key, stream_entries in response or []}
+        for key, cursor in self._cursors.items():
+            if cursor == ">":
+                continue
+            if entries.get(key):
+                self._cursors[key] = entries[key][-1][0]
+            else:
+                self._cursors[key] = ">"
+        messages = [((key, entry_id), _data(fields))
+                    for key, stream_entries in entries.items() for entry_id, fields in stream_entries if fields]
+        if replaying and not messages:
+            # Nothing (left) to replay, wait for new entries instead
+            return await self.fetch(count)
+        return messages
+
+    async def _reclaim(self, count):
+        if time.monotonic() < self._next_claim:
+            return []
+        messages = []
+        for key in self.keys:
+            cursor, claimed, *_ = await self.redis.xautoclaim(key, self.group, self.consumer_name,
+                                                              min_idle_time=self.claim_idle_ms,
+                                                              start_id=self._claim_cursors[key], count=count)
+            self._claim_cursors[key] = _text(cursor)
+            claimed = await self._dead_letter(key, [(entry_id, fields) for entry_id, fields in claimed if fields])
+            messages.extend(((key, entry_id), _data(fields)) for entry_id, fields in claimed)
+        # Keep scanning on the next fetch until every pending list has been walked through
+        if all(cursor == "0-0" for cursor in self._claim_cursors.values()):
+            self._next_claim = time.monotonic() + CLAIM_INTERVAL
+        if messages:
+            logger.warning(f"Reclaimed {len(messages)} pending entries idle for over {self.claim_idle_ms} ms")
+        return messages
+
+    async def _dead_letter(self, key, claimed):
+        """Move claimed entries delivered more than max_deliveries times to the dead_letter stream, returns the others"""
+        if not claimed:
+            return claimed
+        pipe = self.redis.pipeline(transaction=False)
+        for entry_id, _ in claimed:
+            pipe.xpending_range(key, self.group, min=entry_id, max=entry_id, count=1)
+        deliveries = [pending[0]["times_delivered"] if pending else 0 for pending in await pipe.execute()]
+        dead = [(entry_id, fields) for (entry_id, fields), times in zip(claimed, deliveries) if times > self.max_deliveries]
+        if not dead:
+            return claimed
+        pipe = self.redis.pipeline(transaction=True)
+        for entry_id, fields in dead:
+            pipe.xadd(self.dead_letter, {"data": _data(fields), "stream": key, "id": entry_id})
+        pipe.xack(key, self.group, *(entry_id for entry_id, _ in dead))
+        await pipe.execute()
+        logger.error(f"Dead-lettered {len(dead)} entries of {key} to {self.dead_letter} "
+                     f"after more than {self.max_deliveries} deliveries")
+        return [entry for entry, times in zip(claimed, deliveries) if times <= self.max_deliveries]
+
+    async def ack(self, ids):
+        """XACK entries once their results are published"""
+        by_key = {}
+        for key, entry_id in ids:
+            by_key.setdefault(key, []).append(entry_id)
+        for key, entry_ids in by_key.items():
+            await self.redis.xack(key, self.group, *entry_ids)
+
+    async def depth(self):
+        """Entries not yet delivered to the group, summed over the shards"""
+        return sum(shard["lag"] or 0 for shard in (await self.lag()).values())
+
+    async def lag(self):
+        """Per shard: entries not yet delivered to the group, delivered but unacked, stream length"""
+        if not self._ready:
+            await self._ensure_groups()
+        metrics = {}
+        for key in self.keys:
+            groups = {_text(group["name"]): group for group in await self.redis.xinfo_groups(key)}
+            group = groups.get(self.group, {})
+            metrics[key] = {
+                "lag": group.get("lag"),
+                "pending": group.get("pending", 0),
+                "length": await self.redis.xlen(key),
+            }
+        return metrics
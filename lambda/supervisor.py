@@ -0,0 +1,194 @@
+"""
+Consumer pool: runs N consumer.py processes over the symbol-sharded streams
+
+Symbols map to shard streams (sources.shard_of), shards map to workers through
+a consistent hash ring, so every symbol is handled by exactly one process and
+adding a worker moves only ~1/N of the shards. Crashed workers are restarted
+under the same consumer name, which replays their pending entries, and worker
+metrics are aggregated here.
+
+Use more shards than workers (orchestrator LOB_STREAM_SHARDS = --stream-shards):
+    python supervisor.py --workers 4 --stream-shards 64
+"""
+import bisect
+import copy
+import hashlib
+import logging
+import multiprocessing
+import queue
+import signal
+import time
+
+from consumer import build_parser, serve
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+WORKERS = max(1, multiprocessing.cpu_count() - 1)
+RING_REPLICAS = 100  # virtual nodes per worker on the hash ring
+REPORT_INTERVAL = 5  # seconds between metric reports of a worker
+RESTART_DELAY = 1  # seconds, doubled while a worker keeps crashing right after start
+MAX_RESTART_DELAY = 30
+STABLE_AFTER = 30  # seconds a worker must stay up to reset its restart delay
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes"""
+
+    def __init__(self, nodes, replicas=RING_REPLICAS):
+        points = sorted((_hash(f"{node}#{i}"), node) for node in nodes for i in range(replicas))
+        self._keys = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node_for(self, key):
+        i = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._nodes[i]
+
+
+def worker_name(prefix, index):
+    return f"{prefix}-{index}"
+
+
+def assign_shards(num_shards, names):
+    """Shard ids of every worker name"""
+    ring = HashRing(names)
+    assignment = {name: [] for name in names}
+    for shard in range(num_shards):
+        assignment[ring.node_for(f"shard-{shard}")].append(shard)
+    return assignment
+
+
+def run_worker(name, shard_ids, args, metrics_queue):
+    """Worker process: one stream consumer over its shards, reporting metrics to the supervisor"""
+    import asyncio
+    args = copy.copy(args)
+    args.source = "stream"
+    args.shard_ids = shard_ids
+    args.consumer_name = name
+    args.metrics_interval = min(args.metrics_interval, REPORT_INTERVAL)
+    asyncio.run(serve(args, report=lambda metrics: metrics_queue.put((name, metrics))))
+
+
+def aggregate(latest, retired=None):
+    """
+    Sum of the workers' last reported stats (plus those of restarted workers), merged per-shard lag;
+    latency percentiles do not add up, they are listed per worker
+    """
+    totals = {"workers": len(latest), "in_flight": 0, "stats": dict(retired or {}), "lag": {}, "latency": {}}
+    for name, metrics in latest.items():
+        totals["in_flight"] += metrics["in_flight"]
+        for key, value in metrics["stats"].items():
+            totals["stats"][key] = totals["stats"].get(key, 0) + value
+        totals["lag"].update(metrics["lag"])
+        if "latency" in metrics:
+            totals["latency"][name] = metrics["latency"]
+    received = totals["stats"].get("received", 0)
+    totals["skip_rate"] = round(totals["stats"].get("skipped", 0) / received, 4) if received else 0.0
+    totals["backlog"] = sum(shard.get("lag") or 0 for shard in totals["lag"].values())
+    return totals
+
+
+class Supervisor:
+    def __init__(self, args, workers=WORKERS, prefix="consumer"):
+        self.args = args
+        self.names = [worker_name(prefix, i) for i in range(workers)]
+        self.assignment = assign_shards(args.stream_shards, self.names)
+        self._ctx = multiprocessing.get_context("spawn")
+        self.metrics_queue = self._ctx.Queue()
+        self.latest = {}  # worker name -> last reported metrics
+        self.retired = {}  # stats of worker processes that exited, so totals survive restarts
+        self.restarts = {name: 0 for name in self.names}
+        self._processes = {}
+        self._started = {}
+        self._delay = {name: RESTART_DELAY for name in self.names}
+        self._stopping = False
+
+    def start(self, name):
+        process = self._ctx.Process(target=run_worker, name=name,
+                                    args=(name, self.assignment[name], self.args, self.metrics_queue))
+        process.start()
+        self._processes[name] = process
+        self._started[name] = time.monotonic()
+        logger.info(f"Started {name} (pid {process.pid}) on shards {self.assignment[name]}")
+
+    def stop(self, *_):
+        self._stopping = True
+
+    def _check_workers(self):
+        for name, process in list(self._processes.items()):
+            if process.is_alive() or self._stopping:
+                continue
+            uptime = time.monotonic() - self._started[name]
+            self._delay[name] = RESTART_DELAY if uptime > STABLE_AFTER else min(self._delay[name] * 2, MAX_RESTART_DELAY)
+            logger.error(f"{name} exited with code {process.exitcode} after {uptime:.0f}s, "
+                         f"restarting in {self._delay[name]}s")
+            self.restarts[name] += 1
+            for key, value in self.latest.pop(name, {}).get("stats", {}).items():
+                self.retired[key] = self.retired.get(key, 0) + value
+            time.sleep(self._delay[name])
+            self.start(name)
+
+    def _collect(self, timeout):
+        try:
+            name, metrics = self.metrics_queue.get(timeout=timeout)
+            self.latest[name] = metrics
+            while True:
+                name, metrics = self.metrics_queue.get_nowait()
+                self.latest[name] = metrics
+        except queue.Empty:
+            pass
+
+    def metrics(self):
+        metrics = aggregate(self.latest, self.retired)
+        metrics["restarts"] = dict(self.restarts)
+        return metrics
+
+    def run(self):
+        empty = [name for name, shards in self.assignment.items() if not shards]
+        if empty:
+            logger.warning(f"{len(empty)} worker(s) got no shard and are not started, "
+                           f"use more --stream-shards than --workers")
+        for name in self.names:
+            if name not in empty:
+                self.start(name)
+        next_log = time.monotonic() + self.args.metrics_interval
+        while not self._stopping:
+            self._collect(timeout=1)
+            self._check_workers()
+            if time.monotonic() >= next_log:
+                next_log = time.monotonic() + self.args.metrics_interval
+                logger.info(f"Pool metrics: {self.metrics()}")
+        self.shutdown()
+
+    def shutdown(self):
+        # SIGTERM makes each consumer stop reading and drain its in-flight batches
+        logger.info("Stopping workers...")
+        for process in self._processes.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + self.args.drain_timeout + 5
+        for process in self._processes.values():
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.kill()
+        logger.info(f"Workers stopped. {self.metrics()}")
+
+
+def main():
+    parser = build_parser("Supervisor running a pool of stream consumers sharded by symbol")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="consumer processes")
+    parser.add_argument("--worker-prefix", default="consumer",
+                        help="consumer names are <prefix>-<i>, keep them stable so restarts replay pending entries")
+    args = parser.parse_args()
+    supervisor = Supervisor(args, workers=args.workers, prefix=args.worker_prefix)
+    signal.signal(signal.SIGINT, supervisor.stop)
+    signal.signal(signal.SIGTERM, supervisor.stop)
+    supervisor.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,16 @@
 #!/usr/bin/env python3
 """
 Test script to verify the Redis-Backend-WebSocket integration
-This script pushes test order book data to the lob_queue
+This script pushes test order book data to the lob_queue and waits for its
+prediction on the predictions:BTCUSDT channel
 """
 
 import redis
 import json
 import time
 
+from tracing import hop_latencies, stamp
+
 # Connect to Redis
 r = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
 
@@ -39,21 +42,29 @@ test_orderbook = {
     ]
 }
 
+# Subscribe first, pub/sub does not keep messages for late subscribers
+pubsub = r.pubsub(ignore_subscribe_messages=True)
+pubsub.subscribe("predictions:BTCUSDT")
+
 print("Pushing test order book data to lob_queue...")
-r.lpush("lob_queue", json.dumps(test_orderbook))
+r.lpush("lob_queue", json.dumps({**test_orderbook, "ingest_ts": int(time.time() * 1000)}))
 print("✓ Test data pushed successfully!")
 
-print("\nWaiting for results in results_queue...")
+print("\nWaiting for results on predictions:BTCUSDT...")
 print("(Press Ctrl+C to stop)")
 
 try:
     while True:
-        result = r.brpop("results_queue", timeout=5)
+        result = pubsub.get_message(timeout=5)
         if result:
-            queue_name, data = result
-            print(f"\n✓ Received result from {queue_name}:")
-            result_json = json.loads(data)
+            print(f"\n✓ Received result from {result['channel']}:")
+            result_json = json.loads(result["data"])
             print(json.dumps(result_json, indent=2))
+            if "trace" in result_json:
+                print("\nLatency per hop (ms):")
+                for hop, latency in hop_latencies(stamp(result_json["trace"], "delivered_ts")).items():
+                    print(f"  {hop}: {latency:.2f}")
+            print(f"\n✓ latest:BTCUSDT holds the same result: {r.get('latest:BTCUSDT') == result['data']}")
             break
         else:
             print(".", end="", flush=True)
@@ -0,0 +1,72 @@
+"""BookSource reconnecting a dropped live stream and resyncing its books"""
+import asyncio
+
+import book
+from book import BookSource
+
+
+def diffs(symbol, first, count):
+    return [{"s": symbol, "U": first + i, "u": first + i, "E": (first + i) * 1000, "b": [["100.0", str(i + 1)]], "a": []}
+            for i in range(count)]
+
+
+def test_reconnects_and_resyncs(monkeypatch):
+    monkeypatch.setattr(book, "RECONNECT_DELAY", 0.01)
+    # first connection drops after a few diffs, the second is refused, the third stays up
+    connections = [(diffs("BTCUSDT", 11, 3), ConnectionError("dropped")), ([], OSError("refused")),
+                   (diffs("BTCUSDT", 51, 3), None)]
+    opened, snapshots = [], []
+
+    def events():
+        batch, error = connections[len(opened)]
+        opened.append(len(opened))
+
+        async def stream():
+            for event in batch:
+                yield event
+                await asyncio.sleep(0)
+            if error is not None:
+                raise error
+            await asyncio.Event().wait()
+
+        return stream()
+
+    async def fetch_snapshot(symbol):
+        # the snapshot of the current connection, just before its first diff
+        last_update_id = 10 if len(opened) == 1 else 50
+        snapshots.append(last_update_id)
+        return {"symbol": symbol, "lastUpdateId": last_update_id, "bids": [["100.0", "1"]], "asks": [["101.0", "1"]]}
+
+    async def run():
+        source = BookSource(events, fetch_snapshot, emit_interval_ms=1)
+        messages = []
+        for _ in range(20):
+            messages += await source.fetch(10)
+            lag = (await source.lag()).get("BTCUSDT", {})
+            if len(opened) == 3 and lag.get("last_update_id") == 53:
+                break
+        source._task.cancel()
+        return messages, lag, source.done
+
+    messages, lag, done = asyncio.run(run())
+    assert len(opened) == 3 and snapshots == [10, 50]
+    assert lag["synced"] and lag["resyncs"] == 1 and lag["snapshots"] == 2
+    assert not done
+    # diffs of the first connection, then of the third once resynced
+    assert [orderbook["event_ts"] for _, orderbook in messages] == [12000, 13000, 52000, 53000]
+
+
+def test_recorded_events_are_read_once():
+    async def recorded():
+        yield {"symbol": "BTCUSDT", "lastUpdateId": 10, "bids": [["100.0", "1"]], "asks": [["101.0", "1"]]}
+        for event in diffs("BTCUSDT", 11, 2):
+            yield event
+
+    async def run():
+        source = BookSource(recorded(), emit_interval_ms=1)
+        messages = await source.fetch(10)
+        await source._task
+        return messages, source.done
+
+    messages, done = asyncio.run(run())
+    assert done and [orderbook["event_ts"] for _, orderbook in messages] == [11000, 12000]
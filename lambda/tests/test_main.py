@@ -0,0 +1,33 @@
+"""main.py publishes its results where the orchestrator reads them"""
+import json
+
+import fakeredis
+
+import main
+from redis_client import redis_client
+
+
+def test_process_data_publishes_and_keeps_the_latest_result(monkeypatch):
+    redis = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(redis_client, "_redis", redis)
+    result = {"symbol": "ETHUSDT", "tlob": {"predictions": [1]}}
+    monkeypatch.setattr(main, "call_backend_api", lambda orderbook_data: result)
+    pubsub = redis.pubsub(ignore_subscribe_messages=True)
+    pubsub.psubscribe("predictions:*")
+    pubsub.get_message(timeout=1)
+
+    orderbook = {"symbol": "ETHUSDT", "bids": [["100.0", "1.0"]], "asks": [["101.0", "2.0"]]}
+    assert main.process_data(json.dumps(orderbook))
+    message = pubsub.get_message(timeout=1)
+    assert message["channel"] == "predictions:ETHUSDT" and json.loads(message["data"]) == result
+    assert json.loads(redis.get("latest:ETHUSDT")) == result
+    assert 0 < redis.ttl("latest:ETHUSDT") <= main.LATEST_TTL
+    assert not redis.exists("results_queue")
+
+
+def test_failed_prediction_publishes_nothing(monkeypatch):
+    redis = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(redis_client, "_redis", redis)
+    monkeypatch.setattr(main, "call_backend_api", lambda orderbook_data: None)
+    assert not main.process_data(json.dumps({"bids": [], "asks": []}))
+    assert not redis.exists("latest:BTCUSDT")
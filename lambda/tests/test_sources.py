@@ -0,0 +1,175 @@
+"""StreamSource on fakeredis: consumer group reads and acks, reclaim, dead-lettering, shards and lag"""
+import asyncio
+import json
+
+import fakeredis
+import pytest
+
+from sources import StreamSource, publish_orderbook, shard_of, stream_key
+
+SYMBOLS = ["BTCUSDT", "ETHUSDT", "SOLUSDT", "BNBUSDT", "XRPUSDT", "ADAUSDT", "DOGEUSDT", "LTCUSDT"]
+
+
+def orderbook(symbol, ts):
+    return {"symbol": symbol, "ingest_ts": ts, "bids": [["100.0", "1.0"]], "asks": [["101.0", "2.0"]]}
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def redis():
+    return fakeredis.aioredis.FakeRedis()
+
+
+async def publish(redis, symbols, count, shards=4):
+    for ts in range(count):
+        for symbol in symbols:
+            await publish_orderbook(redis, orderbook(symbol, ts), shards=shards)
+
+
+async def fetch_all(source, count=100):
+    messages = []
+    while True:
+        fetched = await source.fetch(count)
+        if not fetched:
+            return messages
+        messages.extend(fetched)
+
+
+def payloads(messages):
+    return [json.loads(data) for _, data in messages]
+
+
+def test_shard_of_is_stable_and_in_range():
+    for shards in (1, 4, 7):
+        for symbol in SYMBOLS:
+            assert 0 <= shard_of(symbol, shards) < shards
+            assert shard_of(symbol, shards) == shard_of(symbol, shards)
+    # 32-bit FNV-1a, as orchestator/utils.ts computes it
+    assert shard_of("", 2 ** 32) == 0x811C9DC5
+    assert shard_of("a", 2 ** 32) == 0xE40C292C
+    assert len({shard_of(symbol) for symbol in SYMBOLS}) > 1
+
+
+def test_messages_go_to_the_stream_of_their_symbol_shard(redis):
+    async def check():
+        await publish(redis, SYMBOLS, 3)
+        for symbol in SYMBOLS:
+            entries = await redis.xrange(stream_key(shard_of(symbol)))
+            assert sum(json.loads(fields[b"data"])["symbol"] == symbol for _, fields in entries) == 3
+        assert sum([await redis.xlen(stream_key(shard)) for shard in range(4)]) == 3 * len(SYMBOLS)
+
+    run(check())
+
+
+def test_read_and_ack(redis):
+    async def check():
+        await publish(redis, SYMBOLS, 5)
+        source = StreamSource(redis, consumer_name="a")
+        messages = await fetch_all(source, count=8)
+        assert len(messages) == 5 * len(SYMBOLS)
+        # per-symbol order is kept
+        for symbol in SYMBOLS:
+            assert [m["ingest_ts"] for m in payloads(messages) if m["symbol"] == symbol] == list(range(5))
+        assert sum(shard["pending"] for shard in (await source.lag()).values()) == len(messages)
+
+        await source.ack([message_id for message_id, _ in messages])
+        assert sum(shard["pending"] for shard in (await source.lag()).values()) == 0
+        # nothing is delivered twice
+        await publish(redis, SYMBOLS[:1], 1)
+        assert payloads(await source.fetch(10)) == [orderbook(SYMBOLS[0], 0)]
+
+    run(check())
+
+
+def test_restart_replays_own_pending_entries(redis):
+    async def check():
+        await publish(redis, SYMBOLS, 2)
+        first = await fetch_all(StreamSource(redis, consumer_name="a"))
+        await publish(redis, SYMBOLS, 1)
+        # the same consumer after a crash: its unacked entries come first, then the new ones
+        restarted = StreamSource(redis, consumer_name="a")
+        replayed = await fetch_all(restarted)
+        assert sorted(message_id for message_id, _ in replayed[:len(first)]) == sorted(message_id for message_id, _ in first)
+        assert len(replayed) == len(first) + len(SYMBOLS)
+
+    run(check())
+
+
+def test_reclaims_a_dead_consumers_pending_entries(redis):
+    async def check():
+        await publish(redis, SYMBOLS, 3)
+        dead = await fetch_all(StreamSource(redis, consumer_name="dead"))
+        assert dead
+
+        alive = StreamSource(redis, consumer_name="alive", claim_idle_ms=0)
+        reclaimed = await alive.fetch(100)
+        assert sorted(message_id for message_id, _ in reclaimed) == sorted(message_id for message_id, _ in dead)
+        for key in alive.keys:
+            assert all(entry["consumer"] == b"alive" for entry in await redis.xpending_range(key, "lambda", "-", "+", 100))
+
+        await alive.ack([message_id for message_id, _ in reclaimed])
+        assert sum(shard["pending"] for shard in (await alive.lag()).values()) == 0
+
+    run(check())
+
+
+def test_idle_threshold_protects_live_consumers(redis):
+    async def check():
+        await publish(redis, SYMBOLS, 1)
+        assert await fetch_all(StreamSource(redis, consumer_name="busy"))
+        # pending entries of a live consumer are not idle long enough to be reclaimed
+        assert await StreamSource(redis, consumer_name="other", claim_idle_ms=60_000).fetch(100) == []
+
+    run(check())
+
+
+def test_dead_letters_entries_delivered_too_often(redis):
+    async def check():
+        await publish(redis, SYMBOLS[:1], 2)
+        first = await fetch_all(StreamSource(redis, consumer_name="a"))
+        # delivered once to a, once more when reclaimed: over max_deliveries=1
+        source = StreamSource(redis, consumer_name="b", claim_idle_ms=0, max_deliveries=1, dead_letter="dead")
+        assert await source.fetch(100) == []
+        dead = await redis.xrange("dead")
+        assert [fields[b"id"] for _, fields in dead] == [message_id[1] for message_id, _ in first]
+        assert [json.loads(fields[b"data"]) for _, fields in dead] == payloads(first)
+        assert sum(shard["pending"] for shard in (await source.lag()).values()) == 0
+
+    run(check())
+
+
+def test_shard_ids_only_read_their_shards(redis):
+    async def check():
+        await publish(redis, SYMBOLS, 2)
+        seen = {}
+        for shard in range(4):
+            messages = await fetch_all(StreamSource(redis, shard_ids=[shard], consumer_name=f"c{shard}"))
+            for message in payloads(messages):
+                assert shard_of(message["symbol"]) == shard
+                seen[message["symbol"]] = seen.get(message["symbol"], 0) + 1
+        assert seen == {symbol: 2 for symbol in SYMBOLS}
+
+    run(check())
+
+
+def test_lag_metrics(redis):
+    async def check():
+        source = StreamSource(redis, shard_ids=[shard_of(SYMBOLS[0])], consumer_name="a")
+        key = source.keys[0]
+        assert await source.lag() == {key: {"lag": 0, "pending": 0, "length": 0}}
+
+        await publish(redis, SYMBOLS[:1], 4)
+        assert await source.lag() == {key: {"lag": 4, "pending": 0, "length": 4}}
+        assert await source.depth() == 4
+
+        messages = await fetch_all(source)
+        assert await source.lag() == {key: {"lag": 0, "pending": 4, "length": 4}}
+        assert await source.depth() == 0
+
+        await source.ack([message_id for message_id, _ in messages[:3]])
+        assert await source.lag() == {key: {"lag": 0, "pending": 1, "length": 4}}
+
+    run(check())
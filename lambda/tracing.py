@@ -0,0 +1,85 @@
+import time
+from collections import deque
+
+import numpy as np
+
+# Configuration
+TRACE_WINDOW = 10_000  # latest samples kept per hop
+PERCENTILES = (50, 90, 99)
+
+# Wall-clock stamps (ms) carried in a message's "trace" dict, in pipeline order:
+#   ingest_ts       orchestrator, when the snapshot was received from Binance
+#   pop_ts          consumer, when the message left lob_queue / the stream
+#   request_start   consumer, backend call sent
+#   server_received backend, request parsed (backend/server.py)
+#   server_sent     backend, response built; "stages" holds its per-stage durations
+#   request_end     consumer, backend response received
+#   push_ts         consumer, result published (predictions:<symbol>)
+#   delivered_ts    reader, result received (optional)
+HOPS = (
+    ("lob_queue", "ingest_ts", "pop_ts"),
+    ("dispatch", "pop_ts", "request_start"),
+    ("backend", "request_start", "request_end"),
+    ("server", "server_received", "server_sent"),
+    ("publish", "request_end", "push_ts"),
+    ("delivery", "push_ts", "delivered_ts"),
+    ("total", "ingest_ts", "push_ts"),
+)
+
+
+def now_ms():
+    return time.time() * 1000
+
+
+def stamp(trace, name):
+    """Set one stamp of a trace to the current wall-clock time, returns the trace"""
+    trace[name] = now_ms()
+    return trace
+
+
+def hop_latencies(trace):
+    """Duration in ms of every hop whose two stamps are in the trace, plus the server stages"""
+    latencies = {}
+    for hop, start, end in HOPS:
+        if trace.get(start) is not None and trace.get(end) is not None:
+            latencies[hop] = trace[end] - trace[start]
+    if "backend" in latencies and "server" in latencies:
+        # Request/response encoding and the loopback hop, clocks of both ends cancel out
+        latencies["transport"] = latencies["backend"] - latencies["server"]
+    for stage, duration in (trace.get("stages") or {}).items():
+        latencies[f"server.{stage}"] = duration
+    return latencies
+
+
+class TraceCollector:
+    """
+    Latest TRACE_WINDOW latencies of every hop, summarized as percentiles.
+    Stamps of different processes are compared across clocks, so the hops between
+    hosts (lob_queue, delivery, total) are only as accurate as their clock sync.
+    """
+
+    def __init__(self, window=TRACE_WINDOW):
+        self.window = window
+        self._samples = {}
+
+    def record(self, trace):
+        for hop, latency in hop_latencies(trace).items():
+            samples = self._samples.get(hop)
+            if samples is None:
+                samples = self._samples[hop] = deque(maxlen=self.window)
+            samples.append(latency)
+
+    def summary(self, percentiles=PERCENTILES):
+        """Per hop: sample count, percentiles and max in ms"""
+        report = {}
+        for hop, samples in self._samples.items():
+            if not samples:
+                continue
+            values = np.fromiter(samples, dtype=np.float64, count=len(samples))
+            report[hop] = {"count": len(values), **{f"p{p}": round(float(v), 2)
+                                                   for p, v in zip(percentiles, np.percentile(values, percentiles))},
+                           "max": round(float(values.max()), 2)}
+        return report
+
+    def reset(self):
+        self._samples.clear()
@@ -0,0 +1,156 @@
+import json
+import struct
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:  # optional, only needed for the msgpack wire format
+    msgpack = None
+
+# Wire formats of lob_queue / predictions:<symbol> messages. Binary messages start with
+# a two byte magic and a version byte, so readers accept every format at once.
+FORMATS = ("json", "struct", "msgpack")
+WIRE_VERSION = 1
+ORDERBOOK_MAGIC = b"LB"  # struct order book
+RESULT_MAGIC = b"LR"  # struct trimmed result
+MSGPACK_MAGIC = b"LM"  # msgpack order book or result
+
+# Order book: magic, version, flags, ingest_ts (ms, -1 = unknown), len(symbol), n_bids, n_asks,
+# then the symbol and float32 [n_bids, 2] bids and [n_asks, 2] asks
+ORDERBOOK_HEADER = struct.Struct("<2sBBqBHH")
+# Result: magic, version, flags, snapshot ts (ms, -1 = unknown), len(symbol), n_models, then the symbol
+# and per model: len(name), n_classes, name, predicted class, float32 [n_classes] probabilities
+RESULT_HEADER = struct.Struct("<2sBBqBB")
+MODEL_HEADER = struct.Struct("<BB")
+
+
+def _require_msgpack():
+    if msgpack is None:
+        raise RuntimeError("the msgpack wire format needs the msgpack package (pip install msgpack)")
+
+
+def _check_version(data):
+    if len(data) < 3 or data[2] != WIRE_VERSION:
+        raise ValueError(f"unsupported wire version {data[2:3]!r}")
+
+
+def encode_orderbook(orderbook_data, fmt="json"):
+    """Serialize a Binance order book message ({"symbol", "ingest_ts", "bids", "asks"})"""
+    if fmt == "json":
+        return json.dumps(orderbook_data)
+    bids = np.asarray(orderbook_data.get("bids", []), dtype=np.float32).reshape(-1, 2)
+    asks = np.asarray(orderbook_data.get("asks", []), dtype=np.float32).reshape(-1, 2)
+    symbol = orderbook_data.get("symbol", "BTCUSDT")
+    ingest_ts = orderbook_data.get("ingest_ts")
+    if fmt == "msgpack":
+        _require_msgpack()
+        body = {"symbol": symbol, "ingest_ts": ingest_ts,
+                "bids": bids.astype("<f4").tobytes(), "asks": asks.astype("<f4").tobytes()}
+        return MSGPACK_MAGIC + bytes([WIRE_VERSION]) + msgpack.packb(body)
+    symbol = symbol.encode()
+    header = ORDERBOOK_HEADER.pack(ORDERBOOK_MAGIC, WIRE_VERSION, 0, -1 if ingest_ts is None else int(ingest_ts),
+                                   len(symbol), len(bids), len(asks))
+    return header + symbol + bids.astype("<f4").tobytes() + asks.astype("<f4").tobytes()
+
+
+def decode_orderbook(data):
+    """
+    Order book message in any wire format as a dict; binary messages carry
+    float32 [levels, 2] arrays as bids/asks instead of string pairs
+    Raises ValueError on malformed messages
+    """
+    if isinstance(data, dict):
+        # Already an order book, from an in-process source (book.py)
+        return data
+    if isinstance(data, str) or data[:1] == b"{":
+        return json.loads(data)
+    magic = bytes(data[:2])
+    if magic == MSGPACK_MAGIC:
+        _check_version(data)
+        _require_msgpack()
+        orderbook = msgpack.unpackb(data[3:])
+        for side in ("bids", "asks"):
+            orderbook[side] = np.frombuffer(orderbook[side], dtype="<f4").reshape(-1, 2)
+        if orderbook.get("ingest_ts") is None:
+            orderbook.pop("ingest_ts", None)
+        return orderbook
+    if magic != ORDERBOOK_MAGIC:
+        raise ValueError(f"unknown order book message magic {magic!r}")
+    _check_version(data)
+    try:
+        _, _, _, ingest_ts, symbol_len, n_bids, n_asks = ORDERBOOK_HEADER.unpack_from(data)
+        offset = ORDERBOOK_HEADER.size
+        symbol = bytes(data[offset:offset + symbol_len]).decode()
+        levels = np.frombuffer(data, dtype="<f4", count=2 * (n_bids + n_asks), offset=offset + symbol_len)
+    except (struct.error, ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"truncated order book message: {e}")
+    orderbook = {"symbol": symbol, "bids": levels[:2 * n_bids].reshape(-1, 2), "asks": levels[2 * n_bids:].reshape(-1, 2)}
+    if ingest_ts >= 0:
+        orderbook["ingest_ts"] = ingest_ts
+    return orderbook
+
+
+def trim_result(result):
+    """
+    The fields live consumers read from a backend response: symbol, snapshot time and,
+    per model, the newest window's predicted class and probabilities (same keys
+    as the full response, so predictions[0] / probabilities[0] keep working),
+    plus the "reused" flag and latency trace when present (json and msgpack only)
+    """
+    summary = result.get("summary", {})
+    end = summary.get("time_range", {}).get("end")
+    trimmed = {"symbol": summary.get("symbol"), "ts": int(end) if end not in (None, "None") else None}
+    for name, output in result.items():
+        if isinstance(output, dict) and "predictions" in output and output["predictions"]:
+            trimmed[name] = {"predictions": output["predictions"][-1:], "probabilities": output["probabilities"][-1:]}
+    for field in ("reused", "trace"):
+        if field in result:
+            trimmed[field] = result[field]
+    return trimmed
+
+
+def encode_result(result, fmt="json", trim=True):
+    """Serialize a backend response for predictions:<symbol>; struct and msgpack are always trimmed"""
+    if fmt == "json":
+        return json.dumps(trim_result(result) if trim else result)
+    trimmed = trim_result(result)
+    if fmt == "msgpack":
+        _require_msgpack()
+        return MSGPACK_MAGIC + bytes([WIRE_VERSION]) + msgpack.packb(trimmed)
+    models = [(name, output) for name, output in trimmed.items() if isinstance(output, dict) and name != "trace"]
+    symbol = (trimmed["symbol"] or "").encode()
+    parts = [RESULT_HEADER.pack(RESULT_MAGIC, WIRE_VERSION, 0, -1 if trimmed["ts"] is None else trimmed["ts"],
+                                len(symbol), len(models)), symbol]
+    for name, output in models:
+        probabilities = np.asarray(output["probabilities"][0], dtype="<f4")
+        parts += [MODEL_HEADER.pack(len(name), len(probabilities)), name.encode(),
+                  bytes([output["predictions"][0]]), probabilities.tobytes()]
+    return b"".join(parts)
+
+
+def decode_result(data):
+    """predictions:<symbol> message in any wire format as a dict"""
+    if isinstance(data, str) or data[:1] == b"{":
+        return json.loads(data)
+    magic = bytes(data[:2])
+    _check_version(data)
+    if magic == MSGPACK_MAGIC:
+        _require_msgpack()
+        return msgpack.unpackb(data[3:])
+    if magic != RESULT_MAGIC:
+        raise ValueError(f"unknown result message magic {magic!r}")
+    _, _, _, ts, symbol_len, n_models = RESULT_HEADER.unpack_from(data)
+    offset = RESULT_HEADER.size
+    result = {"symbol": bytes(data[offset:offset + symbol_len]).decode(), "ts": ts if ts >= 0 else None}
+    offset += symbol_len
+    for _ in range(n_models):
+        name_len, n_classes = MODEL_HEADER.unpack_from(data, offset)
+        offset += MODEL_HEADER.size
+        name = bytes(data[offset:offset + name_len]).decode()
+        prediction = data[offset + name_len]
+        offset += name_len + 1
+        probabilities = np.frombuffer(data, dtype="<f4", count=n_classes, offset=offset)
+        offset += 4 * n_classes
+        result[name] = {"predictions": [int(prediction)], "probabilities": [probabilities.tolist()]}
+    return result
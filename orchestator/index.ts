@@ -1,37 +1,53 @@
 import { redis } from "./redis"
-import { WebSocketServer } from "ws"
+import { WebSocketServer, WebSocket } from "ws"
 import http from "http"
 import express from "express"
-import { setInterval } from "timers"
 import { startPoll } from "./utils"
+import { resultToJson } from "./wire"
+
+const SYMBOLS = ["BTCUSDT"]
 
 const app = express()
 const server = http.createServer(app)
 const wss = new WebSocketServer({ server })
 
-wss.on("connection", ws => {
-    console.log("New WebSocket client connected")
-
-    const i = setInterval(async () => {
-        try {
-            // Listen to results_queue for prediction results from Lambda
-            const msg = await redis.pop("results_queue")
-            if (msg) {
-                console.log("Broadcasting prediction result to client")
-                ws.send(msg)
+// The Lambda consumer publishes every prediction on predictions:<symbol>
+// (consumer.py and main.py), one subscription fans them out to all clients
+redis.pSubscribeBuffer("predictions:*", msg => {
+    try {
+        const json = resultToJson(msg)
+        console.log("Broadcasting prediction result to", wss.clients.size, "client(s)")
+        for (const client of wss.clients) {
+            if (client.readyState === WebSocket.OPEN) {
+                client.send(json)
             }
-        } catch (error) {
-            console.error("Error reading from results_queue:", error)
         }
-    }, 200)
+    } catch (error) {
+        console.error("Error decoding prediction result:", error)
+    }
+}).catch(error => console.error("Error subscribing to predictions:", error))
+
+wss.on("connection", async ws => {
+    console.log("New WebSocket client connected")
 
     ws.on("close", () => {
         console.log("WebSocket client disconnected")
-        clearInterval(i)
     })
+
+    // Late joiners get the newest prediction of every symbol right away
+    for (const symbol of SYMBOLS) {
+        try {
+            const latest = await redis.getBuffer(`latest:${symbol}`)
+            if (latest && ws.readyState === WebSocket.OPEN) {
+                ws.send(resultToJson(latest))
+            }
+        } catch (error) {
+            console.error(`Error reading latest:${symbol}:`, error)
+        }
+    }
 })
 
 server.listen(9000, () => {
     console.log("Server started on port 9000")
-    startPoll("BTCUSDT")
-})
\ No newline at end of file
+    SYMBOLS.forEach(symbol => startPoll(symbol))
+})
@@ -1,8 +1,9 @@
-import { createClient, type RedisClientType } from "redis";
+import { createClient, RESP_TYPES, type RedisClientType } from "redis";
 
 class RedisSingleton {
     private static instance: RedisSingleton;
     private client: RedisClientType;
+    private subscriber?: RedisClientType;
 
     private constructor(url: string) {
         this.client = createClient({ url });
@@ -16,7 +17,7 @@ class RedisSingleton {
         return RedisSingleton.instance;
     }
 
-    async push(queue: string, value: string) {
+    async push(queue: string, value: string | Buffer) {
         return this.client.lPush(queue, value);
     }
 
@@ -24,9 +25,33 @@ class RedisSingleton {
         return this.client.rPop(queue);
     }
 
+    // Raw bytes, for queues that may carry binary wire format messages
+    async popBuffer(queue: string) {
+        return this.client.withTypeMapping({ [RESP_TYPES.BLOB_STRING]: Buffer }).rPop(queue);
+    }
+
+    async getBuffer(key: string) {
+        return this.client.withTypeMapping({ [RESP_TYPES.BLOB_STRING]: Buffer }).get(key);
+    }
+
+    // Subscribed connections cannot run other commands, so subscriptions get their own
+    async pSubscribeBuffer(pattern: string, listener: (message: Buffer, channel: string) => void) {
+        if (!this.subscriber) {
+            this.subscriber = this.client.duplicate();
+            await this.subscriber.connect();
+        }
+        return this.subscriber.pSubscribe(pattern, (message, channel) => listener(message, channel.toString()), true);
+    }
+
     async bpop(queue: string, timeout = 0) {
         return this.client.brPop(queue, timeout);
     }
+
+    async xadd(stream: string, value: string | Buffer, maxLen = 100000) {
+        return this.client.xAdd(stream, "*", { data: value }, {
+            TRIM: { strategy: "MAXLEN", strategyModifier: "~", threshold: maxLen }
+        });
+    }
 }
 
 export const redis = RedisSingleton.getInstance();
@@ -1,4 +1,21 @@
 import { redis } from "./redis"
+import { encodeOrderBook } from "./wire"
+
+// When set, order books go to symbol-sharded Redis streams (lob_stream:<shard>)
+// read by `consumer.py --source stream` instead of the lob_queue list
+const LOB_STREAM_SHARDS = Number(process.env.LOB_STREAM_SHARDS ?? 0)
+// "json" (default) or "struct", the fixed float32 layout of lambda/wire.py
+const LOB_WIRE_FORMAT = process.env.LOB_WIRE_FORMAT ?? "json"
+
+// 32-bit FNV-1a, same as shard_of in lambda/sources.py
+export function shardOf(symbol: string, shards: number) {
+    let h = 0x811c9dc5
+    for (const byte of new TextEncoder().encode(symbol)) {
+        h = Math.imul(h ^ byte, 0x01000193) >>> 0
+    }
+    return h % shards
+}
+
 export async function getOrderBook(symbol: string, limit = 100) {
     const r = await fetch(`https://api.binance.com/api/v3/depth?symbol=${symbol}&limit=${limit}`, {
         method: "GET"
@@ -9,7 +26,16 @@ export async function getOrderBook(symbol: string, limit = 100) {
 
 export async function poll(symbol: string) {
     const data = await getOrderBook(symbol)
-    await redis.push("lob_queue", JSON.stringify(data))
+    // ingest_ts lets the consumer drop snapshots that waited too long in Redis
+    const ingestTs = Date.now()
+    const message = LOB_WIRE_FORMAT === "struct"
+        ? encodeOrderBook(symbol, ingestTs, data.bids, data.asks)
+        : JSON.stringify({ symbol, ingest_ts: ingestTs, ...data })
+    if (LOB_STREAM_SHARDS > 0) {
+        await redis.xadd(`lob_stream:${shardOf(symbol, LOB_STREAM_SHARDS)}`, message)
+    } else {
+        await redis.push("lob_queue", message)
+    }
 }
 
 export async function startPoll(symbol: string) {
@@ -0,0 +1,126 @@
+// Binary wire format of lob_queue / predictions:<symbol> messages, see lambda/wire.py
+const WIRE_VERSION = 1
+const ORDERBOOK_MAGIC = "LB"
+const RESULT_MAGIC = "LR"
+const MSGPACK_MAGIC = "LM"
+
+type Level = [string, string]
+
+// Struct order book: magic, version, flags, ingest_ts (int64 ms), len(symbol), n_bids, n_asks,
+// then the symbol and float32 [n_bids, 2] bids and [n_asks, 2] asks, little-endian
+export function encodeOrderBook(symbol: string, ingestTs: number, bids: Level[], asks: Level[]) {
+    const name = Buffer.from(symbol)
+    const buf = Buffer.alloc(17 + name.length + 8 * (bids.length + asks.length))
+    buf.write(ORDERBOOK_MAGIC, 0, "latin1")
+    buf.writeUInt8(WIRE_VERSION, 2)
+    buf.writeUInt8(0, 3)
+    buf.writeBigInt64LE(BigInt(ingestTs), 4)
+    buf.writeUInt8(name.length, 12)
+    buf.writeUInt16LE(bids.length, 13)
+    buf.writeUInt16LE(asks.length, 15)
+    name.copy(buf, 17)
+    let offset = 17 + name.length
+    for (const [price, qty] of [...bids, ...asks]) {
+        buf.writeFloatLE(Number(price), offset)
+        buf.writeFloatLE(Number(qty), offset + 4)
+        offset += 8
+    }
+    return buf
+}
+
+// Decodes the msgpack value at offset, the types lambda/wire.py results use (no ext types),
+// returns the value and the offset after it
+function unpack(buf: Buffer, offset: number): [unknown, number] {
+    const type = buf.readUInt8(offset++)
+    const array = (length: number, start: number): [unknown, number] => {
+        const items = []
+        for (let i = 0; i < length; i++) {
+            const [item, next] = unpack(buf, start)
+            items.push(item)
+            start = next
+        }
+        return [items, start]
+    }
+    const map = (length: number, start: number): [unknown, number] => {
+        const object: Record<string, unknown> = {}
+        for (let i = 0; i < length; i++) {
+            const [key, afterKey] = unpack(buf, start)
+            const [value, afterValue] = unpack(buf, afterKey)
+            object[String(key)] = value
+            start = afterValue
+        }
+        return [object, start]
+    }
+    const str = (length: number, start: number): [unknown, number] => [buf.toString("utf8", start, start + length), start + length]
+    const bin = (length: number, start: number): [unknown, number] => [buf.subarray(start, start + length), start + length]
+    if (type <= 0x7f) return [type, offset]
+    if (type >= 0xe0) return [type - 0x100, offset]
+    if ((type & 0xf0) === 0x80) return map(type & 0x0f, offset)
+    if ((type & 0xf0) === 0x90) return array(type & 0x0f, offset)
+    if ((type & 0xe0) === 0xa0) return str(type & 0x1f, offset)
+    switch (type) {
+        case 0xc0: return [null, offset]
+        case 0xc2: return [false, offset]
+        case 0xc3: return [true, offset]
+        case 0xc4: return bin(buf.readUInt8(offset), offset + 1)
+        case 0xc5: return bin(buf.readUInt16BE(offset), offset + 2)
+        case 0xc6: return bin(buf.readUInt32BE(offset), offset + 4)
+        case 0xca: return [buf.readFloatBE(offset), offset + 4]
+        case 0xcb: return [buf.readDoubleBE(offset), offset + 8]
+        case 0xcc: return [buf.readUInt8(offset), offset + 1]
+        case 0xcd: return [buf.readUInt16BE(offset), offset + 2]
+        case 0xce: return [buf.readUInt32BE(offset), offset + 4]
+        case 0xcf: return [Number(buf.readBigUInt64BE(offset)), offset + 8]
+        case 0xd0: return [buf.readInt8(offset), offset + 1]
+        case 0xd1: return [buf.readInt16BE(offset), offset + 2]
+        case 0xd2: return [buf.readInt32BE(offset), offset + 4]
+        case 0xd3: return [Number(buf.readBigInt64BE(offset)), offset + 8]
+        case 0xd9: return str(buf.readUInt8(offset), offset + 1)
+        case 0xda: return str(buf.readUInt16BE(offset), offset + 2)
+        case 0xdb: return str(buf.readUInt32BE(offset), offset + 4)
+        case 0xdc: return array(buf.readUInt16BE(offset), offset + 2)
+        case 0xdd: return array(buf.readUInt32BE(offset), offset + 4)
+        case 0xde: return map(buf.readUInt16BE(offset), offset + 2)
+        case 0xdf: return map(buf.readUInt32BE(offset), offset + 4)
+    }
+    throw new Error(`unsupported msgpack type 0x${type.toString(16)}`)
+}
+
+// predictions:<symbol> message as the JSON text sent to WebSocket clients
+export function resultToJson(msg: Buffer) {
+    const magic = msg.toString("latin1", 0, 2)
+    if (magic !== RESULT_MAGIC && magic !== MSGPACK_MAGIC) {
+        return msg.toString("utf8")
+    }
+    if (msg.readUInt8(2) !== WIRE_VERSION) {
+        throw new Error(`unsupported wire version ${msg.readUInt8(2)}`)
+    }
+    if (magic === MSGPACK_MAGIC) {
+        // the same trimmed result as the json format, msgpack encoded
+        return JSON.stringify(unpack(msg, 3)[0])
+    }
+    const ts = Number(msg.readBigInt64LE(4))
+    const symbolLen = msg.readUInt8(12)
+    const numModels = msg.readUInt8(13)
+    let offset = 14
+    const result: Record<string, unknown> = {
+        symbol: msg.toString("utf8", offset, offset + symbolLen),
+        ts: ts >= 0 ? ts : null,
+    }
+    offset += symbolLen
+    for (let m = 0; m < numModels; m++) {
+        const nameLen = msg.readUInt8(offset)
+        const numClasses = msg.readUInt8(offset + 1)
+        const name = msg.toString("utf8", offset + 2, offset + 2 + nameLen)
+        offset += 2 + nameLen
+        const prediction = msg.readUInt8(offset)
+        offset += 1
+        const probabilities = []
+        for (let c = 0; c < numClasses; c++) {
+            probabilities.push(msg.readFloatLE(offset))
+            offset += 4
+        }
+        result[name] = { predictions: [prediction], probabilities: [probabilities] }
+    }
+    return JSON.stringify(result)
+}